@@ -1,30 +1,169 @@
-from django.contrib import admin
-from .models import Request, RequestAttachment, TriageNotesHistory, RequestChangeHistory
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.utils import timezone
+from django.utils.html import format_html
+from .archival import restore_archived_request
+from .events import record_events
+from .profiling import delete_profile_file, profile_report
+from .models import AttachmentText, Department, Request, RequestAttachment, TriageNotesHistory, RequestChangeHistory, RequestHistorySummary, ArchivedRequest, Job, RequestProfile, StageNotification
+from .transitions import bulk_transition
+
+class StageTransitionActionForm(ActionForm):
+    stage = forms.TypedChoiceField(choices=[('', '---------')] + Request.STAGE_CHOICES, coerce=int, required=False)
+    reason = forms.CharField(required=False, widget=forms.TextInput(attrs={'placeholder': 'Reason (required to archive)'}))
+
+@admin.register(Department)
+class DepartmentAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
 
 @admin.register(Request)
 class RequestAdmin(admin.ModelAdmin):
     list_display = ['request_id', 'title', 'department', 'request_type', 'priority', 'stage', 'created_by', 'created_at']
+    list_select_related = ['created_by', 'department']
     list_filter = ['request_type', 'priority', 'stage', 'department', 'created_at']
-    search_fields = ['request_id', 'title', 'description', 'department', 'triage_notes']
+    search_fields = ['request_id', 'title', 'description', 'department__name', 'triage_notes']
     readonly_fields = ['request_id', 'created_at', 'updated_at']
+    autocomplete_fields = ['department']
+    action_form = StageTransitionActionForm
+    actions = ['move_to_stage']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            record_events([obj.id], form.changed_data, request.user)
+
+    @admin.action(description='Move selected requests to stage')
+    def move_to_stage(self, request, queryset):
+        action_form = self.action_form(request.POST)
+        action_form.is_valid()
+        stage = action_form.cleaned_data.get('stage')
+        reason = action_form.cleaned_data.get('reason', '').strip()
+        if not stage:
+            self.message_user(request, 'Choose a stage to move the requests to.', messages.ERROR)
+            return
+        if stage == Request.STAGE_ARCHIVED and not reason:
+            self.message_user(request, 'A reason is required to archive requests.', messages.ERROR)
+            return
+        moved = bulk_transition(list(queryset.values_list('id', flat=True)), stage, request.user, reason=reason or None)
+        self.message_user(request, f"Moved {moved} request(s) to {Request.choice_label('stage', stage)}.")
 
 @admin.register(RequestAttachment)
 class RequestAttachmentAdmin(admin.ModelAdmin):
     list_display = ['request', 'original_filename', 'uploaded_by', 'uploaded_at']
+    list_select_related = ['request', 'uploaded_by']
     list_filter = ['uploaded_at']
     search_fields = ['original_filename', 'request__request_id', 'request__title']
-    readonly_fields = ['uploaded_at']
+    readonly_fields = ['uploaded_at', 'text']
+
+@admin.register(AttachmentText)
+class AttachmentTextAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'extractor', 'created_at']
+    list_filter = ['extractor']
+    search_fields = ['content_hash']
+    readonly_fields = ['content_hash', 'text', 'extractor', 'error', 'created_at']
 
 @admin.register(TriageNotesHistory)
 class TriageNotesHistoryAdmin(admin.ModelAdmin):
     list_display = ['request', 'submitted_by', 'submitted_at']
+    list_select_related = ['request', 'submitted_by']
     list_filter = ['submitted_at']
     search_fields = ['notes', 'request__request_id', 'request__title', 'submitted_by__username']
     readonly_fields = ['submitted_at']
 
 @admin.register(RequestChangeHistory)
 class RequestChangeHistoryAdmin(admin.ModelAdmin):
-    list_display = ['request', 'field_name', 'changed_by', 'changed_at']
-    list_filter = ['field_name', 'changed_at']
-    search_fields = ['field_name', 'old_value', 'new_value', 'request__request_id', 'request__title', 'changed_by__username']
-    readonly_fields = ['changed_at']
+    list_display = ['request', 'field_code', 'changed_by', 'changed_at']
+    list_select_related = ['request', 'changed_by']
+    list_filter = ['field_code', 'changed_at']
+    search_fields = ['request__request_id', 'request__title', 'changed_by__username']
+    readonly_fields = ['field_code', 'old_value', 'new_value', 'changed_at']
+    exclude = ['old_ref', 'new_ref']
+
+@admin.register(RequestHistorySummary)
+class RequestHistorySummaryAdmin(admin.ModelAdmin):
+    list_display = ['request', 'change_count', 'period_start', 'period_end']
+    list_select_related = ['request']
+    search_fields = ['request__request_id', 'request__title']
+    readonly_fields = ['request', 'period_start', 'period_end', 'change_count', 'field_counts', 'created_at']
+
+@admin.register(ArchivedRequest)
+class ArchivedRequestAdmin(admin.ModelAdmin):
+    list_display = ['request_id', 'title', 'department', 'created_by', 'archived_at', 'moved_at']
+    list_select_related = ['created_by']
+    search_fields = ['request_id', 'title', 'department']
+    readonly_fields = ['original_id', 'request_id', 'title', 'department', 'created_by', 'archived_at', 'moved_at', 'payload']
+    actions = ['restore_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Restore selected requests to the active tables')
+    def restore_selected(self, request, queryset):
+        count = 0
+        for archived in queryset:
+            restore_archived_request(archived)
+            count += 1
+        self.message_user(request, f'Restored {count} request(s).')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = [
+        'name', 'payload', 'attempts', 'claimed_by', 'last_error', 'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+    ]
+    actions = ['retry_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_selected(self, request, queryset):
+        count = queryset.exclude(status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_QUEUED, attempts=0, claimed_by='', run_at=timezone.now(), finished_at=None,
+        )
+        self.message_user(request, f'Queued {count} job(s) to run again.')
+
+@admin.register(StageNotification)
+class StageNotificationAdmin(admin.ModelAdmin):
+    list_display = ['request', 'recipient', 'old_stage', 'new_stage', 'created_at', 'sent_at']
+    list_select_related = ['request', 'recipient']
+    list_filter = ['new_stage', 'sent_at']
+    search_fields = ['request__request_id', 'recipient__username', 'recipient__email']
+    readonly_fields = ['recipient', 'request', 'old_stage', 'new_stage', 'changed_by', 'created_at', 'sent_at']
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'view_name', 'method', 'path', 'status_code', 'total_ms', 'db_ms', 'query_count', 'breakdown_summary']
+    list_filter = ['view_name', 'method']
+    search_fields = ['path', 'view_name']
+    fields = ['created_at', 'view_name', 'method', 'path', 'status_code', 'total_ms', 'db_ms', 'query_count', 'breakdown', 'file_name', 'top_functions']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='ORM / template / view / other (ms)')
+    def breakdown_summary(self, obj):
+        return ' / '.join(f"{obj.breakdown.get(bucket, 0):.0f}" for bucket in ('orm', 'template', 'view', 'other'))
+
+    @admin.display(description='Top functions (cumulative)')
+    def top_functions(self, obj):
+        report = profile_report(obj)
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', report) if report else 'Profile file is missing.'
+
+    def delete_queryset(self, request, queryset):
+        # Remove the dump files along with the rows
+        for profile in queryset:
+            delete_profile_file(profile.file_name)
+        super().delete_queryset(request, queryset)
+
+    def delete_model(self, request, obj):
+        delete_profile_file(obj.file_name)
+        super().delete_model(request, obj)
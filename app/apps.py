@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import notifications, signals, tasks  # noqa: F401
+        from .throttling import check_throttle_cache
+        check_throttle_cache()
@@ -0,0 +1,148 @@
+"""Move old archived requests to cold storage (ArchivedRequest) and back."""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .counters import count_actual
+from .models import ArchivedRequest, HistoryValue, Request, RequestChangeHistory
+
+
+def _serialize(request_obj):
+    history = list(request_obj.change_history.all())
+    # The values are stored with the history: rollup_history deletes values no hot row references
+    values = {value.id: value for change in history for value in (change.old_ref, change.new_ref) if value is not None}
+    objects = [
+        request_obj,
+        *values.values(),
+        *history,
+        *request_obj.history_summaries.all(),
+        *request_obj.triage_notes_history.all(),
+        *request_obj.attachments.all(),
+        *request_obj.events.all(),
+        *request_obj.snapshots.all(),
+    ]
+    return json.loads(serializers.serialize('json', objects))
+
+
+def _deserialize(payload):
+    return serializers.deserialize('json', json.dumps(payload))
+
+
+def move_archived_requests(older_than_days=None, batch_size=200, progress=None):
+    """
+    Move archived requests not updated for `older_than_days` days (default
+    settings.ARCHIVE_COLD_AFTER_DAYS) into ArchivedRequest, one batch per transaction.
+
+    `progress`, if given, is called with the running total after each batch.
+    Returns the number of requests moved.
+    """
+    if older_than_days is None:
+        older_than_days = settings.ARCHIVE_COLD_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    moved = 0
+
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Request.objects.filter(stage=Request.STAGE_ARCHIVED, updated_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            batch = Request.objects.filter(id__in=ids).select_related('department').prefetch_related(
+                Prefetch('change_history', RequestChangeHistory.objects.select_related('old_ref', 'new_ref')),
+                'history_summaries', 'triage_notes_history', 'attachments', 'events', 'snapshots',
+            )
+            ArchivedRequest.objects.bulk_create([
+                ArchivedRequest(
+                    original_id=request_obj.id,
+                    request_id=request_obj.request_id,
+                    title=request_obj.title,
+                    department=request_obj.department.name if request_obj.department else '',
+                    created_by_id=request_obj.created_by_id,
+                    archived_at=request_obj.updated_at,
+                    payload=_serialize(request_obj),
+                )
+                for request_obj in batch
+            ])
+            # Cascades to history, summaries, triage notes and attachment rows (files stay on disk)
+            Request.objects.filter(id__in=ids).delete()
+
+        moved += len(ids)
+        if progress:
+            progress(moved)
+
+    return moved
+
+
+def load_archived_request(original_id):
+    """
+    Read-through lookup for a request that has been moved to cold storage.
+
+    Returns a dict of unsaved model instances ('request', 'change_history',
+    'triage_notes_history', 'attachments') or None if there is no such request.
+    """
+    archived = ArchivedRequest.objects.filter(original_id=original_id).first()
+    if archived is None:
+        return None
+
+    result = {'request': None, 'change_history': [], 'triage_notes_history': [], 'attachments': []}
+    keys = {
+        'app.request': 'request',
+        'app.requestchangehistory': 'change_history',
+        'app.triagenoteshistory': 'triage_notes_history',
+        'app.requestattachment': 'attachments',
+    }
+    values = {}
+    for deserialized in _deserialize(archived.payload):
+        obj = deserialized.object
+        if isinstance(obj, HistoryValue):
+            values[obj.id] = obj
+            continue
+        key = keys.get(obj._meta.label_lower)
+        if key is None:
+            continue  # summaries and point-in-time history rows are only needed once restored
+        if key == 'request':
+            result[key] = obj
+        else:
+            result[key].append(obj)
+    # Payloads moved before values were stored with them read the values from the database
+    for change in result['change_history']:
+        if change.old_ref_id in values:
+            change.old_ref = values[change.old_ref_id]
+        if change.new_ref_id in values:
+            change.new_ref = values[change.new_ref_id]
+    return result
+
+
+@transaction.atomic
+def restore_archived_request(archived):
+    """Move one ArchivedRequest back into the hot tables with its original ids."""
+    rows = []
+    payload_values = []
+    for deserialized in _deserialize(archived.payload):
+        if isinstance(deserialized.object, HistoryValue):
+            payload_values.append(deserialized.object)
+        else:
+            rows.append(deserialized)
+    # A stored value may have been deleted since, or interned again under another id:
+    # intern by text and point the history rows at the ids the values have now
+    interned = HistoryValue.intern_many([value.text for value in payload_values])
+    value_ids = {value.id: interned[value.text].id for value in payload_values}
+    for deserialized in rows:
+        if isinstance(deserialized.object, RequestChangeHistory):
+            change = deserialized.object
+            change.old_ref_id = value_ids.get(change.old_ref_id, change.old_ref_id)
+            change.new_ref_id = value_ids.get(change.new_ref_id, change.new_ref_id)
+        deserialized.save()
+    # Touch updated_at so the next mover run does not send it straight back, and recount
+    # the counters since payloads moved before they existed carry none
+    counts = count_actual([archived.original_id])[archived.original_id]
+    Request.objects.filter(id=archived.original_id).update(updated_at=timezone.now(), **counts)
+    archived.delete()
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+from .metrics import CACHE_REQUESTS
+
+USER_CACHE_PREFIX = 'auth_user'
+GROUPS_GENERATION_KEY = 'auth_user:groups_generation'
+
+
+def _user_cache_key(user_id):
+    # Renaming or deleting a Group bumps the generation, orphaning every cached entry at once
+    generation = cache.get_or_set(GROUPS_GENERATION_KEY, 1, None)
+    return f'{USER_CACHE_PREFIX}:{generation}:{user_id}'
+
+
+def invalidate_user(user_id):
+    """Drop the cached user (and group names) for one user id."""
+    cache.delete(_user_cache_key(user_id))
+
+
+def invalidate_all_users():
+    """Invalidate every cached user, e.g. after a Group is renamed or deleted."""
+    try:
+        cache.incr(GROUPS_GENERATION_KEY)
+    except ValueError:
+        cache.set(GROUPS_GENERATION_KEY, 2, None)
+
+
+def get_group_names(user):
+    """
+    Return the set of group names for a user, memoized on the instance.
+
+    Users loaded by CachedModelBackend arrive with the names already attached,
+    so checks like `'Triage Group' in get_group_names(request.user)` cost no query.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, '_group_names'):
+        user._group_names = frozenset(user.groups.values_list('name', flat=True))
+    return user._group_names
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() - called by AuthenticationMiddleware on every
+    request - is served from the cache together with the user's group names.
+
+    Entries are invalidated by the post_save / m2m_changed handlers in
+    app.signals and expire after USER_CACHE_TIMEOUT seconds. Invalidation only
+    reaches every worker through a shared cache, which production requires.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None:
+            # Stop here: ModelBackend, listed after this backend for older sessions,
+            # would only check (and hash) the same password a second time
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = _user_cache_key(user_id)
+        user = cache.get(key)
+        CACHE_REQUESTS.inc(cache='user', result='miss' if user is None else 'hit')
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            get_group_names(user)
+            cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
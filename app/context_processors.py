@@ -0,0 +1,9 @@
+from .backends import get_group_names
+
+
+def user_groups(request):
+    """Expose the current user's group names without a per-render groups query."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'user_group_names': []}
+    return {'user_group_names': sorted(get_group_names(user))}
@@ -0,0 +1,95 @@
+"""Denormalized per-request counters: attachment_count, change_count and triage_note_count."""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Request, RequestAttachment, RequestChangeHistory, RequestHistorySummary, TriageNotesHistory
+
+COUNTER_FIELDS = ['attachment_count', 'change_count', 'triage_note_count']
+
+
+def adjust_counters(request_id, **deltas):
+    """Add `deltas` (e.g. change_count=3, triage_note_count=1) to one request with a single UPDATE."""
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if updates:
+        Request.objects.filter(pk=request_id).update(**updates)
+
+
+def reserve_attachment_slot(request_id, limit):
+    """
+    Count one more attachment on a request unless it already has `limit`.
+
+    The check and the increment are one conditional UPDATE, so concurrent uploads
+    cannot push a request past the limit. Returns False when the request is full.
+    """
+    return bool(
+        Request.objects.filter(pk=request_id, attachment_count__lt=limit)
+        .update(attachment_count=F('attachment_count') + 1)
+    )
+
+
+def _counts_by_request(queryset, request_ids, aggregate):
+    return dict(
+        queryset.filter(request_id__in=request_ids)
+        .values('request_id').annotate(n=aggregate).order_by()
+        .values_list('request_id', 'n')
+    )
+
+
+def count_actual(request_ids):
+    """
+    Recount the counters for `request_ids` from the child tables.
+
+    change_count includes changes already rolled up into RequestHistorySummary rows.
+    Returns {request id: {counter field: value}}.
+    """
+    attachments = _counts_by_request(RequestAttachment.objects, request_ids, Count('id'))
+    changes = _counts_by_request(RequestChangeHistory.objects, request_ids, Count('id'))
+    rolled_up = _counts_by_request(RequestHistorySummary.objects, request_ids, Sum('change_count'))
+    notes = _counts_by_request(TriageNotesHistory.objects, request_ids, Count('id'))
+    return {
+        request_id: {
+            'attachment_count': attachments.get(request_id, 0),
+            'change_count': changes.get(request_id, 0) + (rolled_up.get(request_id) or 0),
+            'triage_note_count': notes.get(request_id, 0),
+        }
+        for request_id in request_ids
+    }
+
+
+def reconcile_counters(batch_size=500, progress=None):
+    """
+    Repair counter drift (e.g. rows deleted through the admin), `batch_size`
+    requests per transaction. Rows in a batch are locked while they are recounted.
+
+    `progress`, if given, is called with (requests checked, requests repaired)
+    after each batch. Returns the number of requests repaired.
+    """
+    checked = 0
+    repaired = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Request.objects.select_for_update()
+                .filter(id__gt=last_id).order_by('id')
+                .only('id', *COUNTER_FIELDS)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            actual = count_actual([request_obj.id for request_obj in batch])
+            drifted = []
+            for request_obj in batch:
+                counts = actual[request_obj.id]
+                if any(getattr(request_obj, field) != counts[field] for field in COUNTER_FIELDS):
+                    for field in COUNTER_FIELDS:
+                        setattr(request_obj, field, counts[field])
+                    drifted.append(request_obj)
+            Request.objects.bulk_update(drifted, COUNTER_FIELDS)
+
+        checked += len(batch)
+        repaired += len(drifted)
+        if progress:
+            progress(checked, repaired)
+
+    return repaired
@@ -0,0 +1,32 @@
+"""Helpers for reading statistics from the database connection pool."""
+from django.db import connections
+
+
+def get_pool(alias='default'):
+    """Return the psycopg pool behind a connection, or None when pooling is off."""
+    return getattr(connections[alias], 'pool', None)
+
+
+def pool_stats(alias='default'):
+    """
+    Return a dict of pool metrics for the given database alias.
+
+    Includes the raw psycopg_pool counters plus two derived values:
+    - checkout_wait_ms_avg: average time a request waited for a connection
+    - saturation: fraction of max_size currently checked out (0.0 - 1.0)
+    Returns None when the alias is not using a pool.
+    """
+    pool = get_pool(alias)
+    if pool is None:
+        return None
+
+    stats = pool.get_stats()
+    requests_num = stats.get('requests_num', 0)
+    in_use = stats.get('pool_size', 0) - stats.get('pool_available', 0)
+    max_size = stats.get('pool_max') or pool.max_size
+
+    stats['checkout_wait_ms_avg'] = (
+        stats.get('requests_wait_ms', 0) / requests_num if requests_num else 0.0
+    )
+    stats['saturation'] = in_use / max_size if max_size else 0.0
+    return stats
@@ -0,0 +1,126 @@
+"""Canonical departments: fuzzy matching of free-text names and the cached list behind autocomplete."""
+import difflib
+import re
+import uuid
+
+from django.core.cache import cache
+
+from .metrics import CACHE_REQUESTS
+
+DEPARTMENTS_GENERATION_KEY = 'departments:generation'
+
+# How close (0-1, difflib ratio of normalized names) a spelling must be to count as the same department
+MATCH_CUTOFF = 0.85
+
+# Words that do not tell departments apart ("Office of the Registrar" == "Registrar")
+STOPWORDS = {'the', 'of', 'office', 'dept', 'department'}
+
+# (generation, [(id, name), ...]) for this process; refreshed when the shared generation changes
+_local_departments = (None, [])
+
+
+def normalize_department(name):
+    """Comparison key for a department name: case, punctuation, '&' and filler words ignored."""
+    words = re.sub(r'[^a-z0-9]+', ' ', name.casefold().replace('&', ' and ')).split()
+    return ' '.join(word for word in words if word not in STOPWORDS) or ' '.join(words)
+
+
+def match_department(name, canonical):
+    """
+    Return the value in `canonical` (a dict of normalize_department(name) -> value)
+    that `name` is a spelling variant of, or None.
+    """
+    key = normalize_department(name)
+    if key in canonical:
+        return canonical[key]
+    close = difflib.get_close_matches(key, list(canonical), n=1, cutoff=MATCH_CUTOFF)
+    return canonical[close[0]] if close else None
+
+
+def canonicalize_departments(name_counts):
+    """
+    Map each free-text name to a canonical department name.
+
+    `name_counts` is an iterable of (name, number of uses). The most used
+    spelling of each department becomes its canonical name, the shortest on ties.
+    """
+    canonical = {}
+    mapping = {}
+    for name, _count in sorted(name_counts, key=lambda item: (-item[1], len(item[0]), item[0])):
+        clean = ' '.join(name.split())
+        if not clean:
+            continue
+        match = match_department(clean, canonical)
+        if match is None:
+            match = canonical[normalize_department(clean)] = clean
+        mapping[name] = match
+    return mapping
+
+
+def invalidate_departments():
+    """Make every process reload its department list on next use."""
+    cache.set(DEPARTMENTS_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def get_departments():
+    """
+    All departments as [(id, name), ...] ordered by name, held in process memory.
+
+    Each call costs one cache lookup for the generation token; the list is only
+    re-read from the database after a Department is saved or deleted.
+    """
+    global _local_departments
+    generation = cache.get_or_set(DEPARTMENTS_GENERATION_KEY, lambda: uuid.uuid4().hex, None)
+    local_generation, departments = _local_departments
+    CACHE_REQUESTS.inc(cache='departments', result='hit' if local_generation == generation else 'miss')
+    if local_generation != generation:
+        from .models import Department
+        departments = list(Department.objects.order_by('name').values_list('id', 'name'))
+        _local_departments = (generation, departments)
+    return departments
+
+
+def search_departments(query, limit=10):
+    """Departments whose name starts with `query`, then those containing it, from the cached list."""
+    needle = ' '.join(query.casefold().split())
+    if not needle:
+        return get_departments()[:limit]
+    prefix = []
+    contains = []
+    for department_id, name in get_departments():
+        folded = name.casefold()
+        if folded.startswith(needle):
+            prefix.append((department_id, name))
+        elif needle in folded:
+            contains.append((department_id, name))
+    return (prefix + contains)[:limit]
+
+
+def resolve_department(name):
+    """
+    The Department for a name typed into a form: an existing department if the
+    name is a spelling variant of one, otherwise an unsaved Department for the
+    caller to create with save_new_department() once its own write succeeded.
+    Never writes to the database.
+    """
+    from .models import Department
+
+    name = ' '.join((name or '').split())
+    if not name:
+        return None
+    match = match_department(name, {
+        normalize_department(existing): (department_id, existing)
+        for department_id, existing in get_departments()
+    })
+    if match is not None:
+        department_id, existing = match
+        return Department(id=department_id, name=existing)
+    return Department(name=name)
+
+
+def save_new_department(department):
+    """Create an unsaved Department from resolve_department(), or return one created meanwhile under its name."""
+    from .models import Department
+
+    department, _created = Department.objects.get_or_create(name=department.name)
+    return department
@@ -0,0 +1,175 @@
+"""
+Near-duplicate request detection with MinHash and locality-sensitive hashing.
+
+A request's title and description are cut into overlapping character shingles
+and summarized by a MinHash signature of NUM_PERMUTATIONS values. The
+signature is split into BANDS bands of ROWS values, and each band is hashed
+into one RequestSimilarityBand row. Two requests whose shingle sets have a
+Jaccard similarity s share at least one band with probability
+1 - (1 - s**ROWS)**BANDS: about 0.99 at s=0.7, 0.64 at s=0.5 and 0.03 at s=0.2.
+
+Finding candidates is therefore one indexed lookup of BANDS bucket values,
+reading at most MAX_BUCKET_ROWS + 1 rows per bucket however many requests there
+are; only the few candidates are then scored exactly. Bands are rewritten
+whenever a request's title or description is saved (app.signals, edit_request)
+and backfilled by the index_duplicates command.
+"""
+import hashlib
+import random
+import re
+import zlib
+
+from collections import Counter
+
+from django.db import connection, transaction
+
+from .models import Request, RequestSimilarityBand
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS
+
+# Only the start of long descriptions is compared; it bounds the cost of a signature
+MAX_CHARS = 2000
+
+# Candidates scored exactly per lookup, and the Jaccard similarity reported as a likely duplicate
+MAX_CANDIDATES = 50
+
+# Rows read per bucket. A bucket holding more requests than this comes from
+# boilerplate shared by many requests (templates, signatures) and is skipped:
+# it says nothing about which of them is a duplicate, and aggregating it would
+# read the whole bucket on every keystroke
+MAX_BUCKET_ROWS = 200
+MIN_SIMILARITY = 0.4
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Fixed seed: signatures must agree across processes and deploys. Changing any
+# constant above means re-running index_duplicates --rebuild.
+_rng = random.Random(20261019)
+PERMUTATIONS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def shingles(title, description):
+    """Hashed SHINGLE_SIZE-character shingles of the normalized title and description."""
+    text = ' '.join(re.findall(r'\w+', f'{title or ""} {description or ""}'.casefold()))[:MAX_CHARS]
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode())} if text else set()
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode()) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def band_buckets(shingle_set):
+    """The BANDS bucket values of a shingle set's MinHash signature; empty for empty text."""
+    if not shingle_set:
+        return []
+    signature = [min((a * value + b) % MERSENNE_PRIME for value in shingle_set) for a, b in PERMUTATIONS]
+    buckets = []
+    for band in range(BANDS):
+        rows = [band] + signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(b''.join(value.to_bytes(8, 'big') for value in rows), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def text_buckets(text):
+    """band_buckets() of a (title, description) pair. Uses no database access, so it can run in a worker process."""
+    return band_buckets(shingles(*text))
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def index_request(request_obj, created=False):
+    """Rewrite the bands of one request, unless its signature is unchanged."""
+    buckets = text_buckets((request_obj.title, request_obj.description))
+    if not created:
+        existing = list(RequestSimilarityBand.objects.filter(request_id=request_obj.id).values_list('bucket', flat=True))
+        if sorted(existing) == sorted(buckets):
+            return
+    # No savepoint: inside edit_request this joins the view's transaction
+    with transaction.atomic(savepoint=False):
+        if not created:
+            RequestSimilarityBand.objects.filter(request_id=request_obj.id).delete()
+        RequestSimilarityBand.objects.bulk_create([
+            RequestSimilarityBand(request_id=request_obj.id, bucket=bucket) for bucket in buckets
+        ])
+
+
+def backfill_duplicate_index(batch_size=1000, map_func=map, rebuild=False, progress=None):
+    """
+    Index every request that has no bands yet (every request with `rebuild`).
+
+    Signatures are computed through `map_func` (e.g. a process pool's map).
+    `progress`, if given, is called with (requests indexed so far, total) after
+    each batch. Returns the number of requests indexed.
+    """
+    if rebuild:
+        RequestSimilarityBand.objects.all().delete()
+    pending = Request.objects.filter(similarity_bands__isnull=True).order_by('id')
+    total = pending.count()
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id).values_list('id', 'title', 'description')[:batch_size])
+        if not batch:
+            return indexed
+        all_buckets = map_func(text_buckets, [(title, description) for _id, title, description in batch])
+        RequestSimilarityBand.objects.bulk_create([
+            RequestSimilarityBand(request_id=request_id, bucket=bucket)
+            for (request_id, _title, _description), buckets in zip(batch, all_buckets) for bucket in buckets
+        ], batch_size=batch_size)
+        indexed += len(batch)
+        last_id = batch[-1][0]
+        if progress:
+            progress(indexed, total)
+
+
+def _bucket_members(buckets, exclude_id=None):
+    """
+    {bucket: [request id, ...]} with at most MAX_BUCKET_ROWS + 1 ids per bucket,
+    in one query: a UNION ALL of one LIMITed index lookup per bucket.
+    """
+    table = connection.ops.quote_name(RequestSimilarityBand._meta.db_table)
+    exclude_sql, exclude_params = (' AND request_id <> %s', [exclude_id]) if exclude_id is not None else ('', [])
+    sql = ' UNION ALL '.join(
+        f'SELECT * FROM (SELECT bucket, request_id FROM {table} WHERE bucket = %s{exclude_sql} LIMIT %s) AS band{n}'
+        for n in range(len(buckets))
+    )
+    params = [param for bucket in buckets for param in (bucket, *exclude_params, MAX_BUCKET_ROWS + 1)]
+    members = {bucket: [] for bucket in buckets}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for bucket, request_id in cursor.fetchall():
+            members[bucket].append(request_id)
+    return members
+
+
+def find_duplicates(title, description, exclude_id=None, limit=5):
+    """
+    Requests whose title and description are likely duplicates of the given text,
+    as [(request, similarity)] with the most similar first. Two queries.
+
+    Buckets with more than MAX_BUCKET_ROWS requests are skipped, so a lookup
+    reads at most BANDS * (MAX_BUCKET_ROWS + 1) band rows.
+    """
+    query_shingles = shingles(title, description)
+    buckets = band_buckets(query_shingles)
+    if not buckets:
+        return []
+    # Requests sharing the most bands are the most similar; only those are scored
+    shared = Counter()
+    for bucket_rows in _bucket_members(buckets, exclude_id).values():
+        if len(bucket_rows) <= MAX_BUCKET_ROWS:
+            shared.update(bucket_rows)
+    candidate_ids = [request_id for request_id, _count in shared.most_common(MAX_CANDIDATES)]
+    scored = []
+    for request_obj in Request.objects.filter(id__in=candidate_ids).only('id', 'request_id', 'title', 'description', 'stage'):
+        similarity = jaccard(query_shingles, shingles(request_obj.title, request_obj.description))
+        if similarity >= MIN_SIMILARITY:
+            scored.append((request_obj, similarity))
+    scored.sort(key=lambda pair: (-pair[1], pair[0].id))
+    return scored[:limit]
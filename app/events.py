@@ -0,0 +1,118 @@
+"""
+Event-sourced request history: complete field values, rebuilt to any point in time.
+
+Every write to a request's tracked fields appends a RequestEvent holding the
+new values in full (raw model values: choice codes, department ids). A
+RequestSnapshot of the complete state is stored when a request is created and
+after every HISTORY_SNAPSHOT_EVERY events, so rebuilding the state at a moment
+costs two queries and replays fewer than HISTORY_SNAPSHOT_EVERY events, however
+long the history is.
+
+RequestChangeHistory is unchanged and still drives the history shown in the
+edit and view modals; these tables answer "what did it look like then?".
+"""
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Department, Request, RequestChangeHistory, RequestEvent, RequestSnapshot
+
+# The Request fields the history tracks (those with a RequestChangeHistory field code)
+TRACKED_FIELDS = list(RequestChangeHistory.FIELD_CODES)
+
+ATTNAMES = {field: Request._meta.get_field(field).attname for field in TRACKED_FIELDS}
+
+
+def request_state(request_obj):
+    """The tracked field values of a Request instance, as stored in snapshots."""
+    return {field: getattr(request_obj, attname) for field, attname in ATTNAMES.items()}
+
+
+def record_creation(request_obj):
+    """Store the initial snapshot of a newly created request."""
+    RequestSnapshot.objects.create(
+        request_id=request_obj.id, sequence=0, taken_at=request_obj.created_at, state=request_state(request_obj),
+    )
+
+
+def record_events(request_ids, fields, changed_by, at=None):
+    """
+    Append one event per request with the current values of `fields`, read back
+    from the database. Call it in the transaction that wrote them, after the
+    write, so values computed in SQL (e.g. appended notes) are stored exactly.
+
+    Takes two queries, plus one INSERT when some request is due a snapshot.
+    """
+    fields = [field for field in fields if field in ATTNAMES]
+    if not request_ids or not fields:
+        return
+    at = at or timezone.now()
+    rows = (
+        Request.objects.filter(id__in=request_ids)
+        .annotate(last_sequence=Subquery(
+            RequestEvent.objects.filter(request_id=OuterRef('pk')).order_by('-sequence').values('sequence')[:1]
+        ))
+        .values('id', 'last_sequence', *ATTNAMES.values())
+    )
+    events = []
+    snapshots = []
+    for row in rows:
+        sequence = (row['last_sequence'] or 0) + 1
+        events.append(RequestEvent(
+            request_id=row['id'], sequence=sequence, occurred_at=at, changed_by=changed_by,
+            changes={field: row[ATTNAMES[field]] for field in fields},
+        ))
+        if sequence % settings.HISTORY_SNAPSHOT_EVERY == 0:
+            snapshots.append(RequestSnapshot(
+                request_id=row['id'], sequence=sequence, taken_at=at,
+                state={field: row[attname] for field, attname in ATTNAMES.items()},
+            ))
+    RequestEvent.objects.bulk_create(events, batch_size=500)
+    if snapshots:
+        RequestSnapshot.objects.bulk_create(snapshots, batch_size=500)
+
+
+def state_as_of(request_id, when):
+    """
+    The tracked field values of a request as they were at `when`, or None if
+    there is no history that far back (before the request existed, or before
+    history was first recorded for it).
+    """
+    snapshot = (
+        RequestSnapshot.objects.filter(request_id=request_id, taken_at__lte=when)
+        .order_by('-sequence').only('sequence', 'state').first()
+    )
+    if snapshot is None:
+        return None
+    state = dict(snapshot.state)
+    # At most HISTORY_SNAPSHOT_EVERY - 1 events: the next snapshot is later than `when`
+    for changes in (
+        RequestEvent.objects.filter(request_id=request_id, sequence__gt=snapshot.sequence, occurred_at__lte=when)
+        .order_by('sequence').values_list('changes', flat=True)
+    ):
+        state.update(changes)
+    return state
+
+
+def display_value(field, value, departments):
+    """A stored value as the UI shows it; `departments` maps department id -> name."""
+    if value is None or value == '':
+        return ''
+    if field == 'department':
+        return departments.get(value, f'#{value}')
+    return str(Request.choice_label(field, value))
+
+
+def diff_states(before, after):
+    """[(field label, old display value, new display value)] for every tracked field that differs."""
+    department_ids = {state['department'] for state in (before, after) if state['department']}
+    departments = dict(Department.objects.filter(id__in=department_ids).values_list('id', 'name')) if department_ids else {}
+    labels = dict(RequestChangeHistory.FIELD_CHOICES)
+    return [
+        (
+            labels[RequestChangeHistory.FIELD_CODES[field]],
+            display_value(field, before.get(field), departments),
+            display_value(field, after.get(field), departments),
+        )
+        for field in TRACKED_FIELDS if before.get(field) != after.get(field)
+    ]
@@ -0,0 +1,198 @@
+"""
+Attachment text extraction and search.
+
+Files are hashed and parsed off the request path (the extract_attachment_text job,
+or the index_attachment_text backfill command). Text is stored once per distinct
+file content in AttachmentText and searched with the database's full-text index.
+"""
+import hashlib
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import AttachmentText, Request, RequestAttachment
+
+try:
+    import pypdf
+except ImportError:  # pypdf is optional; PDFs stay unindexed until it is installed
+    pypdf = None
+
+PLAIN_TEXT_EXTENSIONS = {'.txt', '.csv', '.md'}
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+ATTACHMENT_DIR = 'request_attachments'
+
+
+def hash_file(path):
+    """SHA-256 of a file's content, read in 1MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _plain_text(path):
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('cp1252', errors='replace')
+
+
+def _docx_text(path):
+    # A .docx is a zip; the body text is the w:t runs of word/document.xml, one paragraph per w:p
+    paragraphs = []
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+        for _event, element in ElementTree.iterparse(document):
+            if element.tag == f'{WORD_NAMESPACE}p':
+                paragraphs.append(''.join(
+                    (node.text or '') if node.tag == f'{WORD_NAMESPACE}t' else '\t'
+                    for node in element.iter() if node.tag in (f'{WORD_NAMESPACE}t', f'{WORD_NAMESPACE}tab')
+                ))
+                element.clear()
+    return '\n'.join(paragraphs)
+
+
+def _pdf_text(path):
+    reader = pypdf.PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_file(path):
+    """
+    Extract the text of the file at `path` as (text, extractor, error).
+
+    Unsupported and unreadable files give empty text, so their hash is still
+    cached. Returns None when the format is supported but its parser is not
+    installed, leaving the file to be indexed later. Uses no database access,
+    so it can run in a worker process.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PLAIN_TEXT_EXTENSIONS:
+        extractor, parse = 'text', _plain_text
+    elif extension == '.docx':
+        extractor, parse = 'docx', _docx_text
+    elif extension == '.pdf':
+        if pypdf is None:
+            return None
+        extractor, parse = 'pdf', _pdf_text
+    else:
+        return '', '', ''
+    try:
+        text = parse(path)
+    except Exception as exc:  # corrupt or mislabelled files must not stop the batch
+        return '', '', f'{type(exc).__name__}: {exc}'
+    return text[:settings.ATTACHMENT_TEXT_MAX_CHARS], extractor, ''
+
+
+def index_files(paths_by_attachment, map_func=map):
+    """
+    Link attachments to their AttachmentText, parsing only content not seen before.
+
+    `paths_by_attachment` maps attachment id -> file path. Hashing and parsing go
+    through `map_func` (e.g. a process pool's map). Returns (files parsed,
+    attachments linked to text that was already cached).
+    """
+    attachment_ids = list(paths_by_attachment)
+    hashes = dict(zip(attachment_ids, map_func(hash_file, [paths_by_attachment[i] for i in attachment_ids])))
+    known = dict(AttachmentText.objects.filter(content_hash__in=set(hashes.values())).values_list('content_hash', 'id'))
+
+    # One parse per new content hash, however many attachments share it
+    to_parse = {}
+    for attachment_id, content_hash in hashes.items():
+        if content_hash not in known:
+            to_parse.setdefault(content_hash, paths_by_attachment[attachment_id])
+    parsed = dict(zip(to_parse, map_func(extract_file, list(to_parse.values()))))
+    AttachmentText.objects.bulk_create([
+        AttachmentText(content_hash=content_hash, text=result[0], extractor=result[1], error=result[2])
+        for content_hash, result in parsed.items() if result is not None
+    ], ignore_conflicts=True)
+    if parsed:
+        known.update(AttachmentText.objects.filter(content_hash__in=list(parsed)).values_list('content_hash', 'id'))
+
+    linked = [
+        RequestAttachment(id=attachment_id, text_id=known[content_hash])
+        for attachment_id, content_hash in hashes.items() if content_hash in known
+    ]
+    RequestAttachment.objects.bulk_update(linked, ['text'], batch_size=500)
+    parsed_count = sum(1 for result in parsed.values() if result is not None)
+    return parsed_count, len(linked) - parsed_count
+
+
+def index_attachment(attachment_id):
+    """Extract and link the text of one attachment. Missing attachments or files are skipped."""
+    attachment = RequestAttachment.objects.filter(id=attachment_id, text__isnull=True).first()
+    if attachment is None or not attachment.file.storage.exists(attachment.file.name):
+        return
+    index_files({attachment.id: attachment.file.path})
+
+
+def attachment_files():
+    """Storage names of every file under MEDIA_ROOT/request_attachments, sorted."""
+    root = settings.MEDIA_ROOT
+    names = []
+    for directory, _dirs, files in os.walk(os.path.join(root, ATTACHMENT_DIR)):
+        for filename in files:
+            names.append(os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def backfill_attachment_text(batch_size=200, map_func=map, progress=None):
+    """
+    Index every file in MEDIA_ROOT/request_attachments whose attachment has no text yet.
+
+    `progress`, if given, is called with (files checked, total files, files
+    parsed, attachments served from the cache) after each batch. Files with no
+    attachment row are skipped. Returns the final (parsed, reused) totals.
+    """
+    names = attachment_files()
+    parsed = reused = 0
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        pending = RequestAttachment.objects.filter(file__in=batch, text__isnull=True).values_list('id', 'file')
+        paths = {attachment_id: os.path.join(settings.MEDIA_ROOT, name) for attachment_id, name in pending}
+        if paths:
+            batch_parsed, batch_reused = index_files(paths, map_func)
+            parsed += batch_parsed
+            reused += batch_reused
+        if progress:
+            progress(start + len(batch), len(names), parsed, reused)
+    return parsed, reused
+
+
+def _matching_text_ids(query):
+    """Subquery of AttachmentText ids whose text matches every word of `query`."""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        # Same expression as attachment_text_search_idx, so the GIN index is used
+        return RawSQL(
+            "SELECT id FROM app_attachmenttext WHERE to_tsvector('english', text) @@ plainto_tsquery('english', %s)",
+            [query],
+        )
+    words = re.findall(r'\w+', query)
+    if vendor == 'sqlite':
+        return RawSQL(
+            'SELECT rowid FROM app_attachmenttext_fts WHERE app_attachmenttext_fts MATCH %s',
+            [' '.join('"%s"' % word for word in words)],
+        )
+    matches = AttachmentText.objects.all()
+    for word in words:
+        matches = matches.filter(text__icontains=word)
+    return matches.values('id')
+
+
+def search_requests(query):
+    """Requests with an attachment whose extracted text matches `query`, most recently updated first."""
+    if not re.search(r'\w', query):
+        return Request.objects.none()
+    return Request.objects.filter(
+        id__in=RequestAttachment.objects.filter(text_id__in=_matching_text_ids(query)).values('request_id'),
+    ).order_by('-updated_at')
@@ -1,7 +1,77 @@
 from django import forms
-from .models import Request
+from .departments import get_departments, resolve_department
+from .models import Department, Request
 
-class TriageRequestEditForm(forms.ModelForm):
+class DepartmentField(forms.CharField):
+    """Free-text department input, as before the Department table, resolved to a canonical Department."""
+    
+    def prepare_value(self, value):
+        if isinstance(value, Department):
+            return value.name
+        if isinstance(value, int):
+            return dict(get_departments()).get(value, '')
+        return value or ''
+    
+    def clean(self, value):
+        name = super().clean(value)
+        return resolve_department(name) if name else None
+    
+    def has_changed(self, initial, data):
+        return self.prepare_value(initial) != ' '.join((data or '').split())
+
+DEPARTMENT_WIDGET_ATTRS = {'class': 'form-control', 'autocomplete': 'off', 'data-department-autocomplete': 'true'}
+
+class VersionedRequestForm(forms.ModelForm):
+    """
+    Carries the version the form was rendered at so saves can detect concurrent
+    edits, and each field's value at that version (as hidden initial-* inputs)
+    so a conflict can name the fields someone else changed.
+    """
+    version = forms.IntegerField(widget=forms.HiddenInput, min_value=1)
+    department = DepartmentField(required=False, max_length=200, label='Department',
+                                 widget=forms.TextInput(attrs=DEPARTMENT_WIDGET_ATTRS))
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['version'].initial = self.instance.version
+        for name, field in self.fields.items():
+            field.show_hidden_initial = name != 'version'
+        # Told to the user after saving: how submitted values were interpreted
+        self.notices = []
+    
+    def clean_department(self):
+        department = self.cleaned_data['department']
+        typed = ' '.join(self.data.get(self.add_prefix('department'), '').split())
+        if department is not None and department.pk is not None and department.name != typed:
+            self.notices.append(f'Department "{typed}" was matched to the existing department "{department.name}".')
+        return department
+    
+    def edited_fields(self):
+        """Model fields whose submitted value differs from the instance the form was built on."""
+        # Not changed_data: with hidden initial inputs that compares against the values the form was opened with
+        return [
+            name for name, field in self.fields.items()
+            if name != 'version' and field.has_changed(self[name].initial, self[name].data)
+        ]
+    
+    def changed_since_opened(self, instance):
+        """
+        Fields whose value on `instance` differs from the value the form was
+        rendered with, or None if the client did not send those values.
+        """
+        current = forms.model_to_dict(instance, fields=list(self.fields))
+        changed = []
+        for name, field in self.fields.items():
+            if name == 'version':
+                continue
+            opened = self.data.get(self[name].html_initial_name)
+            if opened is None:
+                return None
+            if field.has_changed(current.get(name), opened):
+                changed.append(name)
+        return changed
+
+class TriageRequestEditForm(VersionedRequestForm):
     """Form for editing triage requests - excludes scoring fields."""
     class Meta:
         model = Request
@@ -17,7 +87,6 @@ class TriageRequestEditForm(forms.ModelForm):
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
-            'department': forms.TextInput(attrs={'class': 'form-control'}),
             'stage': forms.Select(attrs={'class': 'form-control'}),
             'request_type': forms.Select(attrs={'class': 'form-control'}),
             'priority': forms.Select(attrs={'class': 'form-control'}),
@@ -33,7 +102,7 @@ class TriageRequestEditForm(forms.ModelForm):
             'triage_notes': 'Triage Notes',
         }
 
-class RequestEditForm(forms.ModelForm):
+class RequestEditForm(VersionedRequestForm):
     """Full form for editing requests with all fields."""
     class Meta:
         model = Request
@@ -58,7 +127,6 @@ class RequestEditForm(forms.ModelForm):
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
-            'department': forms.TextInput(attrs={'class': 'form-control'}),
             'stage': forms.Select(attrs={'class': 'form-control'}),
             'request_type': forms.Select(attrs={'class': 'form-control'}),
             'priority': forms.Select(attrs={'class': 'form-control'}),
@@ -0,0 +1,119 @@
+"""Retention and storage reporting for RequestChangeHistory."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef
+from django.utils import timezone
+
+from .models import HistoryValue, RequestChangeHistory, RequestHistorySummary
+
+# Bytes per compact history row spent on the field code and the two value references
+COMPACT_ROW_BYTES = 2 + 8 + 8
+
+
+def rollup_history(older_than_days=None, batch_size=200, progress=None):
+    """
+    Replace change history rows older than `older_than_days` (default
+    settings.HISTORY_RETENTION_DAYS) with one RequestHistorySummary per request,
+    processing `batch_size` requests per transaction. Values the deleted rows
+    referenced are deleted too once no remaining row uses them.
+
+    Returns the number of history rows rolled up.
+    """
+    if older_than_days is None:
+        older_than_days = settings.HISTORY_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    labels = dict(RequestChangeHistory.FIELD_CHOICES)
+    rolled_up = 0
+
+    while True:
+        with transaction.atomic():
+            old_rows = RequestChangeHistory.objects.filter(changed_at__lt=cutoff)
+            request_ids = list(
+                old_rows.order_by('request_id').values_list('request_id', flat=True).distinct()[:batch_size]
+            )
+            if not request_ids:
+                break
+
+            summaries = {}
+            for row in (
+                old_rows.filter(request_id__in=request_ids)
+                .values('request_id', 'field_code')
+                .annotate(count=Count('id'), first=Min('changed_at'), last=Max('changed_at'))
+                .order_by()
+            ):
+                summary = summaries.setdefault(row['request_id'], RequestHistorySummary(
+                    request_id=row['request_id'], period_start=row['first'], period_end=row['last'],
+                ))
+                summary.period_start = min(summary.period_start, row['first'])
+                summary.period_end = max(summary.period_end, row['last'])
+                summary.change_count += row['count']
+                label = labels.get(row['field_code'], 'Other')
+                summary.field_counts[label] = summary.field_counts.get(label, 0) + row['count']
+
+            RequestHistorySummary.objects.bulk_create(summaries.values())
+            batch_rows = old_rows.filter(request_id__in=request_ids)
+            value_ids = {
+                value_id for refs in batch_rows.values_list('old_ref_id', 'new_ref_id') for value_id in refs if value_id
+            }
+            deleted, _ = batch_rows.delete()
+            delete_unreferenced_values(value_ids)
+
+        rolled_up += deleted
+        if progress:
+            progress(rolled_up)
+
+    return rolled_up
+
+
+def delete_unreferenced_values(value_ids):
+    """
+    Delete the HistoryValue rows among `value_ids` that no change history row
+    references any more. Returns the number deleted.
+    """
+    value_ids = list(value_ids)
+    deleted = 0
+    for start in range(0, len(value_ids), 500):
+        deleted += HistoryValue.objects.filter(id__in=value_ids[start:start + 500]).exclude(
+            Exists(RequestChangeHistory.objects.filter(old_ref=OuterRef('pk'))),
+        ).exclude(
+            Exists(RequestChangeHistory.objects.filter(new_ref=OuterRef('pk'))),
+        ).delete()[0]
+    return deleted
+
+
+def storage_report(chunk_size=5000):
+    """
+    Compare the bytes the compact layout stores for change history with what the
+    old layout (label plus two text columns per row) would need for the same rows.
+    Per-row overhead shared by both layouts (ids, timestamps, user) is left out.
+    """
+    labels = dict(RequestChangeHistory.FIELD_CHOICES)
+    value_lengths = {}  # value id -> length of the plain text in bytes
+    stored_value_bytes = 0
+    for value in HistoryValue.objects.iterator(chunk_size):
+        data = bytes(value.data)
+        stored_value_bytes += len(data) + len(value.digest)
+        value_lengths[value.id] = len(value.text.encode('utf-8')) if value.compressed else len(data)
+
+    rows = 0
+    legacy_bytes = 0
+    for field_code, old_ref, new_ref in RequestChangeHistory.objects.values_list(
+        'field_code', 'old_ref_id', 'new_ref_id',
+    ).iterator(chunk_size):
+        rows += 1
+        legacy_bytes += len(labels.get(field_code, 'Other'))
+        legacy_bytes += value_lengths.get(old_ref, 0) + value_lengths.get(new_ref, 0)
+
+    compact_bytes = rows * COMPACT_ROW_BYTES + stored_value_bytes
+    return {
+        'rows': rows,
+        'distinct_values': len(value_lengths),
+        'compressed_values': HistoryValue.objects.filter(compressed=True).count(),
+        'legacy_bytes': legacy_bytes,
+        'compact_bytes': compact_bytes,
+        'saved_bytes': legacy_bytes - compact_bytes,
+        'saved_ratio': (legacy_bytes - compact_bytes) / legacy_bytes if legacy_bytes else 0.0,
+        'summaries': RequestHistorySummary.objects.count(),
+    }
@@ -0,0 +1,99 @@
+"""Database instrumentation shared by middleware and tests."""
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryRecorder:
+    """
+    Execute wrapper that counts queries, sums their time and remembers the slowest one.
+
+    Install with connection.execute_wrapper(recorder), or use record_queries() to
+    cover every configured database at once.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_sql = None
+        self.slowest_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed >= self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+    @property
+    def total_time_ms(self):
+        return self.total_time * 1000
+
+    @property
+    def slowest_time_ms(self):
+        return self.slowest_time * 1000
+
+
+@contextmanager
+def record_queries():
+    """Context manager yielding a QueryRecorder installed on all database connections."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def get_query_budget(view_name):
+    """Return the {'queries': ..., 'db_time_ms': ...} budget declared for a view name."""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    budget = dict(budgets.get('default', {}))
+    budget.update(budgets.get(view_name, {}))
+    return budget
+
+
+def check_budget(view_name, recorder):
+    """Return a list of human-readable budget violations (empty when within budget)."""
+    budget = get_query_budget(view_name)
+    violations = []
+    max_queries = budget.get('queries')
+    if max_queries is not None and recorder.count > max_queries:
+        violations.append(f'{recorder.count} queries (budget {max_queries})')
+    max_time = budget.get('db_time_ms')
+    if max_time is not None and recorder.total_time_ms > max_time:
+        violations.append(f'{recorder.total_time_ms:.1f}ms DB time (budget {max_time}ms)')
+    return violations
+
+
+def relation_sizes(table, using='default'):
+    """
+    Return {'table_bytes': ..., 'index_bytes': ...} for a table, or None when the
+    database backend cannot report sizes (PostgreSQL and SQLite with dbstat can).
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_table_size(%s), pg_indexes_size(%s)', [table, table])
+            table_bytes, index_bytes = cursor.fetchone()
+            return {'table_bytes': table_bytes, 'index_bytes': index_bytes}
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s", [table])
+            indexes = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                'SELECT name, SUM(pgsize) FROM dbstat WHERE name IN (%s) GROUP BY name'
+                % ', '.join(['%s'] * (len(indexes) + 1)),
+                [table, *indexes],
+            )
+            sizes = dict(cursor.fetchall())
+            return {
+                'table_bytes': sizes.pop(table, 0),
+                'index_bytes': sum(sizes.values()),
+            }
+    return None
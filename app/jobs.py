@@ -0,0 +1,186 @@
+"""
+Database-backed background jobs, run by the run_jobs management command.
+
+Handlers are plain functions registered with @job('name') and called with the
+job's payload as keyword arguments. Views call enqueue() and return; the row is
+committed with the view's transaction and picked up by a worker.
+"""
+import logging
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('app.jobs')
+
+_handlers = {}
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called `name`."""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, /, delay=None, max_attempts=None, **payload):
+    """Queue job `name` to run with `payload` as keyword arguments, optionally after `delay` seconds."""
+    if name not in _handlers:
+        raise ValueError(f"No job handler registered for {name!r}")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay or 0),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts`: JOBS_BACKOFF_SECONDS doubled per attempt, capped."""
+    return min(settings.JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOBS_BACKOFF_MAX_SECONDS)
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` due jobs as running for this worker and return their ids.
+
+    On PostgreSQL, select_for_update(skip_locked=True) lets concurrent workers
+    claim different rows without waiting on each other. The claim itself is a
+    conditional UPDATE stamped with a fresh token, so a job is never claimed twice
+    even where row locks are not available (SQLite).
+    """
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        candidates = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_QUEUED, run_at__lte=timezone.now())
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not candidates:
+            return []
+        now = timezone.now()
+        Job.objects.filter(id__in=candidates, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING,
+            claimed_by=token,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+    return list(Job.objects.filter(claimed_by=token, status=Job.STATUS_RUNNING).values_list('id', flat=True))
+
+
+class Heartbeat(threading.Thread):
+    """Refresh a running job's heartbeat_at every JOBS_HEARTBEAT_SECONDS until stopped."""
+
+    def __init__(self, job_id, token):
+        super().__init__(daemon=True, name=f'job-heartbeat-{job_id}')
+        self.job_id = job_id
+        self.token = token
+        self.stopped = threading.Event()
+
+    def beat(self):
+        Job.objects.filter(id=self.job_id, claimed_by=self.token, status=Job.STATUS_RUNNING).update(
+            heartbeat_at=timezone.now(),
+        )
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOBS_HEARTBEAT_SECONDS):
+                self.beat()
+        finally:
+            connection.close()  # this thread's own connection
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job_id):
+    """Run one claimed job and record the outcome. Returns True if the handler succeeded."""
+    job_obj = Job.objects.get(id=job_id)
+    # Outcomes are only written while this worker still holds the claim: a job
+    # requeued as stale and claimed again belongs to its new worker
+    claimed = Job.objects.filter(id=job_id, claimed_by=job_obj.claimed_by, status=Job.STATUS_RUNNING)
+    handler = _handlers.get(job_obj.name)
+    heartbeat = Heartbeat(job_id, job_obj.claimed_by)
+    heartbeat.start()
+    error = None
+    try:
+        if handler is None:
+            raise LookupError(f"No job handler registered for {job_obj.name!r}")
+        handler(**job_obj.payload)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        heartbeat.stop()
+
+    if error is None:
+        updated = claimed.update(status=Job.STATUS_DONE, claimed_by='', finished_at=timezone.now())
+    elif job_obj.attempts < job_obj.max_attempts:
+        delay = backoff_seconds(job_obj.attempts)
+        logger.warning('Job %s failed (attempt %s), retrying in %ss', job_obj, job_obj.attempts, delay)
+        updated = claimed.update(
+            status=Job.STATUS_QUEUED, claimed_by='', last_error=error,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+    else:
+        logger.error('Job %s failed permanently after %s attempts', job_obj, job_obj.attempts)
+        updated = claimed.update(
+            status=Job.STATUS_FAILED, claimed_by='', last_error=error, finished_at=timezone.now(),
+        )
+    if not updated:
+        logger.warning('Job %s lost its claim while running; its outcome was discarded', job_obj)
+    return error is None
+
+
+def run_pending_jobs(limit=100):
+    """Claim and run due jobs in this thread until none are left or `limit` have run."""
+    ran = 0
+    while ran < limit:
+        claimed = claim_jobs(min(10, limit - ran))
+        if not claimed:
+            break
+        for job_id in claimed:
+            run_job(job_id)
+        ran += len(claimed)
+    return ran
+
+
+def requeue_stale_jobs():
+    """
+    Deal with running jobs whose worker has sent no heartbeat for
+    JOBS_STALE_AFTER_SECONDS (it died, e.g. killed for running out of memory).
+    They are requeued, or marked failed once they have used all their attempts,
+    so a job that kills its worker is not retried forever.
+
+    Returns (jobs requeued, jobs failed).
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOBS_STALE_AFTER_SECONDS)
+    # Rows claimed before heartbeats existed only have started_at
+    stale = Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.STATUS_RUNNING,
+    )
+    error = f'Worker stopped responding (no heartbeat for {settings.JOBS_STALE_AFTER_SECONDS}s)'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, claimed_by='', last_error=error, finished_at=now,
+    )
+    requeued = stale.update(status=Job.STATUS_QUEUED, claimed_by='', last_error=error, run_at=now)
+    return requeued, failed
+
+
+def purge_finished_jobs():
+    """Delete jobs that finished successfully more than JOBS_KEEP_DONE_DAYS ago."""
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_DONE_DAYS)
+    deleted, _ = Job.objects.filter(status=Job.STATUS_DONE, finished_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,71 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from app.db_pool import pool_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate request/connection lifecycles against the configured database and report latency. '
+        'Run once with DB_POOL=0 DB_CONN_MAX_AGE=0 and once with DB_POOL=1 to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Total simulated requests.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of worker threads.')
+        parser.add_argument('--queries', type=int, default=3, help='Queries issued per simulated request.')
+        parser.add_argument('--database', default='default', help='Database alias to test.')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        concurrency = max(1, options['concurrency'])
+        queries = options['queries']
+        alias = options['database']
+
+        latencies = []
+        lock = threading.Lock()
+        per_thread = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+        def worker(count):
+            local = []
+            for _ in range(count):
+                start = time.perf_counter()
+                # Mirrors Django's request_started/request_finished handling
+                close_old_connections()
+                with connections[alias].cursor() as cursor:
+                    for _ in range(queries):
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                close_old_connections()
+                local.append((time.perf_counter() - start) * 1000)
+            connections[alias].close()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        mode = 'pooled' if connections[alias].settings_dict['OPTIONS'].get('pool') else (
+            f"CONN_MAX_AGE={connections[alias].settings_dict.get('CONN_MAX_AGE')}"
+        )
+        self.stdout.write(f'Mode: {mode}')
+        self.stdout.write(f'Requests: {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)')
+        self.stdout.write(f'Mean: {statistics.fmean(latencies):.2f}ms')
+        for label, pct in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            index = min(len(latencies) - 1, int(len(latencies) * pct))
+            self.stdout.write(f'{label}: {latencies[index]:.2f}ms')
+
+        stats = pool_stats(alias)
+        if stats is not None:
+            self.stdout.write(f"Pool checkout wait (avg): {stats['checkout_wait_ms_avg']:.2f}ms")
+            self.stdout.write(f"Pool saturation: {stats['saturation']:.0%}")
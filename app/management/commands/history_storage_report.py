@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.history import storage_report
+
+
+class Command(BaseCommand):
+    help = 'Report bytes saved by the compact change history layout versus the old text columns.'
+
+    def handle(self, *args, **options):
+        report = storage_report()
+        self.stdout.write(f"History rows:        {report['rows']}")
+        self.stdout.write(f"Distinct values:     {report['distinct_values']} ({report['compressed_values']} compressed)")
+        self.stdout.write(f"Rolled-up summaries: {report['summaries']}")
+        self.stdout.write(f"Old layout:          {report['legacy_bytes']:,} bytes")
+        self.stdout.write(f"Compact layout:      {report['compact_bytes']:,} bytes")
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved:               {report['saved_bytes']:,} bytes ({report['saved_ratio']:.1%})"
+        ))
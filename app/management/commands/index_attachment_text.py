@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.extraction import backfill_attachment_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Extract and index the text of every file in MEDIA_ROOT/request_attachments that has not been '
+        'indexed yet. Files are hashed first, so content that was already parsed is never parsed again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Processes hashing and parsing files (1 = inline).')
+        parser.add_argument('--batch-size', type=int, default=200, help='Files handled per batch.')
+
+    def handle(self, *args, **options):
+        def report(checked, total, parsed, reused):
+            self.stdout.write(f'{checked}/{total} files checked, {parsed} parsed, {reused} reused from cache...')
+
+        if options['workers'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                parsed, reused = backfill_attachment_text(options['batch_size'], pool.map, report)
+        else:
+            parsed, reused = backfill_attachment_text(options['batch_size'], progress=report)
+        self.stdout.write(self.style.SUCCESS(f'Parsed {parsed} file(s); {reused} attachment(s) reused cached text.'))
@@ -0,0 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.duplicates import backfill_duplicate_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the near-duplicate index (MinHash/LSH bands) for requests that have none yet, '
+        'e.g. after a bulk import. Saved requests are indexed automatically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Processes computing signatures (1 = inline).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Requests handled per batch.')
+        parser.add_argument('--rebuild', action='store_true', help='Drop the index and rebuild it for every request.')
+
+    def handle(self, *args, **options):
+        def report(indexed, total):
+            self.stdout.write(f'{indexed}/{total} requests indexed...')
+
+        if options['workers'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                indexed = backfill_duplicate_index(options['batch_size'], pool.map, options['rebuild'], report)
+        else:
+            indexed = backfill_duplicate_index(options['batch_size'], rebuild=options['rebuild'], progress=report)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} request(s).'))
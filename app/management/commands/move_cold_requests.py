@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.archival import move_archived_requests, restore_archived_request
+from app.models import ArchivedRequest
+
+
+class Command(BaseCommand):
+    help = (
+        'Move archived requests older than ARCHIVE_COLD_AFTER_DAYS, with their history and '
+        'attachment metadata, into cold storage. Use --restore to bring requests back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Override ARCHIVE_COLD_AFTER_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Requests moved per transaction.')
+        parser.add_argument('--restore', nargs='+', metavar='REQUEST_ID',
+                            help='Restore these request ids (e.g. 00042) from cold storage instead.')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            for request_id in options['restore']:
+                archived = ArchivedRequest.objects.filter(request_id=request_id).first()
+                if archived is None:
+                    raise CommandError(f'Request {request_id} is not in cold storage.')
+                restore_archived_request(archived)
+                self.stdout.write(f'Restored request {request_id}.')
+            return
+
+        moved = move_archived_requests(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            progress=lambda total: self.stdout.write(f'Moved {total} requests...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} archived requests to cold storage.'))
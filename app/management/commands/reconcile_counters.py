@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount attachment_count, change_count and triage_note_count on every request '
+        'and repair any that have drifted from the child tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Requests checked per transaction.')
+
+    def handle(self, *args, **options):
+        repaired = reconcile_counters(
+            batch_size=options['batch_size'],
+            progress=lambda checked, repaired: self.stdout.write(f'Checked {checked} requests, repaired {repaired}...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters on {repaired} requests.'))
@@ -0,0 +1,44 @@
+import statistics
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from app.instrumentation import record_queries, relation_sizes
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the size of the request table and its indexes, and the database time the '
+        'dashboard spends for a Triage Group Lead. Run against seeded data (see seed_benchmark_data).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Dashboard loads to time.')
+
+    def handle(self, *args, **options):
+        sizes = relation_sizes('app_request')
+        if sizes is None:
+            self.stdout.write('This database backend cannot report table sizes.')
+        else:
+            self.stdout.write(f"app_request table:   {sizes['table_bytes']:,} bytes")
+            self.stdout.write(f"app_request indexes: {sizes['index_bytes']:,} bytes")
+
+        lead = User.objects.filter(groups__name='Triage Group Lead').order_by('id').first()
+        if lead is None:
+            raise CommandError('No Triage Group Lead to load the dashboard as; run seed_benchmark_data first.')
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+        client.force_login(lead)
+        client.get(reverse('index'))  # warm caches
+
+        db_times = []
+        for _ in range(options['iterations']):
+            with record_queries() as recorder:
+                client.get(reverse('index'))
+            db_times.append(recorder.total_time_ms)
+        self.stdout.write(self.style.SUCCESS(
+            f"Dashboard DB time:   median {statistics.median(db_times):.1f}ms, "
+            f"min {min(db_times):.1f}ms over {len(db_times)} loads"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.history import rollup_history
+
+
+class Command(BaseCommand):
+    help = 'Roll change history older than HISTORY_RETENTION_DAYS up into per-request summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Override HISTORY_RETENTION_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Requests processed per transaction.')
+
+    def handle(self, *args, **options):
+        rolled_up = rollup_history(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            progress=lambda total: self.stdout.write(f'Rolled up {total} history rows...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rolled_up} history rows into summaries.'))
@@ -0,0 +1,226 @@
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from app.forms import TriageRequestEditForm
+from app.instrumentation import record_queries
+from app.models import Request
+from app.seeding import SEED_PASSWORD
+
+ENDPOINTS = ['index', 'view_request', 'edit_request_get', 'edit_request_post', 'archive_request', 'upload_attachment', 'login']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the main endpoints concurrently through the test client against the seeded '
+        'dataset (see seed_benchmark_data) and report throughput and p50/p95/p99 per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client threads.')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--prefix', default='bench', help='Username prefix used when seeding.')
+        parser.add_argument('--output-dir', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'results'),
+                            help='Directory to save the JSON results in.')
+        parser.add_argument('--compare', help='Previous results file to compare against.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        lead = User.objects.filter(
+            username__startswith=f"{options['prefix']}_", groups__name='Triage Group Lead',
+        ).first()
+        if lead is None:
+            raise CommandError('No seeded triage lead found. Run seed_benchmark_data first.')
+
+        triage_ids = list(Request.objects.filter(stage__in=Request.TRIAGE_STAGES).values_list('id', flat=True))
+        governance_ids = list(
+            Request.objects.filter(stage=Request.STAGE_UNDER_REVIEW_GOVERNANCE).values_list('id', flat=True)
+        )
+        if len(triage_ids) < 2 or not governance_ids:
+            raise CommandError('Not enough seeded requests in triage and governance stages.')
+
+        # Archiving removes requests from triage, so it gets its own slice of ids
+        rng = random.Random(options['seed'])
+        rng.shuffle(triage_ids)
+        split = len(triage_ids) // 2
+        edit_ids, archive_ids = triage_ids[:split], triage_ids[split:]
+        archive_lock = threading.Lock()
+        edit_payloads = {}
+        for obj in Request.objects.filter(id__in=edit_ids).select_related('department'):
+            # Bound field values are what the browser posts back (e.g. the department name, not its id)
+            form = TriageRequestEditForm(instance=obj)
+            edit_payloads[obj.id] = {field: ('' if form[field].value() is None else form[field].value())
+                                     for field in [*TriageRequestEditForm.Meta.fields, 'version']}
+
+        def next_archive_id():
+            with archive_lock:
+                return archive_ids.pop() if archive_ids else None
+
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+        def run_index(client, rng):
+            return client.get(reverse('index'))
+
+        def run_view_request(client, rng):
+            return client.get(reverse('view_request', args=[rng.choice(governance_ids)]), **ajax)
+
+        def run_edit_get(client, rng):
+            return client.get(reverse('edit_request', args=[rng.choice(edit_ids)]), **ajax)
+
+        def run_edit_post(client, rng):
+            request_id = rng.choice(edit_ids)
+            data = dict(edit_payloads[request_id])
+            data['priority'] = rng.choice([value for value, _ in Request.PRIORITY_CHOICES])
+            data['triage_notes'] = f'Benchmark note {rng.random():.6f}'
+            response = client.post(reverse('edit_request', args=[request_id]), data=data,
+                                   HTTP_X_RESPONSE_MODE='delta', **ajax)
+            # Track the version like the browser does; concurrent edits of one request show up as 409s
+            payload = response.json()
+            version = payload['delta']['fields']['version'] if response.status_code == 200 else payload.get('version')
+            if version:
+                edit_payloads[request_id]['version'] = version
+            return response
+
+        def run_archive(client, rng):
+            request_id = next_archive_id()
+            if request_id is None:
+                return None
+            return client.post(
+                reverse('archive_request', args=[request_id]),
+                data=json.dumps({'reason': 'Benchmark archive'}), content_type='application/json', **ajax,
+            )
+
+        def run_upload(client, rng):
+            upload = SimpleUploadedFile('benchmark.txt', b'benchmark attachment\n' * 512)
+            return client.post(
+                reverse('upload_attachment', args=[rng.choice(edit_ids)]), data={'file': upload}, **ajax,
+            )
+
+        def run_login(client, rng):
+            # A fresh anonymous session each time; run with --concurrency 1 for logins/s per core
+            client.cookies.clear()
+            return client.post(reverse('login'), data={'username': lead.username, 'password': SEED_PASSWORD})
+
+        scenarios = {
+            'index': run_index,
+            'view_request': run_view_request,
+            'edit_request_get': run_edit_get,
+            'edit_request_post': run_edit_post,
+            'archive_request': run_archive,
+            'upload_attachment': run_upload,
+            'login': run_login,
+        }
+
+        results = {}
+        for endpoint in options['endpoints']:
+            results[endpoint] = self.run_endpoint(
+                scenarios[endpoint], lead, options['iterations'], options['concurrency'], options['seed'],
+            )
+            self.report(endpoint, results[endpoint])
+
+        payload = {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connections['default'].vendor,
+            'iterations': options['iterations'],
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_file = output_dir / f"{payload['revision']}-{datetime.now():%Y%m%d-%H%M%S}.json"
+        output_file.write_text(json.dumps(payload, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Saved results to {output_file}'))
+
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text()), payload)
+
+    def run_endpoint(self, scenario, user, iterations, concurrency, seed):
+        samples = []
+        lock = threading.Lock()
+        counts = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+
+        def worker(worker_index, count):
+            client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+            client.force_login(user)
+            rng = random.Random(seed + worker_index)
+            local = []
+            for _ in range(count):
+                with record_queries() as recorder:
+                    start = time.perf_counter()
+                    response = scenario(client, rng)
+                    elapsed = (time.perf_counter() - start) * 1000
+                if response is None:
+                    break
+                local.append((elapsed, recorder.count, response.status_code))
+            connections.close_all()
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(counts) if count]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        latencies = sorted(sample[0] for sample in samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'throughput_rps': len(samples) / wall if wall else 0.0,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'avg_queries': sum(sample[1] for sample in samples) / len(samples) if samples else 0.0,
+        }
+
+    def report(self, endpoint, result):
+        self.stdout.write(
+            f"{endpoint:<20} {result['requests']:>6} req  {result['throughput_rps']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>7.1f}ms  p95 {result['p95_ms']:>7.1f}ms  p99 {result['p99_ms']:>7.1f}ms  "
+            f"{result['avg_queries']:>5.1f} queries  {result['errors']} errors"
+        )
+
+    def compare(self, previous, current):
+        self.stdout.write(f"\nCompared with {previous.get('revision', '?')}:")
+        for endpoint, result in current['results'].items():
+            before = previous.get('results', {}).get(endpoint)
+            if not before:
+                continue
+            deltas = []
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'avg_queries'):
+                if before.get(key):
+                    deltas.append(f'{key} {(result[key] - before[key]) / before[key]:+.1%}')
+            self.stdout.write(f"{endpoint:<20} {'  '.join(deltas)}")
@@ -0,0 +1,88 @@
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from app.jobs import claim_jobs, purge_finished_jobs, requeue_stale_jobs, run_job
+from app.previews import requeue_missing_previews
+
+# Housekeeping (stale requeue, purge of old finished jobs, missing previews) runs this often while polling
+HOUSEKEEPING_INTERVAL = 60
+
+
+def _run_job(job_id):
+    # Each job gets a healthy connection, as a web request would
+    close_old_connections()
+    try:
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def _init_process():
+    # Children start without Django configured (spawn) or with the parent's closed connections (fork)
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs with a pool of worker threads or processes. '
+        'Several copies may run at once; each job is claimed by exactly one worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Jobs run concurrently.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in threads (I/O-bound work) or processes (CPU-bound work).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per poll (default: --workers).')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no due jobs are left.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size'] or workers
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        if options['pool'] == 'process':
+            # Never hand an open database connection to a forked child
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        succeeded = failed = 0
+        last_housekeeping = 0
+        with executor:
+            try:
+                while not self.stopping:
+                    if time.monotonic() - last_housekeeping > HOUSEKEEPING_INTERVAL:
+                        requeued, gave_up = requeue_stale_jobs()
+                        if requeued or gave_up:
+                            self.stdout.write(f'Stale jobs: {requeued} requeued, {gave_up} out of attempts and failed.')
+                        purge_finished_jobs()
+                        requeue_missing_previews()
+                        last_housekeeping = time.monotonic()
+
+                    claimed = claim_jobs(batch_size)
+                    if not claimed:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    for ok in executor.map(_run_job, claimed):
+                        if ok:
+                            succeeded += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded + failed} job(s): {succeeded} succeeded, {failed} failed.'))
+
+    def stop(self, signum, frame):
+        # Finish the jobs already claimed, then exit
+        self.stopping = True
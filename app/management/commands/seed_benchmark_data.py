@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from app.duplicates import backfill_duplicate_index
+from app.seeding import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Create users and requests across every stage with history, triage notes and attachments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Number of users to create.')
+        parser.add_argument('--requests', type=int, default=1000, help='Number of requests to create.')
+        parser.add_argument('--history', type=int, default=4, help='Change history rows per request.')
+        parser.add_argument('--notes', type=int, default=2, help='Triage notes history rows per request.')
+        parser.add_argument('--attachments', type=int, default=1, help='Attachments per request (max 5).')
+        parser.add_argument('--no-files', action='store_true', help='Create attachment rows without writing files.')
+        parser.add_argument('--prefix', default='bench', help='Username prefix for generated users.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        result = seed_dataset(
+            num_users=options['users'],
+            num_requests=options['requests'],
+            history_per_request=options['history'],
+            notes_per_request=options['notes'],
+            attachments_per_request=min(options['attachments'], 5),
+            write_files=not options['no_files'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+        )
+        # bulk_create sends no post_save, so the duplicate index is built here
+        backfill_duplicate_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(result['requests'])} requests and "
+            f"{len(result['leads']) + len(result['triage']) + len(result['end_users'])} users "
+            f"({len(result['leads'])} leads, {len(result['triage'])} triage, {len(result['end_users'])} end users). "
+            f"Password for all generated users: {SEED_PASSWORD}"
+        ))
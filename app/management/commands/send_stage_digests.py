@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.notifications import send_stage_digests
+
+
+class Command(BaseCommand):
+    help = (
+        'Send stage-change digests that are due now, without waiting for the job runner. '
+        'With --flush, every unsent notification is mailed regardless of the digest window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flush', action='store_true', help='Ignore the digest window.')
+
+    def handle(self, *args, **options):
+        recipients = send_stage_digests(flush=options['flush'])
+        self.stdout.write(self.style.SUCCESS(f'Sent digests to {recipients} recipient(s).'))
@@ -0,0 +1,357 @@
+"""
+Prometheus metrics, served in the text exposition format by the `metrics` view.
+
+Counters and histograms are kept in process memory: recording a sample costs
+one uncontended lock and a dict update. With METRICS_DIR set (one directory
+shared by every gunicorn worker), each process also writes its totals to
+METRICS_DIR/<pid>.json at most every METRICS_FLUSH_SECONDS and at exit, and a
+scrape sums the files of all workers. A scrape also folds the files of exited
+workers (recycled by max_requests, say) into one aggregate.json, so counters
+never go backwards and the directory holds one file per live worker plus the
+aggregate; empty it when the service restarts.
+
+Database pool gauges (app_db_pool_*) are sampled from this process's pool at
+each flush, summed over live workers and dropped when a worker exits. Pool
+saturation is app_db_pool_connections{state="in_use"} / app_db_pool_max_connections,
+and the average checkout wait is the rate of app_db_pool_checkout_wait_seconds_total
+over the rate of app_db_pool_checkouts_total.
+
+Business gauges (requests per stage, jobs per status) are read from the
+database at scrape time, so they need no aggregation. Cache hit ratios are
+derived in PromQL from app_cache_requests_total{result="hit"|"miss"}.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+from .db_pool import pool_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024)
+
+REGISTRY = []
+
+# (metric name, sample suffix, label values) -> value, for this process
+_values = defaultdict(float)
+_lock = threading.Lock()
+_last_flush = 0.0
+_claimed_own_file = False
+# Cumulative pool counters at the last sample, so only the increase is added
+_pool_seen = {}
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero rather than double counting its parent's samples
+    global _values, _lock, _last_flush, _claimed_own_file, _pool_seen
+    _values = defaultdict(float)
+    _lock = threading.Lock()
+    _last_flush = 0.0
+    _claimed_own_file = False
+    _pool_seen = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def _label_values(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = (self.name, '', self._label_values(labels))
+        with _lock:
+            _values[key] += amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down. Only live processes' values are reported."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = (self.name, '', self._label_values(labels))
+        with _lock:
+            _values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        label_values = self._label_values(labels)
+        # Buckets are stored per bucket and made cumulative when rendered
+        bucket = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            _values[(self.name, f'_bucket:{bucket}', label_values)] += 1
+            _values[(self.name, '_sum', label_values)] += value
+            _values[(self.name, '_count', label_values)] += 1
+
+
+HTTP_REQUESTS = Counter('app_http_requests_total', 'HTTP requests by view, method and status.', ['view', 'method', 'status'])
+HTTP_LATENCY = Histogram('app_http_request_duration_seconds', 'Time to produce a response, by view.', ['view'])
+DB_QUERIES = Counter('app_db_queries_total', 'Database queries run while handling requests, by view.', ['view'])
+DB_TIME = Counter('app_db_query_seconds_total', 'Time spent in database queries while handling requests, by view.', ['view'])
+TEMPLATE_RENDER = Histogram('app_template_render_duration_seconds', 'Time to render a template, by template name.', ['template'])
+UPLOAD_BYTES = Histogram('app_upload_size_bytes', 'Size of uploaded attachment files, including rejected ones.', buckets=SIZE_BUCKETS)
+UPLOAD_DURATION = Histogram(
+    'app_upload_duration_seconds', 'Time to receive, check and store an attachment upload, by status.', ['status'],
+)
+CACHE_REQUESTS = Counter('app_cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result'])
+DB_POOL_CONNECTIONS = Gauge('app_db_pool_connections', 'Connections open in the database pool, by state (in_use or idle).', ['state'])
+DB_POOL_MAX = Gauge('app_db_pool_max_connections', 'Connections the database pool may open.')
+DB_POOL_WAITING = Gauge('app_db_pool_requests_waiting', 'Requests waiting for a pooled database connection.')
+DB_POOL_CHECKOUTS = Counter('app_db_pool_checkouts_total', 'Connections requested from the database pool.')
+DB_POOL_WAIT = Counter('app_db_pool_checkout_wait_seconds_total', 'Time spent waiting for a pooled database connection.')
+DB_POOL_ERRORS = Counter('app_db_pool_checkout_errors_total', 'Pooled connection requests that timed out or failed.')
+
+
+def sample_pool():
+    """Record pool_stats() of this process's default database pool (no-op without pooling)."""
+    stats = pool_stats()
+    if stats is None:
+        return
+    in_use = stats['pool_size'] - stats['pool_available']
+    DB_POOL_CONNECTIONS.set(in_use, state='in_use')
+    DB_POOL_CONNECTIONS.set(stats['pool_available'], state='idle')
+    DB_POOL_MAX.set(stats['pool_max'])
+    DB_POOL_WAITING.set(stats.get('requests_waiting', 0))
+    for counter, key, scale in (
+        (DB_POOL_CHECKOUTS, 'requests_num', 1),
+        (DB_POOL_WAIT, 'requests_wait_ms', 0.001),
+        (DB_POOL_ERRORS, 'requests_errors', 1),
+    ):
+        value = stats.get(key, 0)
+        seen = _pool_seen.get(key, 0)
+        # A lower value means the pool was recreated and started counting again
+        counter.inc((value - seen if value >= seen else value) * scale)
+        _pool_seen[key] = value
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_RENDER.observe(time.perf_counter() - start, template=self.origin.template_name)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, recording how long each top-level template takes to render."""
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+AGGREGATE_FILE = 'aggregate.json'
+
+
+def _file_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+
+def _read_file(path):
+    try:
+        with open(path) as fh:
+            return [(name, suffix, tuple(label_values), value) for name, suffix, label_values, value in json.load(fh)]
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _write_file(path, rows):
+    # Write then rename, so a scrape never reads a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump([[name, suffix, label_values, value] for name, suffix, label_values, value in rows], fh)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, but owned by another user
+        pass
+    return True
+
+
+@contextmanager
+def _directory_lock():
+    """Serialize merges into the aggregate file across processes."""
+    with open(os.path.join(settings.METRICS_DIR, '.lock'), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _merge_into_aggregate(paths):
+    """
+    Add the totals in `paths` to the aggregate file, then delete them. Gauges
+    are dropped: they described processes that have exited. Call with the
+    directory lock held.
+    """
+    gauges = {metric.name for metric in REGISTRY if metric.kind == 'gauge'}
+    totals = defaultdict(float)
+    for path in [os.path.join(settings.METRICS_DIR, AGGREGATE_FILE)] + paths:
+        for name, suffix, label_values, value in _read_file(path):
+            if name not in gauges:
+                totals[(name, suffix, label_values)] += value
+    _write_file(
+        os.path.join(settings.METRICS_DIR, AGGREGATE_FILE),
+        [(name, suffix, label_values, value) for (name, suffix, label_values), value in totals.items()],
+    )
+    for path in paths:
+        os.unlink(path)
+
+
+def flush():
+    """Write this process's totals to METRICS_DIR (no-op without one)."""
+    global _last_flush, _claimed_own_file
+    if not settings.METRICS_DIR:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = _file_path(os.getpid())
+    if not _claimed_own_file:
+        # A file already under this pid belonged to an exited worker: fold it away before overwriting it
+        with _directory_lock():
+            if os.path.exists(path):
+                _merge_into_aggregate([path])
+        _claimed_own_file = True
+    sample_pool()
+    with _lock:
+        rows = [(name, suffix, label_values, value) for (name, suffix, label_values), value in _values.items()]
+        _last_flush = time.monotonic()
+    _write_file(path, rows)
+
+
+def maybe_flush():
+    """flush() if METRICS_FLUSH_SECONDS have passed since the last one. Called after every request."""
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Current totals of every process, as {(name, suffix, label values): value}."""
+    if not settings.METRICS_DIR:
+        sample_pool()
+        with _lock:
+            return dict(_values)
+    flush()
+    totals = defaultdict(float)
+    with _directory_lock():
+        pid_files = {
+            int(entry.name[:-len('.json')]): entry.path
+            for entry in os.scandir(settings.METRICS_DIR) if re.fullmatch(r'\d+\.json', entry.name)
+        }
+        dead = [path for pid, path in pid_files.items() if not _pid_alive(pid)]
+        if dead:
+            _merge_into_aggregate(dead)
+        paths = [path for path in pid_files.values() if path not in dead]
+        for path in paths + [os.path.join(settings.METRICS_DIR, AGGREGATE_FILE)]:
+            for name, suffix, label_values, value in _read_file(path):
+                totals[(name, suffix, label_values)] += value
+    return dict(totals)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _header(lines, name, documentation, kind):
+    lines.append(f'# HELP {name} {documentation}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def business_gauges():
+    """[(name, documentation, label name, {label value: value})] read from the database."""
+    # Imported here so the template backend above can load before the app registry
+    from .models import Job, Request
+    stage_counts = dict(Request.objects.values_list('stage').annotate(n=Count('id')).order_by())
+    job_counts = dict(Job.objects.values_list('status').annotate(n=Count('id')).order_by())
+    return [
+        ('app_requests', 'Requests currently in each stage.', 'stage',
+         {label: stage_counts.get(stage, 0) for stage, label in Request.STAGE_CHOICES}),
+        ('app_jobs', 'Background jobs in each status.', 'status',
+         {label: job_counts.get(status, 0) for status, label in Job.STATUS_CHOICES}),
+    ]
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    samples = defaultdict(dict)
+    for (name, suffix, label_values), value in collect().items():
+        samples[name][(suffix, label_values)] = value
+
+    lines = []
+    for metric in REGISTRY:
+        _header(lines, metric.name, metric.documentation, metric.kind)
+        values = samples.get(metric.name, {})
+        if metric.kind != 'histogram':
+            for (_suffix, label_values), value in sorted(values.items()):
+                lines.append(f'{metric.name}{_format_labels(metric.labels, label_values)} {_format_value(value)}')
+            continue
+        names = metric.labels + ('le',)
+        for label_values in sorted({label_values for _suffix, label_values in values}):
+            cumulative = 0
+            for index, bound in enumerate(metric.buckets + (float('inf'),)):
+                cumulative += values.get((f'_bucket:{index}', label_values), 0)
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f'{metric.name}_bucket{_format_labels(names, label_values + (le,))} {_format_value(cumulative)}')
+            labels = _format_labels(metric.labels, label_values)
+            lines.append(f'{metric.name}_sum{labels} {_format_value(values[("_sum", label_values)])}')
+            lines.append(f'{metric.name}_count{labels} {_format_value(values[("_count", label_values)])}')
+
+    for name, documentation, label, values in business_gauges():
+        _header(lines, name, documentation, 'gauge')
+        for label_value, value in values.items():
+            lines.append(f'{name}{_format_labels((label,), (label_value,))} {value}')
+    return '\n'.join(lines) + '\n'
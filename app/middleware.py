@@ -0,0 +1,180 @@
+import cProfile
+import logging
+import mimetypes
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+
+from . import metrics
+from .instrumentation import check_budget, record_queries
+from .profiling import save_profile, should_profile
+
+logger = logging.getLogger('app.query_budget')
+
+
+class QueryBudgetMiddleware:
+    """
+    Record query count, total DB time and the slowest SQL for every request,
+    and log a warning when a view exceeds its budget in settings.QUERY_BUDGETS.
+
+    With QUERY_BUDGET_HEADERS enabled the numbers are also returned as
+    X-DB-Query-Count / X-DB-Time-Ms headers, plus X-Query-Budget-Exceeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        violations = check_budget(view_name, recorder) if view_name else []
+
+        if violations:
+            logger.warning(
+                'Query budget exceeded for %s (%s): %s. Slowest query (%.1fms): %s',
+                view_name,
+                request.path,
+                ', '.join(violations),
+                recorder.slowest_time_ms,
+                recorder.slowest_sql,
+            )
+
+        if getattr(settings, 'QUERY_BUDGET_HEADERS', False):
+            response['X-DB-Query-Count'] = str(recorder.count)
+            response['X-DB-Time-Ms'] = f'{recorder.total_time_ms:.1f}'
+            if violations:
+                response['X-Query-Budget-Exceeded'] = '; '.join(violations)
+
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record request count, latency and database work per view for the /metrics
+    endpoint (see app.metrics). Listed right after ProfilingMiddleware, before
+    every other middleware, so the latency covers them too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths share one label, so scanners cannot create unbounded series
+        view_name = match.view_name if match else '<unresolved>'
+        metrics.HTTP_REQUESTS.inc(view=view_name, method=request.method, status=response.status_code)
+        metrics.HTTP_LATENCY.observe(elapsed, view=view_name)
+        metrics.DB_QUERIES.inc(recorder.count, view=view_name)
+        metrics.DB_TIME.inc(recorder.total_time, view=view_name)
+        if view_name == 'upload_attachment':
+            # Timed here, not in the view: CsrfViewMiddleware reads the multipart body before the view runs
+            metrics.UPLOAD_DURATION.observe(elapsed, status=response.status_code)
+        metrics.maybe_flush()
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run selected requests under cProfile and store the result (see app.profiling).
+
+    A request is profiled when it sends the PROFILING_TOKEN in an X-Profile
+    header, or is sampled at PROFILING_SAMPLE_RATE while PROFILING_ENABLED.
+    Profiled responses carry X-Profile-Id. Other requests pay one random() call.
+    Listed first in MIDDLEWARE so storing the profile is outside every budget
+    and never counted in the request metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active in this thread
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            with record_queries() as recorder:
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        total_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            profile = save_profile(profiler, request, response, total_ms, recorder)
+        except Exception:
+            # Profiling must never break the request it observed
+            logger.exception('Could not save profile for %s', request.path)
+        else:
+            response['X-Profile-Id'] = str(profile.id)
+        return response
+
+
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serve files from STATIC_ROOT, preferring the .br/.gz variants written by
+    CompressedManifestStaticFilesStorage when the client accepts them.
+
+    Fingerprinted names (style.<12 hex chars>.css) never change content, so they
+    get far-future immutable cache headers; anything else gets a short max-age.
+    """
+
+    IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_url = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.static_root = settings.STATIC_ROOT
+
+    def __call__(self, request):
+        if self.static_root and request.method in ('GET', 'HEAD') and request.path.startswith(self.static_url):
+            return self.serve(request, request.path[len(self.static_url):])
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.static_root, name)
+        except SuspiciousFileOperation:
+            raise Http404('Invalid static path')
+        if not os.path.isfile(path):
+            raise Http404('Static file not found')
+
+        content_type, _encoding = mimetypes.guess_type(path)
+        accepted = request.headers.get('Accept-Encoding', '')
+        serve_path, content_encoding = path, None
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                serve_path, content_encoding = path + suffix, encoding
+                break
+
+        response = FileResponse(open(serve_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = (
+            self.IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(name) else self.DEFAULT_CACHE_CONTROL
+        )
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_requestchangehistory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(help_text='Primary key the request had in the hot table', unique=True)),
+                ('request_id', models.CharField(max_length=5, unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('department', models.CharField(blank=True, max_length=200)),
+                ('archived_at', models.DateTimeField(help_text='When the request was last updated before being moved')),
+                ('moved_at', models.DateTimeField(auto_now_add=True)),
+                ('payload', models.JSONField(help_text='Serialized request, history and attachment rows')),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='request',
+            name='stage',
+            field=models.CharField(choices=[('Pending Review', 'Pending Review'), ('Under Review - Triage', 'Under Review - Triage'), ('Under Review - Governance', 'Under Review - Governance'), ('Under Review - Final Governance', 'Under Review - Final Governance'), ('Approved', 'Recommended'), ('Rejected', 'Not Recommended'), ('Archived', 'Archived')], default='Pending Review', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['stage', 'updated_at'], name='request_stage_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedrequest',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,192 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:36
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+FIELD_LABELS = {
+    0: 'Other', 1: 'Title', 2: 'Description', 3: 'Department', 4: 'Stage', 5: 'Request Type',
+    6: 'Priority', 7: 'Triage Notes', 8: 'Scoring Notes', 9: 'Final Priority', 10: 'Final Score',
+    11: 'Strategic Alignment', 12: 'Cost Benefit', 13: 'User Impact', 14: 'Ease Of Implementation',
+    15: 'Vendor Reputation Support', 16: 'Security Compliance', 17: 'Student Centered',
+}
+FIELD_CODES = {label.lower().replace(' ', '_'): code for code, label in FIELD_LABELS.items() if code}
+
+
+def code_for(field_name):
+    return FIELD_CODES.get((field_name or '').strip().lower().replace(' ', '_'), 0)
+
+
+def encode(text):
+    raw = text.encode('utf-8')
+    min_bytes = getattr(settings, 'HISTORY_COMPRESS_MIN_BYTES', 256)
+    if min_bytes is not None and len(raw) >= min_bytes:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed, True
+    return raw, False
+
+
+def decode(value):
+    data = bytes(value.data)
+    return (zlib.decompress(data) if value.compressed else data).decode('utf-8')
+
+
+def intern_values(HistoryValue, texts):
+    by_digest = {hashlib.sha1(t.encode('utf-8')).hexdigest(): t for t in set(texts) if t is not None}
+
+    def fetch(digests):
+        for start in range(0, len(digests), 500):
+            for value in HistoryValue.objects.filter(digest__in=digests[start:start + 500]):
+                found[value.digest] = value
+
+    found = {}
+    fetch(list(by_digest))
+    missing = []
+    for digest, text in by_digest.items():
+        if digest not in found:
+            data, compressed = encode(text)
+            missing.append(HistoryValue(digest=digest, data=data, compressed=compressed))
+    if missing:
+        HistoryValue.objects.bulk_create(missing, batch_size=500)
+        fetch([m.digest for m in missing])
+    return {by_digest[digest]: value for digest, value in found.items()}
+
+
+def compact_history(apps, schema_editor):
+    History = apps.get_model('app', 'RequestChangeHistory')
+    HistoryValue = apps.get_model('app', 'HistoryValue')
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+
+    last_id = 0
+    while True:
+        batch = list(History.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        values = intern_values(HistoryValue, [v for row in batch for v in (row.old_value, row.new_value)])
+        for row in batch:
+            row.field_code = code_for(row.field_name)
+            row.old_ref = values.get(row.old_value) if row.old_value is not None else None
+            row.new_ref = values.get(row.new_value) if row.new_value is not None else None
+        History.objects.bulk_update(batch, ['field_code', 'old_ref', 'new_ref'])
+        last_id = batch[-1].id
+
+    # History rows serialized into cold storage use the same layout
+    for archived in ArchivedRequest.objects.iterator(chunk_size=BATCH_SIZE):
+        rows = [row for row in archived.payload if row['model'] == 'app.requestchangehistory']
+        values = intern_values(HistoryValue, [
+            v for row in rows for v in (row['fields'].get('old_value'), row['fields'].get('new_value'))
+        ])
+        for row in rows:
+            fields = row['fields']
+            old_value, new_value = fields.pop('old_value', None), fields.pop('new_value', None)
+            fields['field_code'] = code_for(fields.pop('field_name', ''))
+            fields['old_ref'] = values[old_value].pk if old_value is not None else None
+            fields['new_ref'] = values[new_value].pk if new_value is not None else None
+        if rows:
+            archived.save(update_fields=['payload'])
+
+
+def expand_history(apps, schema_editor):
+    History = apps.get_model('app', 'RequestChangeHistory')
+    HistoryValue = apps.get_model('app', 'HistoryValue')
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+
+    last_id = 0
+    while True:
+        batch = list(
+            History.objects.filter(id__gt=last_id).select_related('old_ref', 'new_ref').order_by('id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for row in batch:
+            row.field_name = FIELD_LABELS.get(row.field_code, 'Other')
+            row.old_value = decode(row.old_ref) if row.old_ref_id else None
+            row.new_value = decode(row.new_ref) if row.new_ref_id else None
+        History.objects.bulk_update(batch, ['field_name', 'old_value', 'new_value'])
+        last_id = batch[-1].id
+
+    for archived in ArchivedRequest.objects.iterator(chunk_size=BATCH_SIZE):
+        rows = [row for row in archived.payload if row['model'] == 'app.requestchangehistory']
+        for row in rows:
+            fields = row['fields']
+            old_ref, new_ref = fields.pop('old_ref', None), fields.pop('new_ref', None)
+            fields['field_name'] = FIELD_LABELS.get(fields.pop('field_code', 0), 'Other')
+            fields['old_value'] = decode(HistoryValue.objects.get(pk=old_ref)) if old_ref else None
+            fields['new_value'] = decode(HistoryValue.objects.get(pk=new_ref)) if new_ref else None
+        if rows:
+            archived.save(update_fields=['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_archivedrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-1 of the value text', max_length=40, unique=True)),
+                ('data', models.BinaryField()),
+                ('compressed', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='requestchangehistory',
+            name='field_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Other'), (1, 'Title'), (2, 'Description'), (3, 'Department'), (4, 'Stage'), (5, 'Request Type'), (6, 'Priority'), (7, 'Triage Notes'), (8, 'Scoring Notes'), (9, 'Final Priority'), (10, 'Final Score'), (11, 'Strategic Alignment'), (12, 'Cost Benefit'), (13, 'User Impact'), (14, 'Ease Of Implementation'), (15, 'Vendor Reputation Support'), (16, 'Security Compliance'), (17, 'Student Centered')], default=0, help_text='Field that was changed'),
+        ),
+        migrations.AddField(
+            model_name='requestchangehistory',
+            name='new_ref',
+            field=models.ForeignKey(blank=True, help_text='New value', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='app.historyvalue'),
+        ),
+        migrations.AddField(
+            model_name='requestchangehistory',
+            name='old_ref',
+            field=models.ForeignKey(blank=True, help_text='Previous value', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='app.historyvalue'),
+        ),
+        migrations.RunPython(compact_history, expand_history),
+        # A default lets the column be re-added to existing rows when unapplying
+        migrations.AlterField(
+            model_name='requestchangehistory',
+            name='field_name',
+            field=models.CharField(default='', help_text='Name of the field that was changed', max_length=100),
+        ),
+        migrations.RemoveField(
+            model_name='requestchangehistory',
+            name='field_name',
+        ),
+        migrations.RemoveField(
+            model_name='requestchangehistory',
+            name='new_value',
+        ),
+        migrations.RemoveField(
+            model_name='requestchangehistory',
+            name='old_value',
+        ),
+        migrations.CreateModel(
+            name='RequestHistorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('field_counts', models.JSONField(default=dict, help_text='Number of changes per field label')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_summaries', to='app.request')),
+            ],
+            options={
+                'verbose_name_plural': 'Request History Summaries',
+                'ordering': ['-period_end'],
+            },
+        ),
+    ]
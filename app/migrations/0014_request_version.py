@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_compact_change_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Bumped on every write; used for optimistic locking'),
+        ),
+    ]
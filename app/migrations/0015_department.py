@@ -0,0 +1,138 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:50
+
+import difflib
+import re
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+# Frozen copy of app.departments as of this migration, so later changes to
+# the live matching rules do not change what this backfill does
+MATCH_CUTOFF = 0.85
+STOPWORDS = {'the', 'of', 'office', 'dept', 'department'}
+
+
+def normalize_department(name):
+    words = re.sub(r'[^a-z0-9]+', ' ', name.casefold().replace('&', ' and ')).split()
+    return ' '.join(word for word in words if word not in STOPWORDS) or ' '.join(words)
+
+
+def match_department(name, canonical):
+    key = normalize_department(name)
+    if key in canonical:
+        return canonical[key]
+    close = difflib.get_close_matches(key, list(canonical), n=1, cutoff=MATCH_CUTOFF)
+    return canonical[close[0]] if close else None
+
+
+def canonicalize_departments(name_counts):
+    """Map each free-text name to the most used (then shortest) spelling of its department."""
+    canonical = {}
+    mapping = {}
+    for name, _count in sorted(name_counts, key=lambda item: (-item[1], len(item[0]), item[0])):
+        clean = ' '.join(name.split())
+        if not clean:
+            continue
+        match = match_department(clean, canonical)
+        if match is None:
+            match = canonical[normalize_department(clean)] = clean
+        mapping[name] = match
+    return mapping
+
+
+def _archived_requests(ArchivedRequest):
+    """(archived row, serialized Request dict) for every cold-storage payload."""
+    for archived in ArchivedRequest.objects.iterator(chunk_size=BATCH_SIZE):
+        for obj in archived.payload:
+            if obj['model'] == 'app.request':
+                yield archived, obj
+
+
+def backfill_departments(apps, schema_editor):
+    Request = apps.get_model('app', 'Request')
+    Department = apps.get_model('app', 'Department')
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+
+    # Canonical names from every spelling in use, hot and cold
+    counts = Counter(dict(
+        Request.objects.values_list('department_name').annotate(n=Count('id')).order_by()
+    ))
+    for _archived, obj in _archived_requests(ArchivedRequest):
+        counts[obj['fields'].get('department') or ''] += 1
+    mapping = canonicalize_departments(counts.items())
+    Department.objects.bulk_create([Department(name=name) for name in sorted(set(mapping.values()))])
+    department_ids = dict(Department.objects.values_list('name', 'id'))
+
+    # One UPDATE per department per batch of requests
+    last_id = 0
+    while True:
+        batch = list(
+            Request.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'department_name')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        by_department = defaultdict(list)
+        for request_id, name in batch:
+            if name in mapping:
+                by_department[department_ids[mapping[name]]].append(request_id)
+        for department_id, request_ids in by_department.items():
+            Request.objects.filter(id__in=request_ids).update(department_id=department_id)
+
+    for archived, obj in _archived_requests(ArchivedRequest):
+        name = mapping.get(obj['fields'].get('department') or '')
+        obj['fields']['department'] = department_ids[name] if name else None
+        archived.save(update_fields=['payload'])
+
+
+def restore_department_names(apps, schema_editor):
+    Request = apps.get_model('app', 'Request')
+    Department = apps.get_model('app', 'Department')
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+
+    for department in Department.objects.iterator():
+        Request.objects.filter(department_id=department.id).update(department_name=department.name)
+
+    names = dict(Department.objects.values_list('id', 'name'))
+    for archived, obj in _archived_requests(ArchivedRequest):
+        obj['fields']['department'] = names.get(obj['fields'].get('department'), '')
+        archived.save(update_fields=['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_request_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Department',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RenameField(
+            model_name='request',
+            old_name='department',
+            new_name='department_name',
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='requests', to='app.department'),
+        ),
+        migrations.RunPython(backfill_departments, restore_department_names),
+        migrations.RemoveField(
+            model_name='request',
+            name='department_name',
+        ),
+    ]
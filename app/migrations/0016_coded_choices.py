@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.db import migrations, models
+from django.db.models import Case, Max, Min, Value, When
+
+BATCH_SIZE = 5000
+
+# Stored string -> integer code, frozen as of this migration
+CODES = {
+    'stage': {
+        'Pending Review': 1,
+        'Under Review - Triage': 2,
+        'Under Review - Governance': 3,
+        'Under Review - Final Governance': 4,
+        'Approved': 5,
+        'Rejected': 6,
+        'Archived': 7,
+    },
+    'request_type': {
+        'Not Yet Decided': 1,
+        'Process Improvement': 2,
+        'IT Governance': 3,
+        'AI Governance': 4,
+        'ERP Governance': 5,
+    },
+    'priority': {
+        'Low': 1,
+        'Normal': 2,
+        'High': 3,
+        'Top': 4,
+    },
+}
+
+# Unknown values fall back to the field default
+DEFAULTS = {'stage': 'Pending Review', 'request_type': 'Not Yet Decided', 'priority': 'Normal'}
+CODE_DEFAULTS = {field: CODES[field][text] for field, text in DEFAULTS.items()}
+TEXTS = {field: {code: text for text, code in codes.items()} for field, codes in CODES.items()}
+
+
+def _convert(apps, source_suffix, target_suffix, mappings, defaults):
+    """Rewrite every request in id-range batches with one UPDATE of three CASE expressions."""
+    Request = apps.get_model('app', 'Request')
+    bounds = Request.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is not None:
+        updates = {
+            f'{field}{target_suffix}': Case(
+                *[When(**{f'{field}{source_suffix}': old}, then=Value(new)) for old, new in mapping.items()],
+                default=Value(defaults[field]),
+            )
+            for field, mapping in mappings.items()
+        }
+        for low in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+            Request.objects.filter(id__gte=low, id__lt=low + BATCH_SIZE).update(**updates)
+
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+    for archived in ArchivedRequest.objects.iterator(chunk_size=BATCH_SIZE):
+        for obj in archived.payload:
+            if obj['model'] == 'app.request':
+                for field, mapping in mappings.items():
+                    obj['fields'][field] = mapping.get(obj['fields'].get(field), defaults[field])
+        archived.save(update_fields=['payload'])
+
+
+def encode_choices(apps, schema_editor):
+    _convert(apps, '_text', '', CODES, CODE_DEFAULTS)
+
+
+def decode_choices(apps, schema_editor):
+    _convert(apps, '', '_text', TEXTS, DEFAULTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_department'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='request',
+            name='request_stage_updated_idx',
+        ),
+        migrations.RenameField(model_name='request', old_name='stage', new_name='stage_text'),
+        migrations.RenameField(model_name='request', old_name='request_type', new_name='request_type_text'),
+        migrations.RenameField(model_name='request', old_name='priority', new_name='priority_text'),
+        migrations.AddField(
+            model_name='request',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Low'), (2, 'Normal'), (3, 'High'), (4, 'Top')], default=2),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='request_type',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Not Yet Decided'), (2, 'Process Improvement'), (3, 'IT Governance'), (4, 'AI Governance'), (5, 'ERP Governance')], default=1),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='stage',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending Review'), (2, 'Under Review - Triage'), (3, 'Under Review - Governance'), (4, 'Under Review - Final Governance'), (5, 'Recommended'), (6, 'Not Recommended'), (7, 'Archived')], default=1),
+        ),
+        migrations.RunPython(encode_choices, decode_choices),
+        migrations.RemoveField(model_name='request', name='stage_text'),
+        migrations.RemoveField(model_name='request', name='request_type_text'),
+        migrations.RemoveField(model_name='request', name='priority_text'),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['stage', 'updated_at'], name='request_stage_updated_idx'),
+        ),
+    ]
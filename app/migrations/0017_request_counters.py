@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def _child_count(model, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(request_id=OuterRef('pk'))
+            .values('request_id').annotate(n=aggregate).values('n'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    Request = apps.get_model('app', 'Request')
+    RequestAttachment = apps.get_model('app', 'RequestAttachment')
+    RequestChangeHistory = apps.get_model('app', 'RequestChangeHistory')
+    RequestHistorySummary = apps.get_model('app', 'RequestHistorySummary')
+    TriageNotesHistory = apps.get_model('app', 'TriageNotesHistory')
+
+    bounds = Request.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    # One UPDATE with correlated counts per batch of ids
+    for low in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+        Request.objects.filter(id__gte=low, id__lt=low + BATCH_SIZE).update(
+            attachment_count=_child_count(RequestAttachment, Count('id')),
+            change_count=(
+                _child_count(RequestChangeHistory, Count('id'))
+                + _child_count(RequestHistorySummary, Sum('change_count'))
+            ),
+            triage_note_count=_child_count(TriageNotesHistory, Count('id')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_coded_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='attachment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='change_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='triage_note_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
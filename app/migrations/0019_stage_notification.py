@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_stage', models.PositiveSmallIntegerField(choices=[(1, 'Pending Review'), (2, 'Under Review - Triage'), (3, 'Under Review - Governance'), (4, 'Under Review - Final Governance'), (5, 'Recommended'), (6, 'Not Recommended'), (7, 'Archived')])),
+                ('new_stage', models.PositiveSmallIntegerField(choices=[(1, 'Pending Review'), (2, 'Under Review - Triage'), (3, 'Under Review - Governance'), (4, 'Under Review - Final Governance'), (5, 'Recommended'), (6, 'Not Recommended'), (7, 'Archived')])),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_notifications', to=settings.AUTH_USER_MODEL)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_notifications', to='app.request')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['sent_at', 'recipient', 'created_at'], name='stage_notification_unsent_idx')],
+            },
+        ),
+    ]
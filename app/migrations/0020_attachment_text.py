@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Full-text index over AttachmentText.text. PostgreSQL indexes the tsvector
+# expression that app.extraction.search_requests queries; SQLite keeps an
+# external-content FTS5 table in step with the table through triggers.
+POSTGRES_INDEX = [
+    "CREATE INDEX attachment_text_search_idx ON app_attachmenttext USING gin (to_tsvector('english', text))",
+]
+POSTGRES_DROP = ['DROP INDEX IF EXISTS attachment_text_search_idx']
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE app_attachmenttext_fts USING fts5("
+    "text, content='app_attachmenttext', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER app_attachmenttext_fts_insert AFTER INSERT ON app_attachmenttext BEGIN "
+    "INSERT INTO app_attachmenttext_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER app_attachmenttext_fts_delete AFTER DELETE ON app_attachmenttext BEGIN "
+    "INSERT INTO app_attachmenttext_fts(app_attachmenttext_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER app_attachmenttext_fts_update AFTER UPDATE OF text ON app_attachmenttext BEGIN "
+    "INSERT INTO app_attachmenttext_fts(app_attachmenttext_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO app_attachmenttext_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS app_attachmenttext_fts_insert',
+    'DROP TRIGGER IF EXISTS app_attachmenttext_fts_delete',
+    'DROP TRIGGER IF EXISTS app_attachmenttext_fts_update',
+    'DROP TABLE IF EXISTS app_attachmenttext_fts',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_INDEX, 'sqlite': SQLITE_INDEX})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_DROP, 'sqlite': SQLITE_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_stage_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField(blank=True)),
+                ('extractor', models.CharField(blank=True, help_text='Format the text was extracted as; empty if unsupported', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='requestattachment',
+            name='text',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attachments', to='app.attachmenttext'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
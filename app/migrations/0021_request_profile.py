@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_attachment_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('total_ms', models.FloatField()),
+                ('db_ms', models.FloatField(help_text='Time spent executing SQL')),
+                ('query_count', models.PositiveIntegerField()),
+                ('breakdown', models.JSONField(default=dict, help_text='Profiled time (ms) by orm, template, view and other code')),
+                ('file_name', models.CharField(max_length=200)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Tracked Request fields when this migration was written (app.events.TRACKED_FIELDS)
+TRACKED_FIELDS = [
+    'title', 'description', 'department', 'stage', 'request_type', 'priority', 'triage_notes',
+    'scoring_notes', 'final_priority', 'final_score', 'strategic_alignment', 'cost_benefit', 'user_impact',
+    'ease_of_implementation', 'vendor_reputation_support', 'security_compliance', 'student_centered',
+]
+
+
+def create_baseline_snapshots(apps, schema_editor):
+    # History starts now: each existing request gets its current state as snapshot 0
+    Request = apps.get_model('app', 'Request')
+    RequestSnapshot = apps.get_model('app', 'RequestSnapshot')
+    attnames = {field: Request._meta.get_field(field).attname for field in TRACKED_FIELDS}
+    now = timezone.now()
+    batch = []
+    for row in Request.objects.values('id', *attnames.values()).iterator(chunk_size=2000):
+        batch.append(RequestSnapshot(
+            request_id=row['id'], sequence=0, taken_at=now,
+            state={field: row[attname] for field, attname in attnames.items()},
+        ))
+        if len(batch) >= 2000:
+            RequestSnapshot.objects.bulk_create(batch)
+            batch = []
+    RequestSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_request_similarity_band'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('occurred_at', models.DateTimeField()),
+                ('changes', models.JSONField(help_text='New value of each changed field, as stored on the request')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='app.request')),
+            ],
+            options={
+                'ordering': ['request', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('request', 'sequence'), name='request_event_sequence_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('state', models.JSONField()),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='app.request')),
+            ],
+            options={
+                'ordering': ['request', 'sequence'],
+                'indexes': [models.Index(fields=['request', 'taken_at'], name='request_snapshot_taken_idx')],
+                'constraints': [models.UniqueConstraint(fields=('request', 'sequence'), name='request_snapshot_sequence_unique')],
+            },
+        ),
+        migrations.RunPython(create_baseline_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+import base64
+
+from django.db import migrations
+
+
+def store_history_values(apps, schema_editor):
+    # Cold payloads used to hold only the ids of their history values; copy the
+    # values in, since rollup_history now deletes values no hot row references
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+    HistoryValue = apps.get_model('app', 'HistoryValue')
+    for archived in ArchivedRequest.objects.iterator(chunk_size=200):
+        payload = archived.payload
+        if any(entry['model'] == 'app.historyvalue' for entry in payload):
+            continue
+        value_ids = {
+            entry['fields'][ref]
+            for entry in payload if entry['model'] == 'app.requestchangehistory'
+            for ref in ('old_ref', 'new_ref') if entry['fields'].get(ref)
+        }
+        if not value_ids:
+            continue
+        values = [
+            {
+                'model': 'app.historyvalue',
+                'pk': value.id,
+                'fields': {
+                    'digest': value.digest,
+                    'data': base64.b64encode(bytes(value.data)).decode('ascii'),
+                    'compressed': value.compressed,
+                },
+            }
+            for value in HistoryValue.objects.filter(id__in=value_ids)
+        ]
+        # After the request entry, before the history rows that reference them
+        archived.payload = payload[:1] + values + payload[1:]
+        archived.save(update_fields=['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(store_history_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Tracked Request fields when this migration was written (app.events.TRACKED_FIELDS)
+TRACKED_FIELDS = [
+    'title', 'description', 'department', 'stage', 'request_type', 'priority', 'triage_notes',
+    'scoring_notes', 'final_priority', 'final_score', 'strategic_alignment', 'cost_benefit', 'user_impact',
+    'ease_of_implementation', 'vendor_reputation_support', 'security_compliance', 'student_centered',
+]
+
+
+def add_baseline_snapshots(apps, schema_editor):
+    # 0023 only covered the hot requests existing then: requests bulk-created by
+    # seed_dataset since, and requests already in cold storage, have no snapshot.
+    # Their current state has held since they were last updated, so it is the baseline from then
+    Request = apps.get_model('app', 'Request')
+    RequestSnapshot = apps.get_model('app', 'RequestSnapshot')
+    attnames = {field: Request._meta.get_field(field).attname for field in TRACKED_FIELDS}
+    batch = []
+    for row in Request.objects.filter(snapshots__isnull=True).values('id', 'updated_at', *attnames.values()).iterator(chunk_size=2000):
+        batch.append(RequestSnapshot(
+            request_id=row['id'], sequence=0, taken_at=row['updated_at'],
+            state={field: row[attname] for field, attname in attnames.items()},
+        ))
+        if len(batch) >= 2000:
+            RequestSnapshot.objects.bulk_create(batch)
+            batch = []
+    RequestSnapshot.objects.bulk_create(batch)
+
+    ArchivedRequest = apps.get_model('app', 'ArchivedRequest')
+    for archived in ArchivedRequest.objects.iterator(chunk_size=200):
+        payload = archived.payload
+        if any(entry['model'] == 'app.requestsnapshot' for entry in payload):
+            continue
+        request_entry = next((entry for entry in payload if entry['model'] == 'app.request'), None)
+        if request_entry is None:
+            continue
+        fields = request_entry['fields']
+        payload.append({
+            'model': 'app.requestsnapshot',
+            'pk': None,
+            'fields': {
+                'request': request_entry['pk'],
+                'sequence': 0,
+                'taken_at': fields['updated_at'],
+                'state': {field: fields.get(field) for field in TRACKED_FIELDS},
+            },
+        })
+        archived.payload = payload
+        archived.save(update_fields=['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_archived_history_values'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_baseline_snapshots, migrations.RunPython.noop),
+    ]
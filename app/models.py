@@ -1,39 +1,74 @@
+import hashlib
+import zlib
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+class Department(models.Model):
+    """Canonical department a request belongs to."""
+    name = models.CharField(max_length=200, unique=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
 
 class Request(models.Model):
+    # Stored as small integer codes; the labels are what users see
+    STAGE_PENDING_REVIEW = 1
+    STAGE_UNDER_REVIEW_TRIAGE = 2
+    STAGE_UNDER_REVIEW_GOVERNANCE = 3
+    STAGE_UNDER_REVIEW_FINAL_GOVERNANCE = 4
+    STAGE_APPROVED = 5
+    STAGE_REJECTED = 6
+    STAGE_ARCHIVED = 7
     STAGE_CHOICES = [
-        ('Pending Review', 'Pending Review'),
-        ('Under Review - Triage', 'Under Review - Triage'),
-        ('Under Review - Governance', 'Under Review - Governance'),
-        ('Under Review - Final Governance', 'Under Review - Final Governance'),
-        ('Approved', 'Recommended'),
-        ('Rejected', 'Not Recommended'),
-        ('Archived', 'Archived'),
+        (STAGE_PENDING_REVIEW, 'Pending Review'),
+        (STAGE_UNDER_REVIEW_TRIAGE, 'Under Review - Triage'),
+        (STAGE_UNDER_REVIEW_GOVERNANCE, 'Under Review - Governance'),
+        (STAGE_UNDER_REVIEW_FINAL_GOVERNANCE, 'Under Review - Final Governance'),
+        (STAGE_APPROVED, 'Recommended'),
+        (STAGE_REJECTED, 'Not Recommended'),
+        (STAGE_ARCHIVED, 'Archived'),
     ]
+    TRIAGE_STAGES = [STAGE_PENDING_REVIEW, STAGE_UNDER_REVIEW_TRIAGE]
     
+    TYPE_NOT_YET_DECIDED = 1
+    TYPE_PROCESS_IMPROVEMENT = 2
+    TYPE_IT_GOVERNANCE = 3
+    TYPE_AI_GOVERNANCE = 4
+    TYPE_ERP_GOVERNANCE = 5
     REQUEST_TYPE_CHOICES = [
-        ('Not Yet Decided', 'Not Yet Decided'),
-        ('Process Improvement', 'Process Improvement'),
-        ('IT Governance', 'IT Governance'),
-        ('AI Governance', 'AI Governance'),
-        ('ERP Governance', 'ERP Governance'),
+        (TYPE_NOT_YET_DECIDED, 'Not Yet Decided'),
+        (TYPE_PROCESS_IMPROVEMENT, 'Process Improvement'),
+        (TYPE_IT_GOVERNANCE, 'IT Governance'),
+        (TYPE_AI_GOVERNANCE, 'AI Governance'),
+        (TYPE_ERP_GOVERNANCE, 'ERP Governance'),
     ]
     
+    PRIORITY_LOW = 1
+    PRIORITY_NORMAL = 2
+    PRIORITY_HIGH = 3
+    PRIORITY_TOP = 4
     PRIORITY_CHOICES = [
-        ('Low', 'Low'),
-        ('Normal', 'Normal'),
-        ('High', 'High'),
-        ('Top', 'Top'),
+        (PRIORITY_LOW, 'Low'),
+        (PRIORITY_NORMAL, 'Normal'),
+        (PRIORITY_HIGH, 'High'),
+        (PRIORITY_TOP, 'Top'),
     ]
     
     request_id = models.CharField(max_length=5, unique=True, editable=False, blank=True, null=False)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    department = models.CharField(max_length=200, blank=True)
-    stage = models.CharField(max_length=50, choices=STAGE_CHOICES, default='Pending Review')
-    request_type = models.CharField(max_length=50, choices=REQUEST_TYPE_CHOICES, default='Not Yet Decided')
-    priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='Normal')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='requests')
+    stage = models.PositiveSmallIntegerField(choices=STAGE_CHOICES, default=STAGE_PENDING_REVIEW)
+    request_type = models.PositiveSmallIntegerField(choices=REQUEST_TYPE_CHOICES, default=TYPE_NOT_YET_DECIDED)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_NORMAL)
     triage_notes = models.TextField(blank=True, null=True, help_text="Notes from the triage group")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='requests')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -48,32 +83,112 @@ class Request(models.Model):
     vendor_reputation_support = models.IntegerField(null=True, blank=True, help_text="Vendor reputation and support score (1-5)")
     security_compliance = models.IntegerField(null=True, blank=True, help_text="Security and compliance score (1-5)")
     student_centered = models.IntegerField(null=True, blank=True, help_text="Student-centered score (1-5)")
+    version = models.PositiveIntegerField(default=1, editable=False, help_text="Bumped on every write; used for optimistic locking")
+    # Maintained with F() updates by the code that adds or removes rows; see app/counters.py
+    attachment_count = models.PositiveIntegerField(default=0, editable=False)
+    change_count = models.PositiveIntegerField(default=0, editable=False)
+    triage_note_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Used by the cold-storage mover to find old archived requests
+            models.Index(fields=['stage', 'updated_at'], name='request_stage_updated_idx'),
+        ]
     
-    def save(self, *args, **kwargs):
-        if not self.request_id:
-            # Get the highest existing request_id
-            last_request = Request.objects.order_by('-request_id').first()
-            if last_request and last_request.request_id:
+    @classmethod
+    def choice_label(cls, field, value):
+        """Display label for a coded field value ('stage', 7 -> 'Archived'); other values pass through."""
+        choices = cls._meta.get_field(field).flatchoices
+        return dict(choices).get(value, value) if choices else value
+    
+    def as_of(self, timestamp):
+        """
+        An unsaved copy of this request with its tracked fields as they were at
+        `timestamp`, or None if its history does not reach back that far (see app.events).
+        """
+        from .events import ATTNAMES, state_as_of
+        state = state_as_of(self.id, timestamp)
+        if state is None:
+            return None
+        return Request(
+            id=self.id, request_id=self.request_id, created_by_id=self.created_by_id, created_at=self.created_at,
+            **{ATTNAMES[field]: value for field, value in state.items()},
+        )
+    
+    @classmethod
+    def next_request_number(cls):
+        """
+        The number after the highest request_id in use, counting requests moved
+        to cold storage: they keep their numbers and can be restored.
+        """
+        next_id = 1
+        for model in (Request, ArchivedRequest):
+            last_id = model.objects.order_by('-request_id').values_list('request_id', flat=True).first()
+            if last_id:
                 try:
-                    last_id = int(last_request.request_id)
-                    next_id = last_id + 1
+                    next_id = max(next_id, int(last_id) + 1)
                 except ValueError:
-                    next_id = 1
-            else:
-                next_id = 1
-            
+                    pass
+        return next_id
+    
+    def save(self, *args, **kwargs):
+        if not self.request_id:
             # Format as 5-digit string with leading zeros
-            self.request_id = f"{next_id:05d}"
+            self.request_id = f"{self.next_request_number():05d}"
+        
+        if not self._state.adding:
+            # Plain saves (admin, scripts) still invalidate edit forms opened at the old version
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
         
         super().save(*args, **kwargs)
     
+    def save_if_unchanged(self, expected_version, fields, **expressions):
+        """
+        Compare-and-swap save: write only `fields` with a single
+        UPDATE ... WHERE id = %s AND version = %s and bump the version.
+        `expressions` (e.g. change_count=F('change_count') + 1) go into the same UPDATE.
+
+        Returns False, writing nothing, if someone else saved the request since
+        `expected_version` was read.
+        """
+        now = timezone.now()
+        updated = Request.objects.filter(pk=self.pk, version=expected_version).update(
+            **{field: getattr(self, field) for field in fields},
+            **expressions,
+            updated_at=now,
+            version=F('version') + 1,
+        )
+        if updated:
+            self.version = expected_version + 1
+            self.updated_at = now
+        return bool(updated)
+    
     def __str__(self):
         return f"{self.request_id} - {self.title}" if self.request_id else self.title
 
 
+class AttachmentText(models.Model):
+    """
+    Text extracted from an attachment file, stored once per distinct file content.
+
+    Rows are keyed by the SHA-256 of the file, so identical uploads share one row
+    and are never parsed twice. `text` is full-text indexed (a GIN index on
+    PostgreSQL, an FTS5 table kept in sync by triggers on SQLite; see migration
+    0020) and searched through app.extraction.search_requests.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    text = models.TextField(blank=True)
+    extractor = models.CharField(max_length=20, blank=True, help_text="Format the text was extracted as; empty if unsupported")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.extractor or 'no text'})"
+
+
 class RequestAttachment(models.Model):
     """Model for storing file attachments for requests."""
     request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='attachments')
@@ -81,6 +196,14 @@ class RequestAttachment(models.Model):
     original_filename = models.CharField(max_length=255)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Set by the extract_attachment_text job once the file has been read
+    text = models.ForeignKey(AttachmentText, on_delete=models.SET_NULL, null=True, blank=True, related_name='attachments')
+    
+    @property
+    def preview_url(self):
+        """URL of the cached thumbnail (see app/previews.py), or None if there is none."""
+        from .previews import preview_url
+        return preview_url(self)
     
     class Meta:
         ordering = ['-uploaded_at']
@@ -104,12 +227,103 @@ class TriageNotesHistory(models.Model):
         return f"{self.request.request_id} - {self.submitted_by.username} - {self.submitted_at}"
 
 
+class HistoryValue(models.Model):
+    """
+    A change history value stored once and referenced by every RequestChangeHistory
+    row that uses it. Values of HISTORY_COMPRESS_MIN_BYTES or more (typically
+    descriptions) are zlib-compressed when that actually saves space.
+    """
+    digest = models.CharField(max_length=40, unique=True, help_text="SHA-1 of the value text")
+    data = models.BinaryField()
+    compressed = models.BooleanField(default=False)
+    
+    @staticmethod
+    def digest_for(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def encode(text):
+        """Return (data, compressed) for a value."""
+        raw = text.encode('utf-8')
+        min_bytes = getattr(settings, 'HISTORY_COMPRESS_MIN_BYTES', 256)
+        if min_bytes is not None and len(raw) >= min_bytes:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                return packed, True
+        return raw, False
+    
+    @classmethod
+    def intern_many(cls, texts):
+        """Return {text: HistoryValue} for the given texts, creating any that are missing."""
+        by_digest = {cls.digest_for(text): text for text in set(texts) if text is not None}
+        found = {}
+        digests = list(by_digest)
+        for start in range(0, len(digests), 500):
+            for value in cls.objects.filter(digest__in=digests[start:start + 500]):
+                found[value.digest] = value
+        
+        missing = [digest for digest in by_digest if digest not in found]
+        if missing:
+            new_values = []
+            for digest in missing:
+                data, compressed = cls.encode(by_digest[digest])
+                new_values.append(cls(digest=digest, data=data, compressed=compressed))
+            # ignore_conflicts: a concurrent writer may have interned the same value
+            cls.objects.bulk_create(new_values, batch_size=500, ignore_conflicts=True)
+            for start in range(0, len(missing), 500):
+                for value in cls.objects.filter(digest__in=missing[start:start + 500]):
+                    found[value.digest] = value
+        
+        return {by_digest[digest]: value for digest, value in found.items()}
+    
+    @classmethod
+    def intern(cls, text):
+        if text is None:
+            return None
+        return cls.intern_many([text])[text]
+    
+    @property
+    def text(self):
+        data = bytes(self.data)
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+    
+    def __str__(self):
+        return self.text[:50]
+
+
 class RequestChangeHistory(models.Model):
     """Model for tracking all changes made to requests."""
+    # Small integer codes for the tracked Request fields; labels are what the UI shows
+    FIELD_CHOICES = [
+        (0, 'Other'),
+        (1, 'Title'),
+        (2, 'Description'),
+        (3, 'Department'),
+        (4, 'Stage'),
+        (5, 'Request Type'),
+        (6, 'Priority'),
+        (7, 'Triage Notes'),
+        (8, 'Scoring Notes'),
+        (9, 'Final Priority'),
+        (10, 'Final Score'),
+        (11, 'Strategic Alignment'),
+        (12, 'Cost Benefit'),
+        (13, 'User Impact'),
+        (14, 'Ease Of Implementation'),
+        (15, 'Vendor Reputation Support'),
+        (16, 'Security Compliance'),
+        (17, 'Student Centered'),
+    ]
+    FIELD_CODES = {
+        label.lower().replace(' ', '_'): code for code, label in FIELD_CHOICES if code
+    }
+    
     request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='change_history')
-    field_name = models.CharField(max_length=100, help_text="Name of the field that was changed")
-    old_value = models.TextField(blank=True, null=True, help_text="Previous value")
-    new_value = models.TextField(blank=True, null=True, help_text="New value")
+    field_code = models.PositiveSmallIntegerField(choices=FIELD_CHOICES, default=0, help_text="Field that was changed")
+    old_ref = models.ForeignKey(HistoryValue, on_delete=models.PROTECT, null=True, blank=True, related_name='+', help_text="Previous value")
+    new_ref = models.ForeignKey(HistoryValue, on_delete=models.PROTECT, null=True, blank=True, related_name='+', help_text="New value")
     changed_by = models.ForeignKey(User, on_delete=models.CASCADE)
     changed_at = models.DateTimeField(auto_now_add=True)
     
@@ -117,5 +331,236 @@ class RequestChangeHistory(models.Model):
         ordering = ['-changed_at']
         verbose_name_plural = 'Request Change History'
     
+    @property
+    def field_name(self):
+        return self.get_field_code_display()
+    
+    @property
+    def old_value(self):
+        return self.old_ref.text if self.old_ref_id else None
+    
+    @property
+    def new_value(self):
+        return self.new_ref.text if self.new_ref_id else None
+    
+    @classmethod
+    def code_for(cls, field):
+        """Field code for a model field name ('request_type') or label ('Request Type')."""
+        return cls.FIELD_CODES.get(field.strip().lower().replace(' ', '_'), 0)
+    
+    @classmethod
+    def build(cls, request, field, old_value, new_value, changed_by, values=None):
+        """
+        Return an unsaved change row. Pass `values` from HistoryValue.intern_many()
+        when building many rows so the values are interned in one round-trip.
+        """
+        if values is None:
+            values = HistoryValue.intern_many([old_value, new_value])
+        return cls(
+            request=request,
+            field_code=cls.code_for(field),
+            old_ref=values.get(old_value) if old_value is not None else None,
+            new_ref=values.get(new_value) if new_value is not None else None,
+            changed_by=changed_by,
+        )
+    
+    @classmethod
+    def record(cls, request, field, old_value, new_value, changed_by):
+        change = cls.build(request, field, old_value, new_value, changed_by)
+        change.save()
+        return change
+    
     def __str__(self):
         return f"{self.request.request_id} - {self.field_name} - {self.changed_by.username} - {self.changed_at}"
+
+
+class RequestHistorySummary(models.Model):
+    """Rollup of change history rows older than HISTORY_RETENTION_DAYS for one request."""
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='history_summaries')
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    change_count = models.PositiveIntegerField(default=0)
+    field_counts = models.JSONField(default=dict, help_text="Number of changes per field label")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-period_end']
+        verbose_name_plural = 'Request History Summaries'
+    
+    def __str__(self):
+        return f"{self.request.request_id} - {self.change_count} changes to {self.period_end:%Y-%m-%d}"
+
+
+class ArchivedRequest(models.Model):
+    """
+    Cold storage for archived requests moved out of the hot tables.
+
+    The request, its change history (including rolled-up summaries), triage
+    notes history and attachment metadata are kept as serialized rows in
+    `payload` so they can be shown read-only or restored with their original ids. Attachment files stay
+    where they are in MEDIA_ROOT.
+    """
+    original_id = models.BigIntegerField(unique=True, help_text="Primary key the request had in the hot table")
+    request_id = models.CharField(max_length=5, unique=True)
+    title = models.CharField(max_length=200)
+    department = models.CharField(max_length=200, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    archived_at = models.DateTimeField(help_text="When the request was last updated before being moved")
+    moved_at = models.DateTimeField(auto_now_add=True)
+    payload = models.JSONField(help_text="Serialized request, history and attachment rows")
+    
+    class Meta:
+        ordering = ['-archived_at']
+    
+    def __str__(self):
+        return f"{self.request_id} - {self.title} (cold)"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the run_jobs command.
+
+    `name` selects a handler registered with app.jobs.job; `payload` holds its
+    keyword arguments. Failed jobs are retried with exponential backoff until
+    `max_attempts` is reached. A running job's `heartbeat_at` is refreshed by its
+    worker; one that stops beating is taken to have lost its worker.
+    """
+    STATUS_QUEUED = 1
+    STATUS_RUNNING = 2
+    STATUS_DONE = 3
+    STATUS_FAILED = 4
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time")
+    claimed_by = models.CharField(max_length=64, blank=True, help_text="Worker claim token while running")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker running it")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers poll for queued jobs that are due
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.get_status_display()})"
+
+
+class StageNotification(models.Model):
+    """
+    A stage change waiting to be mailed to a requester.
+
+    Rows are collected per recipient and sent as one digest email by the
+    send_stage_digests job (app.notifications); `sent_at` is set once mailed.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stage_notifications')
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='stage_notifications')
+    old_stage = models.PositiveSmallIntegerField(choices=Request.STAGE_CHOICES)
+    new_stage = models.PositiveSmallIntegerField(choices=Request.STAGE_CHOICES)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # The digest job reads unsent rows grouped by recipient
+            models.Index(fields=['sent_at', 'recipient', 'created_at'], name='stage_notification_unsent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.request} -> {self.recipient}: {self.get_new_stage_display()}"
+
+
+class RequestProfile(models.Model):
+    """
+    A cProfile capture of one sampled request, written by app.middleware.ProfilingMiddleware.
+
+    The raw pstats dump is `file_name` in PROFILING_DIR; only the newest
+    PROFILING_MAX_PROFILES are kept.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    view_name = models.CharField(max_length=200, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    total_ms = models.FloatField()
+    db_ms = models.FloatField(help_text="Time spent executing SQL")
+    query_count = models.PositiveIntegerField()
+    breakdown = models.JSONField(default=dict, help_text="Profiled time (ms) by orm, template, view and other code")
+    file_name = models.CharField(max_length=200)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.total_ms:.0f}ms)"
+
+
+class RequestSimilarityBand(models.Model):
+    """
+    One LSH band of a request's MinHash signature (see app.duplicates).
+
+    Requests sharing a bucket value are near-duplicate candidates; each request
+    has one row per band.
+    """
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='similarity_bands')
+    bucket = models.BigIntegerField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.request_id}: {self.bucket}"
+
+
+class RequestEvent(models.Model):
+    """
+    One write to a request's tracked fields, with the complete new values
+    (see app.events). `sequence` counts the request's events from 1.
+    """
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='events')
+    sequence = models.PositiveIntegerField()
+    occurred_at = models.DateTimeField()
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    changes = models.JSONField(help_text="New value of each changed field, as stored on the request")
+    
+    class Meta:
+        ordering = ['request', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['request', 'sequence'], name='request_event_sequence_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.request_id} #{self.sequence}: {', '.join(self.changes)}"
+
+
+class RequestSnapshot(models.Model):
+    """The complete tracked state of a request after its event `sequence` (0 = as created)."""
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='snapshots')
+    sequence = models.PositiveIntegerField()
+    taken_at = models.DateTimeField()
+    state = models.JSONField()
+    
+    class Meta:
+        ordering = ['request', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['request', 'sequence'], name='request_snapshot_sequence_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['request', 'taken_at'], name='request_snapshot_taken_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.request_id} @{self.sequence} ({self.taken_at:%Y-%m-%d %H:%M})"
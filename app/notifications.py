@@ -0,0 +1,144 @@
+"""
+Stage-change notification digests.
+
+Views and bulk transitions call record_stage_changes(), which only inserts rows
+and makes sure a send_stage_digests job is queued. The job mails each requester
+one digest of everything that changed since their first unsent notification,
+once that notification is NOTIFICATION_DIGEST_WINDOW_SECONDS old.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .jobs import enqueue, job
+from .models import Job, Request, StageNotification
+
+DIGEST_JOB = 'send_stage_digests'
+
+
+def record_stage_changes(changes, changed_by):
+    """
+    Queue notifications for `changes`, an iterable of
+    (request id, requester id, old stage, new stage).
+
+    People are not notified of their own changes.
+    """
+    notifications = [
+        StageNotification(
+            request_id=request_id, recipient_id=recipient_id,
+            old_stage=old_stage, new_stage=new_stage, changed_by=changed_by,
+        )
+        for request_id, recipient_id, old_stage, new_stage in changes
+        if recipient_id and recipient_id != changed_by.id and old_stage != new_stage
+    ]
+    if notifications:
+        StageNotification.objects.bulk_create(notifications, batch_size=500)
+        schedule_digests(settings.NOTIFICATION_DIGEST_WINDOW_SECONDS)
+
+
+def schedule_digests(delay):
+    """Queue the digest job to run in `delay` seconds unless one is already waiting."""
+    if not Job.objects.filter(name=DIGEST_JOB, status=Job.STATUS_QUEUED).exists():
+        enqueue(DIGEST_JOB, delay=delay)
+
+
+def _coalesce(notifications):
+    """One entry per request: its first old stage, latest new stage and latest change."""
+    by_request = {}
+    for notification in notifications:
+        entry = by_request.setdefault(notification.request_id, {
+            'request': notification.request,
+            'old_stage': notification.old_stage,
+        })
+        entry.update(
+            new_stage=notification.new_stage,
+            changed_by=notification.changed_by,
+            changed_at=notification.created_at,
+        )
+    changes = []
+    for entry in by_request.values():
+        if entry['old_stage'] == entry['new_stage']:
+            continue  # moved and moved back within the window
+        entry['old_label'] = Request.choice_label('stage', entry['old_stage'])
+        entry['new_label'] = Request.choice_label('stage', entry['new_stage'])
+        changes.append(entry)
+    return changes
+
+
+def build_digest(recipient, notifications):
+    """The digest EmailMessage for one recipient, or None if nothing is left to report."""
+    changes = _coalesce(notifications)
+    if not changes or not recipient.email:
+        return None
+    subject = (
+        f"{changes[0]['request'].request_id} is now {changes[0]['new_label']}" if len(changes) == 1
+        else f"{len(changes)} of your requests changed stage"
+    )
+    body = render_to_string('app/email/stage_digest.txt', {'recipient': recipient, 'changes': changes})
+    return EmailMessage(subject, body, to=[recipient.email])
+
+
+@job(DIGEST_JOB)
+def send_stage_digests(flush=False):
+    """
+    Mail a digest to every recipient whose oldest unsent notification has
+    waited out the window (every recipient when `flush`), then reschedule for
+    the next recipient due.
+
+    All digests go out over one SMTP connection, NOTIFICATION_BATCH_SIZE
+    messages at a time. Each batch claims its notifications by marking them
+    sent in a transaction that is only committed once the batch has been
+    accepted: a concurrent run (run_jobs --workers N) cannot mail them again,
+    and a failed batch rolls back to unsent and is retried by the job runner.
+    """
+    now = timezone.now()
+    window = timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW_SECONDS)
+    oldest = dict(
+        StageNotification.objects.filter(sent_at__isnull=True)
+        .values('recipient').annotate(first=Min('created_at')).order_by()
+        .values_list('recipient', 'first')
+    )
+    due = [recipient_id for recipient_id, first in oldest.items() if flush or first <= now - window]
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+
+    with get_connection() as connection:
+        for start in range(0, len(due), batch_size):
+            recipient_ids = due[start:start + batch_size]
+            with transaction.atomic():
+                # Rows another run has locked (PostgreSQL) or already marked sent are
+                # skipped; the rows this UPDATE marks with claimed_at are this run's to mail
+                unsent = list(
+                    StageNotification.objects.select_for_update(skip_locked=True)
+                    .filter(recipient_id__in=recipient_ids, sent_at__isnull=True)
+                    .values_list('id', flat=True)
+                )
+                claimed_at = timezone.now()
+                StageNotification.objects.filter(id__in=unsent, sent_at__isnull=True).update(sent_at=claimed_at)
+                pending = (
+                    StageNotification.objects.filter(id__in=unsent, sent_at=claimed_at)
+                    .select_related('request', 'changed_by')
+                    .order_by('created_at', 'id')
+                )
+                by_recipient = {}
+                for notification in pending:
+                    by_recipient.setdefault(notification.recipient_id, []).append(notification)
+                recipients = User.objects.in_bulk(list(by_recipient))
+
+                messages = []
+                for recipient_id, notifications in by_recipient.items():
+                    message = build_digest(recipients[recipient_id], notifications)
+                    if message is not None:
+                        messages.append(message)
+                if messages:
+                    connection.send_messages(messages)
+
+    waiting = [first for recipient_id, first in oldest.items() if recipient_id not in due]
+    if waiting:
+        schedule_digests(max(0, (min(waiting) + window - now).total_seconds()))
+    return len(due)
@@ -0,0 +1,202 @@
+"""
+Attachment previews: small JPEG renders of images and of the first page of PDFs.
+
+Previews are generated by the generate_attachment_preview job after upload and
+kept in ATTACHMENT_PREVIEW_ROOT, a cache bounded to ATTACHMENT_PREVIEW_MAX_BYTES
+that evicts the least recently served files first. A missing preview is never an
+error: the modal falls back to the plain file link. Rendering never queues
+work; run_jobs housekeeping sweeps the attachments and queues the missing
+previews again (see requeue_missing_previews).
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .jobs import enqueue
+from .models import RequestAttachment
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it no previews are made
+    Image = ImageOps = None
+
+try:
+    import pypdfium2
+except ImportError:  # PDF previews also need pypdfium2
+    pypdfium2 = None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+# Serving a preview refreshes its mtime (the LRU clock) at most this often
+TOUCH_INTERVAL = 3600
+
+# Eviction trims the cache to this fraction of the limit, so it does not run on every write
+EVICT_TO = 0.9
+
+# A missing preview is queued for generation at most once per this many seconds
+REQUEUE_INTERVAL = 600
+
+# Missing previews are queued again only while the cache is below this fraction
+# of the limit, so previews just evicted for space are not regenerated straight away
+REFILL_BELOW = 0.8
+
+# Attachments checked per housekeeping pass, and the shared cursor the sweep resumes from
+REFILL_BATCH = 200
+REFILL_CURSOR_KEY = 'preview:refill_cursor'
+
+
+def can_preview(filename):
+    """Whether a preview can be generated for `filename` with the libraries installed."""
+    if Image is None:
+        return False
+    extension = os.path.splitext(filename)[1].lower()
+    return extension in IMAGE_EXTENSIONS or (extension == '.pdf' and pypdfium2 is not None)
+
+
+def preview_key(attachment):
+    # The upload time keeps keys unique even if a deleted attachment's id is reused
+    return f'{attachment.id}-{int(attachment.uploaded_at.timestamp())}'
+
+
+def preview_path(key):
+    return os.path.join(settings.ATTACHMENT_PREVIEW_ROOT, f'{key}.jpg')
+
+
+def queue_preview(attachment):
+    """
+    Queue the generate_attachment_preview job for a previewable attachment, unless
+    one was queued for the same preview within REQUEUE_INTERVAL. The shared cache
+    dedupes the job between the upload and the housekeeping of concurrent run_jobs
+    processes. Returns True if a job was queued.
+    """
+    if not can_preview(attachment.file.name):
+        return False
+    if not cache.add(f'preview:queued:{preview_key(attachment)}', True, REQUEUE_INTERVAL):
+        return False
+    enqueue('generate_attachment_preview', attachment_id=attachment.id)
+    return True
+
+
+def preview_url(attachment):
+    """URL of the attachment's cached preview, or None if there is none (yet). Has no side effects."""
+    if attachment.id is None or attachment.uploaded_at is None:
+        return None
+    key = preview_key(attachment)
+    if not os.path.exists(preview_path(key)):
+        return None
+    return reverse('attachment_preview', args=key.split('-'))
+
+
+def requeue_missing_previews(batch_size=REFILL_BATCH):
+    """
+    Check the next `batch_size` attachments (by id, wrapping around) and queue a
+    preview job for each previewable one whose preview is missing: evicted, or
+    its job lost. Skipped while the cache holds REFILL_BELOW of its limit or more.
+    Returns the number of jobs queued.
+    """
+    if _cache_bytes() >= settings.ATTACHMENT_PREVIEW_MAX_BYTES * REFILL_BELOW:
+        return 0
+    cursor = cache.get(REFILL_CURSOR_KEY, 0)
+    batch = list(RequestAttachment.objects.filter(id__gt=cursor).order_by('id').only('id', 'file', 'uploaded_at')[:batch_size])
+    cache.set(REFILL_CURSOR_KEY, batch[-1].id if len(batch) == batch_size else 0, None)
+    return sum(
+        1 for attachment in batch
+        if not os.path.exists(preview_path(preview_key(attachment))) and queue_preview(attachment)
+    )
+
+
+def delete_preview(key):
+    """Remove a cached preview, e.g. of a deleted attachment."""
+    try:
+        os.unlink(preview_path(key))
+    except FileNotFoundError:
+        pass
+
+
+def _render(source_path):
+    """The first frame or page of the file as a PIL image."""
+    if os.path.splitext(source_path)[1].lower() == '.pdf':
+        pdf = pypdfium2.PdfDocument(source_path)
+        try:
+            page = pdf[0]
+            # Render just large enough for the thumbnail
+            scale = settings.ATTACHMENT_PREVIEW_SIZE / max(page.get_size())
+            return page.render(scale=max(scale, 0.1)).to_pil()
+        finally:
+            pdf.close()
+    image = Image.open(source_path)
+    image.draft('RGB', (settings.ATTACHMENT_PREVIEW_SIZE, settings.ATTACHMENT_PREVIEW_SIZE))  # cheap JPEG downscale
+    return ImageOps.exif_transpose(image)
+
+
+def generate_preview(attachment):
+    """Write the preview for `attachment` into the cache. Returns its path, or None if not previewable."""
+    if not can_preview(attachment.file.name) or not attachment.file.storage.exists(attachment.file.name):
+        return None
+    image = _render(attachment.file.path)
+    image.thumbnail((settings.ATTACHMENT_PREVIEW_SIZE, settings.ATTACHMENT_PREVIEW_SIZE))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    os.makedirs(settings.ATTACHMENT_PREVIEW_ROOT, exist_ok=True)
+    path = preview_path(preview_key(attachment))
+    # Write then rename, so a half-written file is never served
+    fd, tmp_path = tempfile.mkstemp(dir=settings.ATTACHMENT_PREVIEW_ROOT, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            image.save(fh, 'JPEG', quality=80, optimize=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    evict()
+    return path
+
+
+def touch(path, now):
+    """Mark a preview as recently used."""
+    try:
+        if now - os.stat(path).st_mtime > TOUCH_INTERVAL:
+            os.utime(path, (now, now))
+    except FileNotFoundError:
+        pass
+
+
+def _cached_files():
+    """[(mtime, size, path)] of every preview in the cache."""
+    try:
+        entries = [entry for entry in os.scandir(settings.ATTACHMENT_PREVIEW_ROOT) if entry.name.endswith('.jpg')]
+    except FileNotFoundError:
+        return []
+    return [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+
+
+def _cache_bytes():
+    return sum(size for _mtime, size, _path in _cached_files())
+
+
+def evict(max_bytes=None):
+    """
+    Delete least recently used previews until the cache is within `max_bytes`
+    (default ATTACHMENT_PREVIEW_MAX_BYTES). Returns the number of files removed.
+    """
+    max_bytes = settings.ATTACHMENT_PREVIEW_MAX_BYTES if max_bytes is None else max_bytes
+    files = _cached_files()
+    total = sum(size for _mtime, size, _path in files)
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _mtime, size, path in sorted(files):
+        if total <= max_bytes * EVICT_TO:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,119 @@
+"""
+Request profiling: which requests to sample, and how a cProfile run is summarized and stored.
+
+Used by app.middleware.ProfilingMiddleware. Profiles are pstats dumps in
+PROFILING_DIR (open them with `python -m pstats` or snakeviz) with a
+RequestProfile row each, browsable in the admin.
+"""
+import hmac
+import io
+import os
+import pstats
+import random
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .models import RequestProfile
+
+PROFILE_HEADER = 'X-Profile'
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BUCKETS = ('orm', 'template', 'view', 'other')
+
+
+def should_profile(request):
+    """
+    Profile when the request carries PROFILING_TOKEN in the X-Profile header,
+    or when PROFILING_ENABLED and the request is sampled at PROFILING_SAMPLE_RATE
+    (limited to PROFILING_VIEWS when that is set).
+    """
+    token = settings.PROFILING_TOKEN
+    supplied = request.headers.get(PROFILE_HEADER)
+    if token and supplied and hmac.compare_digest(supplied.encode(), token.encode()):
+        return True
+    if not settings.PROFILING_ENABLED or random.random() >= settings.PROFILING_SAMPLE_RATE:
+        return False
+    if settings.PROFILING_VIEWS:
+        try:
+            return resolve(request.path_info).view_name in settings.PROFILING_VIEWS
+        except Resolver404:
+            return False
+    return True
+
+
+def _bucket(filename, function):
+    # Self time of each function is attributed by where the function lives
+    path = filename.replace('\\', '/')
+    if '/django/db/' in path or 'sqlite3' in function or 'psycopg' in path or 'psycopg' in function:
+        return 'orm'
+    if '/django/template/' in path or '/django/templatetags/' in path:
+        return 'template'
+    if filename.startswith(APP_DIR):
+        return 'view'
+    return 'other'
+
+
+def breakdown(stats):
+    """
+    Profiled time in ms by bucket: ORM (Django's db layer and the database
+    driver), template rendering, view code (this app) and other (framework,
+    middleware, stdlib). Buckets sum self time, so they do not overlap.
+    """
+    totals = dict.fromkeys(BUCKETS, 0.0)
+    for (filename, _line, function), (_cc, _nc, self_time, _cumulative, _callers) in stats.stats.items():
+        totals[_bucket(filename, function)] += self_time * 1000
+    return {bucket: round(ms, 2) for bucket, ms in totals.items()}
+
+
+def save_profile(profiler, request, response, total_ms, recorder):
+    """Dump `profiler` to PROFILING_DIR, record it, and rotate out the oldest profiles."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else ''
+    file_name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{(view_name or 'unresolved').replace(':', '_')}.prof"
+    profiler.dump_stats(os.path.join(settings.PROFILING_DIR, file_name))
+
+    profile = RequestProfile.objects.create(
+        view_name=view_name,
+        method=request.method,
+        path=request.path[:500],
+        status_code=response.status_code,
+        total_ms=round(total_ms, 2),
+        db_ms=round(recorder.total_time_ms, 2),
+        query_count=recorder.count,
+        breakdown=breakdown(pstats.Stats(profiler)),
+        file_name=file_name,
+    )
+    rotate_profiles()
+    return profile
+
+
+def rotate_profiles(keep=None):
+    """Delete all but the newest `keep` (default PROFILING_MAX_PROFILES) profiles and their files."""
+    keep = settings.PROFILING_MAX_PROFILES if keep is None else keep
+    stale = list(RequestProfile.objects.order_by('-created_at', '-id').values_list('id', 'file_name')[keep:])
+    for _profile_id, file_name in stale:
+        delete_profile_file(file_name)
+    RequestProfile.objects.filter(id__in=[profile_id for profile_id, _file_name in stale]).delete()
+    return len(stale)
+
+
+def delete_profile_file(file_name):
+    try:
+        os.unlink(os.path.join(settings.PROFILING_DIR, file_name))
+    except FileNotFoundError:
+        pass
+
+
+def profile_report(profile, limit=40, sort='cumulative'):
+    """pstats text for a stored profile's top `limit` functions, or None if its file is gone."""
+    path = os.path.join(settings.PROFILING_DIR, profile.file_name)
+    if not os.path.exists(path):
+        return None
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,169 @@
+"""Generate realistic datasets for benchmarks and query-budget tests."""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .departments import invalidate_departments
+from .events import request_state
+from .models import Department, HistoryValue, Request, RequestAttachment, RequestChangeHistory, RequestSnapshot, TriageNotesHistory
+
+SEED_PASSWORD = 'benchmark-password'
+
+DEPARTMENTS = [
+    'Information Technology', 'Student Services', 'Financial Aid', 'Admissions',
+    'Human Resources', 'Facilities', 'Library', 'Registrar', 'Athletics',
+    'Academic Affairs', 'Marketing', 'Institutional Research',
+]
+
+TITLE_SUBJECTS = [
+    'CRM', 'LMS integration', 'scheduling tool', 'document imaging', 'chatbot',
+    'reporting dashboard', 'ERP module', 'survey platform', 'e-signature', 'ticketing system',
+]
+
+TITLE_VERBS = ['Replace', 'Upgrade', 'Evaluate', 'Implement', 'Integrate', 'Retire']
+
+
+def _choice_values(choices):
+    return [value for value, _label in choices]
+
+
+def _choice_labels(choices):
+    return [label for _value, label in choices]
+
+
+def _ensure_group(name):
+    group, _created = Group.objects.get_or_create(name=name)
+    return group
+
+
+@transaction.atomic
+def seed_dataset(num_users=50, num_requests=1000, history_per_request=4, notes_per_request=2,
+                 attachments_per_request=1, write_files=True, prefix='bench', seed=0, batch_size=500):
+    """
+    Create users and requests spread over every stage, with change history,
+    triage notes history and attachments.
+
+    Users are split roughly 1:3:6 between 'Triage Group Lead', 'Triage Group'
+    and end users, and all share SEED_PASSWORD. With write_files=False the
+    attachment rows point at files that are never written to storage.
+
+    Returns a dict with 'leads', 'triage', 'end_users' and 'requests' lists.
+    """
+    rng = random.Random(seed)
+    stages = _choice_values(Request.STAGE_CHOICES)
+    request_types = _choice_values(Request.REQUEST_TYPE_CHOICES)
+    priorities = _choice_values(Request.PRIORITY_CHOICES)
+
+    # Users
+    offset = User.objects.filter(username__startswith=f'{prefix}_').count()
+    password = make_password(SEED_PASSWORD)
+    users = User.objects.bulk_create([
+        User(
+            username=f'{prefix}_{offset + i}',
+            first_name=f'User{offset + i}',
+            last_name=prefix.title(),
+            email=f'{prefix}_{offset + i}@example.com',
+            password=password,
+        )
+        for i in range(max(num_users, 3))
+    ], batch_size=batch_size)
+    users = list(User.objects.filter(username__in=[u.username for u in users]).order_by('id'))
+
+    lead_count = max(1, len(users) // 10)
+    triage_count = max(1, len(users) * 3 // 10)
+    leads = users[:lead_count]
+    triage = users[lead_count:lead_count + triage_count]
+    end_users = users[lead_count + triage_count:]
+    _ensure_group('Triage Group Lead').user_set.add(*leads)
+    _ensure_group('Triage Group').user_set.add(*triage)
+    reviewers = leads + triage
+
+    # Departments
+    Department.objects.bulk_create([Department(name=name) for name in DEPARTMENTS], ignore_conflicts=True)
+    departments = list(Department.objects.filter(name__in=DEPARTMENTS))
+    invalidate_departments()  # bulk_create sends no post_save
+
+    # Requests
+    first_number = Request.next_request_number()
+    new_requests = []
+    for i in range(num_requests):
+        subject = rng.choice(TITLE_SUBJECTS)
+        new_requests.append(Request(
+            request_id=f'{first_number + i:05d}',
+            title=f'{rng.choice(TITLE_VERBS)} {subject}',
+            description=' '.join(
+                f'The {rng.choice(DEPARTMENTS).lower()} team needs a better {subject}.'
+                for _ in range(rng.randint(2, 8))
+            ),
+            department=rng.choice(departments),
+            stage=stages[i % len(stages)],
+            request_type=rng.choice(request_types),
+            priority=rng.choice(priorities),
+            triage_notes='Initial triage review complete.' if notes_per_request else None,
+            created_by=rng.choice(end_users),
+            attachment_count=attachments_per_request,
+            change_count=history_per_request,
+            triage_note_count=notes_per_request,
+        ))
+    Request.objects.bulk_create(new_requests, batch_size=batch_size)
+    created = list(Request.objects.filter(
+        request_id__in=[r.request_id for r in new_requests]
+    ).only('id', 'request_id'))
+    # bulk_create sends no post_save, so the creation snapshots point-in-time history starts from are made here
+    ids = {request_obj.request_id: request_obj.id for request_obj in created}
+    RequestSnapshot.objects.bulk_create([
+        RequestSnapshot(
+            request_id=ids[request_obj.request_id], sequence=0, taken_at=request_obj.created_at,
+            state=request_state(request_obj),
+        )
+        for request_obj in new_requests
+    ], batch_size=batch_size)
+
+    # History, notes and attachments
+    tracked = [
+        ('stage', _choice_labels(Request.STAGE_CHOICES)),
+        ('priority', _choice_labels(Request.PRIORITY_CHOICES)),
+        ('request_type', _choice_labels(Request.REQUEST_TYPE_CHOICES)),
+        ('department', DEPARTMENTS),
+    ]
+    interned = HistoryValue.intern_many([value for _field, values in tracked for value in values])
+    history = []
+    notes = []
+    attachments = []
+    for request_obj in created:
+        for _ in range(history_per_request):
+            field, values = rng.choice(tracked)
+            old_value, new_value = rng.sample(values, 2)
+            history.append(RequestChangeHistory.build(
+                request_obj, field, old_value, new_value, rng.choice(reviewers), values=interned,
+            ))
+        for n in range(notes_per_request):
+            notes.append(TriageNotesHistory(
+                request=request_obj,
+                notes=f'Triage note {n + 1}: reviewed scope and dependencies.',
+                submitted_by=rng.choice(reviewers),
+            ))
+        for n in range(attachments_per_request):
+            filename = f'{prefix}-{request_obj.request_id}-{n + 1}.txt'
+            path = f'request_attachments/seed/{filename}'
+            if write_files:
+                path = default_storage.save(path, ContentFile(f'Quote for request {request_obj.request_id}\n' * 20))
+            attachments.append(RequestAttachment(
+                request=request_obj, file=path, original_filename=filename,
+                uploaded_by=rng.choice(reviewers),
+            ))
+
+    RequestChangeHistory.objects.bulk_create(history, batch_size=batch_size)
+    TriageNotesHistory.objects.bulk_create(notes, batch_size=batch_size)
+    RequestAttachment.objects.bulk_create(attachments, batch_size=batch_size)
+
+    return {
+        'leads': leads,
+        'triage': triage,
+        'end_users': end_users,
+        'requests': created,
+    }
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_all_users, invalidate_user
+from .departments import invalidate_departments
+from .duplicates import index_request
+from .events import record_creation
+from .models import Department, Request
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_cached_user_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...) / remove / clear
+        invalidate_user(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) / remove
+        for user_id in pk_set:
+            invalidate_user(user_id)
+    else:
+        # group.user_set.clear() does not report which users were affected
+        invalidate_all_users()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_cached_group_names(sender, **kwargs):
+    invalidate_all_users()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_cached_departments(sender, **kwargs):
+    invalidate_departments()
+
+
+@receiver(post_save, sender=Request)
+def index_request_duplicates(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that leave the title and description alone cannot change the signature
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    index_request(instance, created=created)
+
+
+@receiver(post_save, sender=Request)
+def snapshot_new_request(sender, instance, created, raw=False, **kwargs):
+    # Deserialized saves (fixtures, restores from cold storage) bring their own snapshots
+    if created and not raw:
+        record_creation(instance)
@@ -0,0 +1,678 @@
+function openRequestModal(requestId, isTriageRequest = false) {
+    const modal = document.getElementById('requestModal');
+    const modalBody = modal.querySelector('.modal-body');
+    
+    if (isTriageRequest) {
+        // Load form for triage requests
+        modalBody.innerHTML = '<div class="loading">Loading...</div>';
+        const modalTitle = modal.querySelector('.modal-title');
+        modal.style.display = 'block';
+        
+        fetch(`/edit-request/${requestId}/`, {
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        })
+        .then(response => response.json())
+        .then(data => {
+                if (data.form_html) {
+                    modalBody.innerHTML = data.form_html;
+                    if (modalTitle) {
+                        modalTitle.textContent = 'Edit Request';
+                    }
+                    // Attach form submit handler
+                    attachFormHandler();
+                    // Attach file upload handler
+                    attachFileUploadHandler();
+                    // Update timestamps to local time
+                    updateTimestampsToLocal();
+                    // Update change history timestamps
+                    updateChangeHistoryTimestamps();
+                }
+        })
+        .catch(error => {
+            console.error('Error loading form:', error);
+            modalBody.innerHTML = '<p class="error-message">Error loading form. Please try again.</p>';
+        });
+    } else {
+        // Load read-only view for non-triage requests
+        modalBody.innerHTML = '<div class="loading">Loading...</div>';
+        const modalTitle = modal.querySelector('.modal-title');
+        modal.style.display = 'block';
+        
+        fetch(`/view-request/${requestId}/`, {
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        })
+        .then(response => response.text())
+        .then(html => {
+            modalBody.innerHTML = html;
+            if (modalTitle) {
+                modalTitle.textContent = 'Request Details';
+            }
+            // Update timestamps to local time for governance requests
+            updateTimestampsToLocal();
+            updateChangeHistoryTimestamps();
+        })
+        .catch(error => {
+            console.error('Error loading request:', error);
+            modalBody.innerHTML = '<p class="error-message">Error loading request. Please try again.</p>';
+        });
+    }
+}
+
+function attachFormHandler() {
+    const form = document.getElementById('requestEditForm');
+    if (form) {
+        attachDepartmentAutocomplete(form);
+        attachDuplicateLookup(form);
+        
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            
+            const formData = new FormData(form);
+            formData.append('csrfmiddlewaretoken', document.querySelector('[name=csrfmiddlewaretoken]').value);
+            
+            fetch(form.action, {
+                method: 'POST',
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest',
+                    'X-Response-Mode': 'delta'
+                },
+                body: formData
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    if (data.notices && data.notices.length) {
+                        // e.g. a department name that was matched to an existing department
+                        alert(data.notices.join('\n'));
+                    }
+                    if (data.delta) {
+                        // Patch the open modal in place with only what changed
+                        applyFormDelta(form, data.delta);
+                    } else if (data.form_html) {
+                        // If form_html is provided, update the modal content instead of reloading
+                        const modalBody = document.querySelector('.modal-body');
+                        modalBody.innerHTML = data.form_html;
+                        // Re-attach handlers
+                        attachFormHandler();
+                        attachFileUploadHandler();
+                        updateTimestampsToLocal();
+                    } else {
+                        // Reload page to show updated data
+                        window.location.reload();
+                    }
+                } else if (data.conflict) {
+                    handleEditConflict(form, data);
+                } else {
+                    // Show errors
+                    const modalBody = document.querySelector('.modal-body');
+                    if (data.errors) {
+                        // Display form errors
+                        alert('Please correct the errors in the form.');
+                    }
+                }
+            })
+            .catch(error => {
+                console.error('Error submitting form:', error);
+                alert('Error saving changes. Please try again.');
+            });
+        });
+    }
+}
+
+function attachDepartmentAutocomplete(form) {
+    // Suggest canonical departments while typing so new spelling variants are rare
+    const input = form.querySelector('[data-department-autocomplete]');
+    if (!input) return;
+    
+    const datalist = document.createElement('datalist');
+    datalist.id = `${input.id}-options`;
+    input.setAttribute('list', datalist.id);
+    input.after(datalist);
+    
+    let timer = null;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            fetch(`/departments/autocomplete/?q=${encodeURIComponent(input.value)}`, {
+                headers: {'X-Requested-With': 'XMLHttpRequest'}
+            })
+            .then(response => response.json())
+            .then(data => {
+                datalist.innerHTML = '';
+                data.results.forEach(department => {
+                    const option = document.createElement('option');
+                    option.value = department.name;
+                    datalist.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Error loading departments:', error));
+        }, 150);
+    });
+}
+
+function attachDuplicateLookup(form) {
+    // List requests that look like the same ask while the title or description is edited
+    const panel = form.querySelector('[data-duplicate-lookup]');
+    const title = form.querySelector('[name=title]');
+    const description = form.querySelector('[name=description]');
+    if (!panel || !title || !description) return;
+    
+    let timer = null;
+    const lookup = () => {
+        const params = new URLSearchParams({
+            title: title.value,
+            description: description.value.slice(0, 2000),
+            exclude: panel.dataset.exclude || ''
+        });
+        fetch(`/requests/duplicates/?${params}`, {
+            headers: {'X-Requested-With': 'XMLHttpRequest'}
+        })
+        .then(response => response.json())
+        .then(data => {
+            panel.innerHTML = '';
+            if (!data.results.length) return;
+            const heading = document.createElement('h4');
+            heading.className = 'attachments-section-title';
+            heading.textContent = 'Possible duplicates';
+            panel.appendChild(heading);
+            data.results.forEach(match => {
+                const item = document.createElement('div');
+                item.className = 'request-item';
+                item.addEventListener('click', () => openRequestModal(match.id, match.is_triage));
+                const header = document.createElement('div');
+                header.className = 'request-header';
+                const matchTitle = document.createElement('h3');
+                matchTitle.className = 'request-title';
+                matchTitle.textContent = match.title;
+                const info = document.createElement('span');
+                info.className = 'request-id';
+                info.textContent = `#${match.request_id} · ${match.stage} · ${Math.round(match.similarity * 100)}% similar`;
+                header.append(matchTitle, info);
+                item.appendChild(header);
+                panel.appendChild(item);
+            });
+        })
+        .catch(error => console.error('Error looking up duplicates:', error));
+    };
+    
+    [title, description].forEach(input => input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(lookup, 300);
+    }));
+    lookup();
+}
+
+function attachAttachmentSearch() {
+    // Find requests by the text inside their attached quotes and proposals
+    const input = document.getElementById('attachmentSearch');
+    const results = document.getElementById('attachmentSearchResults');
+    if (!input || !results) return;
+    
+    let timer = null;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const query = input.value.trim();
+            if (!query) {
+                results.innerHTML = '';
+                return;
+            }
+            fetch(`/attachments/search/?q=${encodeURIComponent(query)}`, {
+                headers: {'X-Requested-With': 'XMLHttpRequest'}
+            })
+            .then(response => response.json())
+            .then(data => {
+                results.innerHTML = '';
+                if (!data.results.length) {
+                    results.innerHTML = '<p class="empty-message">No attachments match.</p>';
+                    return;
+                }
+                data.results.forEach(match => {
+                    const item = document.createElement('div');
+                    item.className = 'request-item';
+                    item.addEventListener('click', () => openRequestModal(match.id, match.is_triage));
+                    const header = document.createElement('div');
+                    header.className = 'request-header';
+                    const title = document.createElement('h3');
+                    title.className = 'request-title';
+                    title.textContent = match.title;
+                    const info = document.createElement('span');
+                    info.className = 'request-id';
+                    info.textContent = `#${match.request_id} · ${match.stage}`;
+                    header.append(title, info);
+                    item.appendChild(header);
+                    results.appendChild(item);
+                });
+            })
+            .catch(error => console.error('Error searching attachments:', error));
+        }, 250);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', attachAttachmentSearch);
+
+function handleEditConflict(form, conflict) {
+    // Someone else saved first: show what they changed and let the user pick a side
+    const lines = Object.values(conflict.changes || {}).map(change =>
+        `${change.label}: now "${change.current}" (yours: "${change.yours}")`
+    );
+    const message = `${conflict.error}\n\n${lines.join('\n')}\n\n` +
+        'Press OK to load their version (your unsaved edits are discarded), ' +
+        'or Cancel to keep your edits and overwrite theirs on the next save.';
+    if (confirm(message)) {
+        const match = form.getAttribute('action').match(/edit-request\/(\d+)/);
+        openRequestModal(match[1], true);
+    } else {
+        form.elements['version'].value = conflict.version;
+        // The next conflict is reported against the version just reviewed
+        setInitialValues(form, conflict.initial);
+    }
+}
+
+function setInitialValues(form, values) {
+    // Hidden initial-* inputs hold the values the form's version had
+    Object.entries(values || {}).forEach(([name, value]) => {
+        const input = form.elements[`initial-${name}`];
+        if (input) {
+            input.value = value;
+        }
+    });
+}
+
+function applyFormDelta(form, delta) {
+    // Update changed field values with the normalized values the server saved
+    Object.entries(delta.fields || {}).forEach(([name, value]) => {
+        const input = form.elements[name];
+        if (input) {
+            input.value = value;
+        }
+    });
+    setInitialValues(form, delta.fields);
+    
+    const changeHistory = document.getElementById('changeHistory');
+    if (changeHistory && delta.change_history && delta.change_history.length) {
+        const emptyMsg = changeHistory.querySelector('.no-history-message');
+        if (emptyMsg) {
+            emptyMsg.remove();
+        }
+        // Newest first, matching the server-rendered order
+        delta.change_history.slice().reverse().forEach(change => {
+            const item = document.createElement('div');
+            item.className = 'change-item';
+            item.setAttribute('data-timestamp', change.changed_at);
+            item.innerHTML = `
+                <div class="change-header">
+                    <span class="change-author">${escapeHtml(change.changed_by)}</span>
+                    <span class="change-timestamp" data-utc="${change.changed_at}"></span>
+                </div>
+                <div class="change-details">
+                    <div class="change-field-name">${escapeHtml(change.field_name)}</div>
+                    <div class="change-values">
+                        <div class="change-old">
+                            <span class="change-label">From:</span>
+                            <span class="change-value">${escapeHtml(change.old_value || '(empty)')}</span>
+                        </div>
+                        <div class="change-arrow">→</div>
+                        <div class="change-new">
+                            <span class="change-label">To:</span>
+                            <span class="change-value">${escapeHtml(change.new_value || '(empty)')}</span>
+                        </div>
+                    </div>
+                </div>
+            `;
+            changeHistory.prepend(item);
+        });
+    }
+    
+    const notesHistory = document.getElementById('triageNotesHistory');
+    if (notesHistory && delta.triage_notes_history && delta.triage_notes_history.length) {
+        const emptyMsg = notesHistory.querySelector('.no-history-message');
+        if (emptyMsg) {
+            emptyMsg.remove();
+        }
+        delta.triage_notes_history.slice().reverse().forEach(note => {
+            const item = document.createElement('div');
+            item.className = 'history-item';
+            item.setAttribute('data-timestamp', note.submitted_at);
+            const paragraphs = note.notes.split(/\n{2,}/).map(p => `<p>${escapeHtml(p).replace(/\n/g, '<br>')}</p>`).join('');
+            item.innerHTML = `
+                <div class="history-header">
+                    <span class="history-author">${escapeHtml(note.submitted_by)}</span>
+                    <span class="history-timestamp" data-utc="${note.submitted_at}"></span>
+                </div>
+                <div class="history-content">${paragraphs}</div>
+            `;
+            notesHistory.prepend(item);
+        });
+    }
+    
+    updateTimestampsToLocal();
+    updateChangeHistoryTimestamps();
+}
+
+function attachFileUploadHandler() {
+    const fileUploadArea = document.getElementById('fileUploadArea');
+    const fileInput = document.getElementById('fileInput');
+    const attachmentsList = document.getElementById('attachmentsList');
+    
+    if (!fileUploadArea || !fileInput) return;
+    
+    const requestId = fileUploadArea.getAttribute('data-request-id');
+    
+    // Click to browse
+    fileUploadArea.addEventListener('click', function(e) {
+        // Don't trigger if clicking on attachment items or links
+        if (!e.target.closest('.attachment-item') && !e.target.closest('.attachment-link')) {
+            fileInput.click();
+        }
+    });
+    
+    // File input change
+    fileInput.addEventListener('change', function(e) {
+        handleFiles(e.target.files, requestId, attachmentsList);
+        // Clear the input so the same file can be uploaded again if needed
+        fileInput.value = '';
+    });
+    
+    // Drag and drop
+    fileUploadArea.addEventListener('dragover', function(e) {
+        e.preventDefault();
+        e.stopPropagation();
+        fileUploadArea.classList.add('drag-over');
+    });
+    
+    fileUploadArea.addEventListener('dragleave', function(e) {
+        e.preventDefault();
+        e.stopPropagation();
+        fileUploadArea.classList.remove('drag-over');
+    });
+    
+    fileUploadArea.addEventListener('drop', function(e) {
+        e.preventDefault();
+        e.stopPropagation();
+        fileUploadArea.classList.remove('drag-over');
+        
+        const files = e.dataTransfer.files;
+        if (files.length > 0) {
+            handleFiles(files, requestId, attachmentsList);
+        }
+    });
+}
+
+function handleFiles(files, requestId, attachmentsList) {
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    const MAX_FILES = 5;
+    const MAX_FILE_SIZE = 10 * 1024 * 1024; // 10MB in bytes
+    
+    // Check current attachment count
+    const currentAttachments = attachmentsList.querySelectorAll('.attachment-item').length;
+    const filesArray = Array.from(files);
+    
+    // Check total file count
+    if (currentAttachments + filesArray.length > MAX_FILES) {
+        alert(`You can only upload up to ${MAX_FILES} files total. You currently have ${currentAttachments} file(s).`);
+        return;
+    }
+    
+    // Check file sizes
+    const oversizedFiles = filesArray.filter(file => file.size > MAX_FILE_SIZE);
+    if (oversizedFiles.length > 0) {
+        const fileNames = oversizedFiles.map(f => f.name).join(', ');
+        alert(`The following file(s) exceed the 10MB limit: ${fileNames}`);
+        return;
+    }
+    
+    filesArray.forEach(file => {
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('csrfmiddlewaretoken', csrfToken);
+        
+        fetch(`/upload-attachment/${requestId}/`, {
+            method: 'POST',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                addAttachmentToList(data.attachment, attachmentsList);
+            } else {
+                alert('Error uploading file: ' + (data.error || 'Unknown error'));
+            }
+        })
+        .catch(error => {
+            console.error('Error uploading file:', error);
+            alert('Error uploading file. Please try again.');
+        });
+    });
+}
+
+function addAttachmentToList(attachment, attachmentsList) {
+    // Remove "no attachments" message if it exists
+    const noAttachmentsMsg = attachmentsList.querySelector('.no-attachments-message');
+    if (noAttachmentsMsg) {
+        noAttachmentsMsg.remove();
+    }
+    
+    const attachmentItem = document.createElement('div');
+    attachmentItem.className = 'attachment-item';
+    attachmentItem.setAttribute('data-attachment-id', attachment.id);
+    attachmentItem.innerHTML = `
+        <span class="attachment-name">${escapeHtml(attachment.filename)}</span>
+        <div class="attachment-actions">
+            <a href="${attachment.url}" target="_blank" class="attachment-link">View</a>
+            <button type="button" class="attachment-delete" onclick="deleteAttachment(${attachment.id})">Delete</button>
+        </div>
+    `;
+    attachmentsList.appendChild(attachmentItem);
+}
+
+function deleteAttachment(attachmentId) {
+    if (!confirm('Are you sure you want to delete this attachment?')) {
+        return;
+    }
+    
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', csrfToken);
+    
+    fetch(`/delete-attachment/${attachmentId}/`, {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            const attachmentsList = document.getElementById('attachmentsList');
+            const attachmentItem = attachmentsList.querySelector(`[data-attachment-id="${attachmentId}"]`);
+            if (attachmentItem) {
+                attachmentItem.remove();
+                
+                // Show "no attachments" message if list is empty
+                if (attachmentsList.querySelectorAll('.attachment-item').length === 0) {
+                    const noAttachmentsMsg = document.createElement('p');
+                    noAttachmentsMsg.className = 'no-attachments-message';
+                    noAttachmentsMsg.textContent = 'No attachments uploaded yet.';
+                    attachmentsList.appendChild(noAttachmentsMsg);
+                }
+            }
+        } else {
+            alert('Error deleting attachment: ' + (data.error || 'Unknown error'));
+        }
+    })
+    .catch(error => {
+        console.error('Error deleting attachment:', error);
+        alert('Error deleting attachment. Please try again.');
+    });
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function updateTimestampsToLocal() {
+    // Update all history timestamps to local time
+    const timestamps = document.querySelectorAll('.history-timestamp[data-utc]');
+    timestamps.forEach(timestamp => {
+        const utcString = timestamp.getAttribute('data-utc');
+        if (utcString) {
+            const date = new Date(utcString);
+            const localString = date.toLocaleString('en-US', {
+                year: 'numeric',
+                month: 'short',
+                day: 'numeric',
+                hour: '2-digit',
+                minute: '2-digit',
+                second: '2-digit',
+                hour12: false
+            });
+            timestamp.textContent = localString;
+        }
+    });
+}
+
+function updateChangeHistoryTimestamps() {
+    // Update all change history timestamps to local time
+    const timestamps = document.querySelectorAll('.change-timestamp[data-utc]');
+    timestamps.forEach(timestamp => {
+        const utcString = timestamp.getAttribute('data-utc');
+        if (utcString) {
+            const date = new Date(utcString);
+            const localString = date.toLocaleString('en-US', {
+                year: 'numeric',
+                month: 'short',
+                day: 'numeric',
+                hour: '2-digit',
+                minute: '2-digit',
+                second: '2-digit',
+                hour12: false
+            });
+            timestamp.textContent = localString;
+        }
+    });
+}
+
+function closeRequestModal() {
+    const modal = document.getElementById('requestModal');
+    modal.style.display = 'none';
+}
+
+let currentDeleteRequestId = null;
+
+function showDeleteConfirmation(requestId) {
+    currentDeleteRequestId = requestId;
+    const modal = document.getElementById('deleteConfirmModal');
+    const reasonInput = document.getElementById('deleteReason');
+    const errorDiv = document.getElementById('deleteReasonError');
+    
+    // Reset form
+    reasonInput.value = '';
+    errorDiv.style.display = 'none';
+    reasonInput.classList.remove('error');
+    
+    modal.style.display = 'block';
+}
+
+function closeDeleteConfirmModal() {
+    const modal = document.getElementById('deleteConfirmModal');
+    modal.style.display = 'none';
+    currentDeleteRequestId = null;
+}
+
+function confirmDelete() {
+    const reasonInput = document.getElementById('deleteReason');
+    const errorDiv = document.getElementById('deleteReasonError');
+    const reason = reasonInput.value.trim();
+    
+    // Validate reason
+    if (!reason) {
+        errorDiv.style.display = 'block';
+        reasonInput.classList.add('error');
+        reasonInput.focus();
+        return;
+    }
+    
+    // Disable button to prevent double submission
+    const confirmBtn = event.target;
+    confirmBtn.disabled = true;
+    confirmBtn.textContent = 'Archiving...';
+    
+    // Send delete request
+    fetch(`/archive-request/${currentDeleteRequestId}/`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken'),
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify({
+            reason: reason
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // Close modals and reload page or update UI
+            closeDeleteConfirmModal();
+            closeRequestModal();
+            // Reload the page to reflect changes
+            window.location.reload();
+        } else {
+            alert('Error archiving request: ' + (data.error || 'Unknown error'));
+            confirmBtn.disabled = false;
+            confirmBtn.textContent = 'Archive Request';
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Error archiving request. Please try again.');
+        confirmBtn.disabled = false;
+        confirmBtn.textContent = 'Archive Request';
+    });
+}
+
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Close delete confirmation modal when clicking outside
+document.addEventListener('click', function(event) {
+    const deleteModal = document.getElementById('deleteConfirmModal');
+    const requestModal = document.getElementById('requestModal');
+    if (event.target === deleteModal) {
+        closeDeleteConfirmModal();
+    }
+    if (event.target === requestModal) {
+        closeRequestModal();
+    }
+});
+
+// Close modal when clicking outside of it
+document.addEventListener('click', function(event) {
+    const modal = document.getElementById('requestModal');
+    if (event.target == modal) {
+        modal.style.display = 'none';
+    }
+});
@@ -0,0 +1,101 @@
+import gzip
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always produced
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.html', '.xml', '.map')
+
+# Comments are dropped; quoted strings and unquoted url() values are copied through untouched
+CSS_TOKEN_RE = re.compile(r"""(/\*.*?\*/)|("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|url\(\s*[^)'"\s]*\s*\))""", re.DOTALL)
+CSS_WHITESPACE_RE = re.compile(r'\s+')
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,>])\s*')
+
+
+def _minify_css_code(code):
+    code = CSS_WHITESPACE_RE.sub(' ', code)
+    code = CSS_PUNCTUATION_RE.sub(r'\1', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(content):
+    """Strip comments and collapse whitespace. Conservative: never rewrites values or strings."""
+    parts = []
+    position = 0
+    for match in CSS_TOKEN_RE.finditer(content):
+        parts.append(_minify_css_code(content[position:match.start()]))
+        if match.group(2):
+            parts.append(match.group(2))
+        position = match.end()
+    parts.append(_minify_css_code(content[position:]))
+    return ''.join(parts).strip()
+
+
+def minify_js(content):
+    """Minify JavaScript with rjsmin when it is installed; otherwise leave it unchanged."""
+    try:
+        import rjsmin
+    except ImportError:
+        return content
+    return rjsmin.jsmin(content)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also minifies CSS/JS files before they are
+    hashed, so each fingerprint names the bytes that are served, and writes .gz
+    (and .br, when brotli is installed) siblings at collectstatic time, so the
+    server never compresses assets per request.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = {name: self._minify_source(name, storage, path) for name, (storage, path) in paths.items()}
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        for name in self.hashed_files.values():
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as source:
+                content = source.read()
+            self._save_compressed(f'{name}.gz', gzip.compress(content, compresslevel=9, mtime=0), content)
+            if brotli is not None:
+                self._save_compressed(f'{name}.br', brotli.compress(content), content)
+
+    def _minify_source(self, name, storage, path):
+        """
+        Replace the collected copy of `name` with its minified content and return
+        the (storage, path) hashing should read it from: that copy, or the source
+        unchanged when there is nothing to minify.
+        """
+        with storage.open(path) as source:
+            content = source.read()
+        minified = self.minify(name, content)
+        if minified == content:
+            return storage, path
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(minified))
+        return self, name
+
+    def minify(self, name, content):
+        if name.endswith('.css'):
+            return minify_css(content.decode('utf-8')).encode('utf-8')
+        if name.endswith('.js'):
+            return minify_js(content.decode('utf-8')).encode('utf-8')
+        return content
+
+    def _save_compressed(self, name, compressed, original):
+        # Skip variants that do not actually save bytes
+        if len(compressed) >= len(original):
+            return
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(compressed))
@@ -0,0 +1,27 @@
+"""Background job handlers. Imported in AppConfig.ready() so every worker has them registered."""
+from django.core.files.storage import default_storage
+
+from .extraction import index_attachment
+from .jobs import job
+from .models import RequestAttachment
+from .previews import generate_preview
+
+
+@job('delete_stored_file')
+def delete_stored_file(name):
+    """Remove an uploaded file from storage once its database row is gone."""
+    default_storage.delete(name)
+
+
+@job('extract_attachment_text')
+def extract_attachment_text(attachment_id):
+    """Index the text of a newly uploaded attachment; identical files reuse the cached text."""
+    index_attachment(attachment_id)
+
+
+@job('generate_attachment_preview')
+def generate_attachment_preview(attachment_id):
+    """Render the thumbnail shown in the request modal; skipped if the attachment is gone."""
+    attachment = RequestAttachment.objects.filter(id=attachment_id).first()
+    if attachment is not None:
+        generate_preview(attachment)
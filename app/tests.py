@@ -1,3 +1,1607 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from datetime import timedelta
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Group, User
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import F
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics
+from .archival import load_archived_request, move_archived_requests, restore_archived_request
+from .backends import CachedModelBackend, get_group_names
+from .counters import COUNTER_FIELDS, count_actual, reconcile_counters
+from .departments import canonicalize_departments, invalidate_departments
+from .duplicates import BANDS, backfill_duplicate_index, find_duplicates
+from .events import record_events, state_as_of
+from .extraction import backfill_attachment_text, extract_file, search_requests
+from .jobs import Heartbeat, claim_jobs, enqueue, job, requeue_stale_jobs, run_job, run_pending_jobs
+from .instrumentation import get_query_budget, record_queries
+from .history import delete_unreferenced_values, rollup_history, storage_report
+from .notifications import send_stage_digests
+from .previews import REFILL_CURSOR_KEY, Image, evict, generate_preview, preview_key, preview_path, requeue_missing_previews, touch
+from .models import ArchivedRequest, AttachmentText, Department, HistoryValue, Job, Request, RequestEvent, RequestProfile, RequestSimilarityBand, RequestSnapshot, StageNotification, RequestAttachment, RequestChangeHistory, RequestHistorySummary
+from .seeding import seed_dataset
+from .storage import minify_css
+from .throttling import check_throttle_cache
+from .transitions import bulk_transition
+
+
+class QueryBudgetTestMixin:
+    """Assert that a view stays within the query budget declared in settings.QUERY_BUDGETS."""
+
+    def assertWithinQueryBudget(self, view_name, make_request):
+        budget = get_query_budget(view_name)
+        with record_queries() as recorder:
+            response = make_request()
+        self.assertLessEqual(
+            recorder.count,
+            budget['queries'],
+            f'{view_name} ran {recorder.count} queries (budget {budget["queries"]}). '
+            f'Slowest ({recorder.slowest_time_ms:.1f}ms): {recorder.slowest_sql}',
+        )
+        return response
+
+
+class ViewQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Every view must stay within its declared query budget on a large seeded dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=20, num_requests=2000, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.end_user = seeded['end_users'][0]
+        cls.admin = User.objects.create_superuser('admin', password='pw')
+        cls.triage_request = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).first()
+        cls.governance_request = Request.objects.filter(stage=Request.STAGE_UNDER_REVIEW_GOVERNANCE).first()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def ajax(self, method, url, **kwargs):
+        return getattr(self.client, method)(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest', **kwargs)
+
+    def test_index_as_triage_lead(self):
+        self.client.force_login(self.lead)
+        response = self.assertWithinQueryBudget('index', lambda: self.client.get(reverse('index')))
+        self.assertEqual(response.status_code, 200)
+
+    def test_index_as_end_user(self):
+        self.client.force_login(self.end_user)
+        response = self.assertWithinQueryBudget('index', lambda: self.client.get(reverse('index')))
+        self.assertEqual(response.status_code, 200)
+
+    def test_view_governance_request(self):
+        self.client.force_login(self.lead)
+        url = reverse('view_request', args=[self.governance_request.id])
+        response = self.assertWithinQueryBudget('view_request', lambda: self.ajax('get', url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_request_get(self):
+        self.client.force_login(self.lead)
+        url = reverse('edit_request', args=[self.triage_request.id])
+        response = self.assertWithinQueryBudget('edit_request', lambda: self.ajax('get', url))
+        self.assertIn('form_html', response.json())
+
+    def test_edit_request_post(self):
+        self.client.force_login(self.lead)
+        url = reverse('edit_request', args=[self.triage_request.id])
+        data = {
+            'title': 'Updated title',
+            'description': 'Updated description',
+            'department': 'Updated department',
+            'stage': Request.STAGE_UNDER_REVIEW_TRIAGE,
+            'request_type': Request.TYPE_IT_GOVERNANCE,
+            'priority': Request.PRIORITY_HIGH,
+            'triage_notes': 'Updated notes',
+            'version': self.triage_request.version,
+        }
+        response = self.assertWithinQueryBudget('edit_request', lambda: self.ajax('post', url, data=data))
+        self.assertTrue(response.json()['success'])
+
+    def test_archive_request(self):
+        self.client.force_login(self.lead)
+        url = reverse('archive_request', args=[self.triage_request.id])
+        response = self.assertWithinQueryBudget('archive_request', lambda: self.ajax(
+            'post', url, data=json.dumps({'reason': 'Duplicate'}), content_type='application/json',
+        ))
+        self.assertTrue(response.json()['success'])
+
+    def test_upload_attachment(self):
+        self.client.force_login(self.lead)
+        url = reverse('upload_attachment', args=[self.triage_request.id])
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.assertWithinQueryBudget('upload_attachment', lambda: self.ajax(
+                'post', url, data={'file': SimpleUploadedFile('quote.txt', b'quote')},
+            ))
+        self.assertTrue(response.json()['success'])
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics(self):
+        response = self.assertWithinQueryBudget(
+            'metrics', lambda: self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape'),
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_request_changelist(self):
+        self.client.force_login(self.admin)
+        response = self.assertWithinQueryBudget(
+            'admin:app_request_changelist', lambda: self.client.get(reverse('admin:app_request_changelist')),
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('enduser', password='pw')
+
+    @override_settings(QUERY_BUDGETS={'index': {'queries': 1}}, QUERY_BUDGET_HEADERS=True)
+    def test_over_budget_view_is_logged_and_flagged(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('app.query_budget', level='WARNING') as logs:
+            response = self.client.get(reverse('index'))
+        self.assertIn('Query budget exceeded for index', logs.output[0])
+        self.assertIn('X-Query-Budget-Exceeded', response)
+        self.assertGreater(int(response['X-DB-Query-Count']), 1)
+
+
+class EditRequestDeltaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).first()
+
+    def post(self, **overrides):
+        data = {
+            'title': self.request_obj.title,
+            'description': self.request_obj.description,
+            'department': self.request_obj.department,
+            'stage': self.request_obj.stage,
+            'request_type': self.request_obj.request_type,
+            'priority': self.request_obj.priority,
+            'triage_notes': self.request_obj.triage_notes,
+            'version': self.request_obj.version,
+        }
+        # The rendered form's hidden initial inputs: the values at the version it was opened at
+        data.update({f'initial-{field}': value for field, value in data.items() if field != 'version'})
+        data.update(overrides)
+        return self.client.post(
+            reverse('edit_request', args=[self.request_obj.id]), data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_X_RESPONSE_MODE='delta',
+        )
+
+    def test_delta_contains_only_changed_fields_and_new_history(self):
+        self.client.force_login(self.lead)
+        new_priority = Request.PRIORITY_TOP if self.request_obj.priority != Request.PRIORITY_TOP else Request.PRIORITY_LOW
+        payload = self.post(priority=new_priority, triage_notes='New note').json()
+
+        self.assertTrue(payload['success'])
+        self.assertNotIn('form_html', payload)
+        self.assertEqual(payload['delta']['fields'], {'priority': new_priority, 'triage_notes': 'New note', 'version': 2})
+        self.assertEqual([c['field_name'] for c in payload['delta']['change_history']], ['Priority'])
+        # History shows labels ('Top'), not the stored integer codes
+        self.assertEqual(payload['delta']['change_history'][0]['new_value'], Request.choice_label('priority', new_priority))
+        self.assertEqual([n['notes'] for n in payload['delta']['triage_notes_history']], ['New note'])
+
+    def test_stage_leaving_triage_falls_back_to_full_render(self):
+        self.client.force_login(self.lead)
+        payload = self.post(stage=Request.STAGE_UNDER_REVIEW_GOVERNANCE).json()
+        self.assertIn('form_html', payload)
+        self.assertNotIn('delta', payload)
+
+    def test_stale_version_gets_409_with_their_changes(self):
+        self.client.force_login(self.lead)
+        original_priority = self.request_obj.priority
+        self.assertTrue(self.post(title='Their title').json()['success'])
+
+        # Second save still carries version 1
+        response = self.post(priority=Request.PRIORITY_LOW if original_priority != Request.PRIORITY_LOW else Request.PRIORITY_HIGH)
+        self.assertEqual(response.status_code, 409)
+        payload = response.json()
+        self.assertTrue(payload['conflict'])
+        self.assertEqual(payload['version'], 2)
+        # Only what the other user changed: priority is this user's own edit
+        self.assertEqual(list(payload['changes']), ['title'])
+        self.assertEqual(payload['changes']['title']['current'], 'Their title')
+        self.assertEqual(payload['initial']['title'], 'Their title')
+        current = Request.objects.get(id=self.request_obj.id)
+        self.assertEqual((current.title, current.priority), ('Their title', original_priority))
+
+    def test_conflicting_choice_fields_are_described_by_labels(self):
+        self.client.force_login(self.lead)
+        original_priority = self.request_obj.priority
+        other_priority = Request.PRIORITY_LOW if original_priority != Request.PRIORITY_LOW else Request.PRIORITY_HIGH
+        self.assertTrue(self.post(priority=other_priority).json()['success'])
+
+        changes = self.post(title='My title').json()['changes']
+        self.assertEqual(list(changes), ['priority'])
+        self.assertEqual(changes['priority']['current'], Request.choice_label('priority', other_priority))
+        self.assertEqual(changes['priority']['yours'], Request.choice_label('priority', original_priority))
+
+    def test_save_writes_only_edited_columns(self):
+        self.client.force_login(self.lead)
+        with CaptureQueriesContext(connection) as queries:
+            self.post(title='Only the title')
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "app_request"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertIn('"version" = 1', updates[0])
+
+
+class StaticPipelineTests(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+
+    def test_collectstatic_output_is_fingerprinted_compressed_and_immutable(self):
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'app.storage.CompressedManifestStaticFilesStorage'},
+        }
+        with override_settings(STATIC_ROOT=self.static_root, STORAGES=storages), \
+                modify_settings(MIDDLEWARE={'prepend': 'app.middleware.PrecompressedStaticMiddleware'}):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            hashed_name = staticfiles_storage.stored_name('app/js/index.js')
+            self.assertNotEqual(hashed_name, 'app/js/index.js')
+
+            response = self.client.get(f'/static/{hashed_name}', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn(b'openRequestModal', gzip.decompress(b''.join(response.streaming_content)))
+
+            response = self.client.get('/static/app/js/index.js')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_fingerprint_is_the_hash_of_the_served_bytes(self):
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'app.storage.CompressedManifestStaticFilesStorage'},
+        }
+        with override_settings(STATIC_ROOT=self.static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            for name in ('app/css/style.css', 'app/js/index.js'):
+                hashed_name = staticfiles_storage.stored_name(name)
+                with staticfiles_storage.open(hashed_name) as served:
+                    content = served.read()
+                self.assertEqual(hashed_name.rsplit('.', 2)[1], hashlib.md5(content).hexdigest()[:12])
+                if name.endswith('.css'):
+                    # JS is only minified when rjsmin is installed
+                    with open(finders.find(name), 'rb') as source:
+                        self.assertLess(len(content), len(source.read()))
+
+    def test_minify_css_leaves_strings_and_urls_alone(self):
+        css = '/* note */\na , b { content: "a , b" ; background: url("x ;y") ; }\n.q { font-family: \'A ; B\' , serif }'
+        self.assertEqual(
+            minify_css(css),
+            'a,b{content: "a , b";background: url("x ;y")}.q{font-family: \'A ; B\',serif}',
+        )
+
+
+class CachedUserBackendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='Triage Group')
+        cls.user = User.objects.create_user('reviewer', password='pw')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+
+    def test_cached_user_needs_no_queries(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+            self.assertEqual(get_group_names(user), frozenset())
+
+    def test_group_membership_change_invalidates_cache(self):
+        self.backend.get_user(self.user.pk)
+        self.group.user_set.add(self.user)
+        self.assertEqual(get_group_names(self.backend.get_user(self.user.pk)), {'Triage Group'})
+        self.user.groups.clear()
+        self.assertEqual(get_group_names(self.backend.get_user(self.user.pk)), frozenset())
+
+    def test_user_save_and_group_rename_invalidate_cache(self):
+        self.user.groups.add(self.group)
+        self.backend.get_user(self.user.pk)
+        User.objects.get(pk=self.user.pk).save(update_fields=['first_name'])
+        self.group.name = 'Triage Group Lead'
+        self.group.save()
+        self.assertEqual(get_group_names(self.backend.get_user(self.user.pk)), {'Triage Group Lead'})
+
+
+    def test_sessions_created_by_model_backend_stay_valid(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+
+@override_settings(LOGIN_THROTTLE_USERNAME_LIMIT=3, LOGIN_THROTTLE_IP_LIMIT=5)
+class LoginTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('requester', password='correct horse')
+
+    def setUp(self):
+        caches['throttle'].clear()
+
+    def login(self, username='requester', password='correct horse', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_login_hashes_password_once(self):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as check:
+            response = self.login()
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        check.assert_called_once()
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+
+    def test_failed_login_hashes_password_once(self):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as check:
+            self.assertEqual(self.login(password='wrong').status_code, 200)
+        check.assert_called_once()
+
+    def test_username_throttle_rejects_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login(password='wrong').status_code, 200)
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as check:
+            # Even the right password is refused, from any address, until the window passes
+            self.assertEqual(self.login(ip='10.0.0.2').status_code, 429)
+            self.assertEqual(self.login(username='REQUESTER', ip='10.0.0.3').status_code, 429)
+        check.assert_not_called()
+
+    def test_success_resets_username_count(self):
+        self.login(password='wrong')
+        self.login(password='wrong')
+        self.assertEqual(self.login().status_code, 302)
+        self.client.logout()
+        self.login(password='wrong')
+        self.assertEqual(self.login().status_code, 302)
+
+    def test_ip_throttle(self):
+        for n in range(5):
+            self.login(username=f'guess{n}', password='wrong')
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.login(ip='10.0.0.9').status_code, 302)
+
+    def test_failures_are_counted_in_the_throttle_cache(self):
+        for _ in range(3):
+            self.login(password='wrong')
+        cache.clear()  # the counts are not in the default cache
+        self.assertEqual(self.login().status_code, 429)
+        caches['throttle'].clear()
+        self.assertEqual(self.login().status_code, 302)
+
+    def test_shared_throttle_cache_required_in_production(self):
+        with self.settings(LOGIN_THROTTLE_REQUIRE_SHARED_CACHE=True):
+            with self.assertRaises(ImproperlyConfigured):
+                check_throttle_cache()
+            with self.settings(CACHES={**settings.CACHES, 'throttle': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost',
+            }}):
+                check_throttle_cache()
+
+
+class ColdStorageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=14, write_files=False)
+        cls.lead = seeded['leads'][0]
+
+    def age_archived_requests(self, days):
+        Request.objects.filter(stage=Request.STAGE_ARCHIVED).update(updated_at=timezone.now() - timedelta(days=days))
+
+    def test_old_archived_requests_move_with_history_and_read_through(self):
+        self.age_archived_requests(365)
+        archived = Request.objects.filter(stage=Request.STAGE_ARCHIVED).first()
+        history_count = archived.change_history.count()
+
+        self.assertEqual(move_archived_requests(older_than_days=180, batch_size=1), 2)
+        self.assertFalse(Request.objects.filter(stage=Request.STAGE_ARCHIVED).exists())
+        self.assertFalse(RequestChangeHistory.objects.filter(request_id=archived.id).exists())
+
+        cold = load_archived_request(archived.id)
+        self.assertEqual(cold['request'].title, archived.title)
+        self.assertEqual(len(cold['change_history']), history_count)
+
+        self.client.force_login(self.lead)
+        response = self.client.get(reverse('view_request', args=[archived.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(response, archived.title)
+
+    def test_recent_archived_requests_stay_hot(self):
+        self.age_archived_requests(10)
+        self.assertEqual(move_archived_requests(older_than_days=180), 0)
+
+    def test_restore_brings_back_original_ids(self):
+        self.age_archived_requests(365)
+        archived = Request.objects.filter(stage=Request.STAGE_ARCHIVED).first()
+        history_ids = set(archived.change_history.values_list('id', flat=True))
+        move_archived_requests(older_than_days=180)
+
+        restore_archived_request(ArchivedRequest.objects.get(original_id=archived.id))
+        restored = Request.objects.get(id=archived.id)
+        self.assertEqual(restored.request_id, archived.request_id)
+        self.assertEqual(set(restored.change_history.values_list('id', flat=True)), history_ids)
+        self.assertFalse(ArchivedRequest.objects.filter(original_id=archived.id).exists())
+
+    def test_seeding_skips_numbers_held_in_cold_storage(self):
+        last = Request.objects.order_by('-request_id').first()
+        Request.objects.filter(id=last.id).update(stage=Request.STAGE_ARCHIVED)
+        self.age_archived_requests(365)
+        move_archived_requests(older_than_days=180)
+
+        seeded = seed_dataset(num_users=3, num_requests=2, write_files=False, prefix='more')
+        self.assertTrue(all(request.request_id > last.request_id for request in seeded['requests']))
+
+    def test_rolled_up_history_survives_cold_storage(self):
+        self.age_archived_requests(365)
+        archived = Request.objects.filter(stage=Request.STAGE_ARCHIVED).first()
+        history_count = archived.change_history.count()
+        RequestChangeHistory.objects.filter(request=archived).update(changed_at=timezone.now() - timedelta(days=1000))
+        rollup_history(older_than_days=730)
+        move_archived_requests(older_than_days=180)
+        self.assertFalse(RequestHistorySummary.objects.filter(request_id=archived.id).exists())
+
+        restore_archived_request(ArchivedRequest.objects.get(original_id=archived.id))
+        summary = RequestHistorySummary.objects.get(request_id=archived.id)
+        self.assertEqual(summary.change_count, history_count)
+        self.assertEqual(Request.objects.get(id=archived.id).change_count, history_count)
+
+    def test_cold_history_keeps_values_deleted_from_the_hot_tables(self):
+        self.age_archived_requests(365)
+        archived = Request.objects.filter(stage=Request.STAGE_ARCHIVED).first()
+        history = {change.id: (change.old_value, change.new_value) for change in archived.change_history.all()}
+        move_archived_requests(older_than_days=180)
+        # Unreferenced now that the history rows are cold
+        delete_unreferenced_values(HistoryValue.objects.values_list('id', flat=True))
+
+        cold = load_archived_request(archived.id)
+        with self.assertNumQueries(0):
+            self.assertEqual({change.id: (change.old_value, change.new_value) for change in cold['change_history']}, history)
+        restore_archived_request(ArchivedRequest.objects.get(original_id=archived.id))
+        restored = RequestChangeHistory.objects.filter(request_id=archived.id).select_related('old_ref', 'new_ref')
+        self.assertEqual({change.id: (change.old_value, change.new_value) for change in restored}, history)
+
+    def test_new_requests_do_not_reuse_archived_request_ids(self):
+        newest = Request.objects.order_by('-request_id').first()
+        Request.objects.filter(id=newest.id).update(
+            stage=Request.STAGE_ARCHIVED, updated_at=timezone.now() - timedelta(days=365),
+        )
+        move_archived_requests(older_than_days=180)
+        self.assertFalse(Request.objects.filter(id=newest.id).exists())
+
+        created = Request.objects.create(title='Another request', created_by=self.lead)
+        self.assertEqual(int(created.request_id), int(newest.request_id) + 1)
+        restore_archived_request(ArchivedRequest.objects.get(original_id=newest.id))
+        self.assertEqual(Request.objects.get(id=newest.id).request_id, newest.request_id)
+
+
+class CompactHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=4, history_per_request=3, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.first()
+
+    def test_values_are_stored_once_and_long_values_compressed(self):
+        long_text = 'Replace the legacy scheduling tool. ' * 20
+        first = RequestChangeHistory.record(self.request_obj, 'description', '(empty)', long_text, self.lead)
+        second = RequestChangeHistory.record(self.request_obj, 'Description', long_text, '(empty)', self.lead)
+
+        self.assertEqual(first.new_ref_id, second.old_ref_id)
+        self.assertTrue(first.new_ref.compressed)
+        self.assertLess(len(bytes(first.new_ref.data)), len(long_text))
+
+        change = RequestChangeHistory.objects.select_related('old_ref', 'new_ref').get(pk=first.pk)
+        self.assertEqual(change.field_name, 'Description')
+        self.assertEqual(change.new_value, long_text)
+
+    def test_rollup_replaces_old_rows_with_summaries(self):
+        history_count = self.request_obj.change_history.count()
+        total = RequestChangeHistory.objects.count()
+        RequestChangeHistory.objects.update(changed_at=timezone.now() - timedelta(days=1000))
+
+        self.assertEqual(rollup_history(older_than_days=730), total)
+        summary = RequestHistorySummary.objects.get(request=self.request_obj)
+        self.assertEqual(summary.change_count, history_count)
+        self.assertEqual(sum(summary.field_counts.values()), history_count)
+        self.assertFalse(RequestChangeHistory.objects.exists())
+
+    def test_rollup_deletes_values_no_row_references(self):
+        old = RequestChangeHistory.record(self.request_obj, 'title', 'Shared title', 'Short-lived title', self.lead)
+        recent = RequestChangeHistory.record(self.request_obj, 'title', 'Shared title', 'Current title', self.lead)
+        RequestChangeHistory.objects.filter(id=old.id).update(changed_at=timezone.now() - timedelta(days=1000))
+
+        self.assertEqual(rollup_history(older_than_days=730), 1)
+        self.assertFalse(HistoryValue.objects.filter(id=old.new_ref_id).exists())
+        self.assertTrue(HistoryValue.objects.filter(id=recent.old_ref_id).exists())
+        self.assertEqual(storage_report()['distinct_values'], HistoryValue.objects.count())
+
+
+class BulkTransitionTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=10, num_requests=700, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.triage_user = seeded['triage'][0]
+
+    def post_bulk(self, payload):
+        return self.client.post(reverse('bulk_transition'), json.dumps(payload), content_type='application/json')
+
+    def test_bulk_archive_is_set_based(self):
+        ids = list(Request.objects.exclude(stage=Request.STAGE_ARCHIVED).values_list('id', flat=True)[:500])
+        history_before = RequestChangeHistory.objects.count()
+        self.client.force_login(self.lead)
+
+        response = self.assertWithinQueryBudget(
+            'bulk_transition',
+            lambda: self.post_bulk({'request_ids': ids, 'stage': Request.STAGE_ARCHIVED, 'reason': 'Duplicate'}),
+        )
+        self.assertEqual(response.json()['moved'], 500)
+        self.assertEqual(Request.objects.filter(id__in=ids, stage=Request.STAGE_ARCHIVED).count(), 500)
+        self.assertEqual(RequestChangeHistory.objects.count(), history_before + 500)
+        notes = Request.objects.get(id=ids[0]).triage_notes
+        self.assertTrue(notes.startswith('Initial triage review complete.\n\n[Archived by '))
+        self.assertTrue(notes.endswith(': Duplicate'))
+
+    def test_bulk_archive_requires_reason_and_lead(self):
+        ids = list(Request.objects.exclude(stage=Request.STAGE_ARCHIVED).values_list('id', flat=True)[:3])
+        self.client.force_login(self.triage_user)
+        self.assertEqual(self.post_bulk({'request_ids': ids, 'stage': Request.STAGE_ARCHIVED, 'reason': 'x'}).status_code, 403)
+        self.client.force_login(self.lead)
+        self.assertEqual(self.post_bulk({'request_ids': ids, 'stage': Request.STAGE_ARCHIVED}).status_code, 400)
+        self.assertEqual(self.post_bulk({'request_ids': ids, 'stage': 99}).status_code, 400)
+        self.assertEqual(self.post_bulk({'request_ids': ids, 'stage': 'Somewhere'}).status_code, 400)
+
+    def test_bulk_transition_accepts_stage_names(self):
+        ids = list(Request.objects.exclude(stage=Request.STAGE_APPROVED).values_list('id', flat=True)[:2])
+        self.client.force_login(self.lead)
+        for stage in ('Approved', 'Under Review - Governance', Request.STAGE_APPROVED):
+            self.assertTrue(self.post_bulk({'request_ids': ids, 'stage': stage}).json()['success'])
+        self.assertEqual(Request.objects.filter(id__in=ids, stage=Request.STAGE_APPROVED).count(), 2)
+
+    def test_archive_request_appends_reason(self):
+        request_obj = Request.objects.exclude(stage=Request.STAGE_ARCHIVED).first()
+        self.client.force_login(self.triage_user)
+        response = self.client.post(
+            reverse('archive_request', args=[request_obj.id]), json.dumps({'reason': 'No budget'}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        request_obj.refresh_from_db()
+        self.assertEqual(request_obj.stage, Request.STAGE_ARCHIVED)
+        self.assertIn(': No budget', request_obj.triage_notes)
+        self.assertEqual(request_obj.change_history.latest('changed_at').new_value, 'Archived')
+
+
+class DepartmentTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).select_related('department').first()
+
+    def setUp(self):
+        invalidate_departments()
+        self.client.force_login(self.lead)
+
+    def post_department(self, department):
+        data = {
+            'title': self.request_obj.title,
+            'description': self.request_obj.description,
+            'department': department,
+            'stage': self.request_obj.stage,
+            'request_type': self.request_obj.request_type,
+            'priority': self.request_obj.priority,
+            'triage_notes': self.request_obj.triage_notes,
+            'version': self.request_obj.version,
+        }
+        return self.client.post(
+            reverse('edit_request', args=[self.request_obj.id]), data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_X_RESPONSE_MODE='delta',
+        )
+
+    def test_spelling_variants_share_a_canonical_name(self):
+        mapping = canonicalize_departments([
+            ('Information Technology', 5), ('information technology.', 2), ('Dept. of Informaton Technology', 1),
+            ('Office of the Registrar', 1), ('Registrar', 3), ('Library', 1), ('', 4),
+        ])
+        self.assertEqual(set(mapping.values()), {'Information Technology', 'Registrar', 'Library'})
+        self.assertEqual(mapping['Dept. of Informaton Technology'], 'Information Technology')
+        self.assertNotIn('', mapping)
+
+    def test_autocomplete_serves_cached_list(self):
+        url = reverse('department_autocomplete')
+        self.client.get(url, {'q': 'lib'})  # warm the session and department caches
+        response = self.assertWithinQueryBudget('department_autocomplete', lambda: self.client.get(url, {'q': 'lib'}))
+        self.assertEqual([result['name'] for result in response.json()['results']], ['Library'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'q': 'aff'})
+        self.assertFalse(any('app_department' in q['sql'] for q in queries.captured_queries))
+
+    def test_form_maps_variants_to_existing_department(self):
+        departments = Department.objects.count()
+        target = 'Human Resources' if self.request_obj.department.name != 'Human Resources' else 'Library'
+        payload = self.post_department(f'  {target.lower()}. ').json()
+
+        self.assertEqual(payload['delta']['fields']['department'], target)
+        self.assertEqual(Department.objects.count(), departments)
+        self.assertEqual(Request.objects.get(id=self.request_obj.id).department.name, target)
+        self.assertEqual(payload['delta']['change_history'][0]['new_value'], target)
+        self.assertEqual(len(payload['notices']), 1)
+        self.assertIn(f'"{target}"', payload['notices'][0])
+
+    def test_form_creates_unknown_department(self):
+        payload = self.post_department('Center for Teaching Excellence').json()
+        self.assertEqual(
+            Request.objects.get(id=self.request_obj.id).department,
+            Department.objects.get(name='Center for Teaching Excellence'),
+        )
+        self.assertEqual(payload['notices'], [])
+
+    def test_rejected_saves_create_no_department(self):
+        # Someone else saves first: the edit is refused with 409
+        Request.objects.filter(id=self.request_obj.id).update(version=F('version') + 1)
+        self.assertEqual(self.post_department('Center for Teaching Excellence').status_code, 409)
+        # Another field fails validation
+        with mock.patch.object(self.request_obj, 'title', 'x' * 300):
+            self.assertFalse(self.post_department('Center for Teaching Excellence').json()['success'])
+        self.assertFalse(Department.objects.filter(name='Center for Teaching Excellence').exists())
+
+    def test_admin_filters_by_department_id(self):
+        admin_user = User.objects.create_superuser('dept_admin', password='x')
+        self.client.force_login(admin_user)
+        response = self.client.get(
+            reverse('admin:app_request_changelist'), {'department__id__exact': self.request_obj.department_id},
+        )
+        self.assertContains(response, self.request_obj.request_id)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RequestCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=8, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).first()
+
+    def setUp(self):
+        self.client.force_login(self.lead)
+
+    def counters(self):
+        return Request.objects.values(*COUNTER_FIELDS).get(id=self.request_obj.id)
+
+    def upload(self):
+        return self.client.post(
+            reverse('upload_attachment', args=[self.request_obj.id]),
+            {'file': SimpleUploadedFile('quote.txt', b'quote')},
+        )
+
+    def test_seeded_counters_match_child_tables(self):
+        self.assertEqual(self.counters(), count_actual([self.request_obj.id])[self.request_obj.id])
+
+    def test_upload_limit_uses_counter(self):
+        Request.objects.filter(id=self.request_obj.id).update(attachment_count=4)
+        self.assertTrue(self.upload().json()['success'])
+        self.assertEqual(self.counters()['attachment_count'], 5)
+
+        response = self.upload()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.counters()['attachment_count'], 5)
+        self.assertEqual(RequestAttachment.objects.filter(request=self.request_obj).count(), 2)
+
+    def test_delete_attachment_decrements(self):
+        attachment_id = self.upload().json()['attachment']['id']
+        before = self.counters()['attachment_count']
+        self.client.post(reverse('delete_attachment', args=[attachment_id]))
+        self.assertEqual(self.counters()['attachment_count'], before - 1)
+
+    def test_edit_and_bulk_transition_count_history(self):
+        before = self.counters()
+        self.client.post(reverse('edit_request', args=[self.request_obj.id]), {
+            'title': 'Counted title',
+            'description': self.request_obj.description,
+            'department': self.request_obj.department.name,
+            'stage': self.request_obj.stage,
+            'request_type': self.request_obj.request_type,
+            'priority': self.request_obj.priority,
+            'triage_notes': 'Counted note',
+            'version': self.request_obj.version,
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.post(
+            reverse('bulk_transition'),
+            json.dumps({'request_ids': [self.request_obj.id], 'stage': Request.STAGE_UNDER_REVIEW_TRIAGE}),
+            content_type='application/json',
+        )
+        after = self.counters()
+        self.assertEqual(after['change_count'], before['change_count'] + 2)
+        self.assertEqual(after['triage_note_count'], before['triage_note_count'] + 1)
+
+    def test_reconcile_repairs_drift(self):
+        Request.objects.filter(id=self.request_obj.id).update(change_count=99, attachment_count=0)
+        self.assertEqual(reconcile_counters(batch_size=3), 1)
+        self.assertEqual(self.counters(), count_actual([self.request_obj.id])[self.request_obj.id])
+
+
+FLAKY_FAILURES = []
+
+
+@job('test_flaky')
+def flaky_job(fail_times):
+    FLAKY_FAILURES.append(1)
+    if len(FLAKY_FAILURES) <= fail_times:
+        raise RuntimeError('flaky')
+
+
+
+@job('test_superseded')
+def superseded_job(job_id):
+    # While this run is still going, the job is requeued as stale and claimed by another worker
+    Job.objects.filter(id=job_id).update(claimed_by='second-run')
+    raise RuntimeError('first run failed')
+
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), JOBS_BACKOFF_SECONDS=10, JOBS_MAX_ATTEMPTS=3)
+class JobTests(TestCase):
+
+    def setUp(self):
+        FLAKY_FAILURES.clear()
+
+    def make_due(self):
+        Job.objects.filter(status=Job.STATUS_QUEUED).update(run_at=timezone.now())
+
+    def test_enqueue_and_run(self):
+        queued = enqueue('test_flaky', fail_times=0)
+        self.assertEqual(run_pending_jobs(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_DONE)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_enqueue_rejects_unknown_job(self):
+        with self.assertRaises(ValueError):
+            enqueue('no_such_job')
+
+    def test_claimed_job_is_not_claimed_again(self):
+        enqueue('test_flaky', fail_times=0)
+        self.assertEqual(len(claim_jobs(5)), 1)
+        self.assertEqual(claim_jobs(5), [])
+
+    def test_retry_with_backoff_then_fail(self):
+        queued = enqueue('test_flaky', fail_times=10)
+        started = timezone.now()
+        run_pending_jobs()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_QUEUED)
+        self.assertIn('RuntimeError: flaky', queued.last_error)
+        self.assertGreaterEqual(queued.run_at, started + timedelta(seconds=10))
+        # Not due yet
+        self.assertEqual(run_pending_jobs(), 0)
+
+        self.make_due()
+        run_pending_jobs()
+        queued.refresh_from_db()
+        self.assertGreaterEqual(queued.run_at, started + timedelta(seconds=20))
+
+        self.make_due()
+        run_pending_jobs()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_FAILED)
+        self.assertEqual(queued.attempts, 3)
+
+    def test_retry_succeeds(self):
+        queued = enqueue('test_flaky', fail_times=1)
+        run_pending_jobs()
+        self.make_due()
+        run_pending_jobs()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_DONE)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_stale_running_job_is_requeued(self):
+        queued = enqueue('test_flaky', fail_times=0)
+        claim_jobs(1)
+        Job.objects.filter(id=queued.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+        self.assertEqual(run_pending_jobs(), 1)
+
+    def test_long_running_job_with_heartbeat_is_not_requeued(self):
+        queued = enqueue('test_flaky', fail_times=0)
+        (job_id,) = claim_jobs(1)
+        Job.objects.filter(id=queued.id).update(started_at=timezone.now() - timedelta(hours=1))
+        Heartbeat(job_id, Job.objects.get(id=job_id).claimed_by).beat()
+        self.assertEqual(requeue_stale_jobs(), (0, 0))
+
+    def test_job_that_keeps_killing_its_worker_fails(self):
+        queued = enqueue('test_flaky', fail_times=0, max_attempts=2)
+        for expected in [(1, 0), (0, 1)]:
+            claim_jobs(1)
+            Job.objects.filter(id=queued.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(requeue_stale_jobs(), expected)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_FAILED)
+        self.assertIn('no heartbeat', queued.last_error)
+
+    def test_outcome_of_a_superseded_run_is_discarded(self):
+        queued = enqueue('test_superseded', job_id=None)
+        Job.objects.filter(id=queued.id).update(payload={'job_id': queued.id})
+        (job_id,) = claim_jobs(1)
+        self.assertFalse(run_job(job_id))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.claimed_by, queued.last_error), (Job.STATUS_RUNNING, 'second-run', ''))
+
+    def test_delete_attachment_defers_file_removal(self):
+        seeded = seed_dataset(num_users=3, num_requests=2, write_files=False)
+        request_obj = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).first()
+        self.client.force_login(seeded['leads'][0])
+        attachment_id = self.client.post(
+            reverse('upload_attachment', args=[request_obj.id]),
+            {'file': SimpleUploadedFile('quote.txt', b'quote')},
+        ).json()['attachment']['id']
+        storage = RequestAttachment.objects.get(id=attachment_id).file.storage
+        name = RequestAttachment.objects.get(id=attachment_id).file.name
+
+        self.assertTrue(self.client.post(reverse('delete_attachment', args=[attachment_id])).json()['success'])
+        self.assertFalse(RequestAttachment.objects.filter(id=attachment_id).exists())
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(Job.objects.filter(name='delete_stored_file', payload__name=name).exists())
+
+        run_pending_jobs()
+        self.assertFalse(storage.exists(name))
+
+
+class RunJobsCommandTests(TransactionTestCase):
+
+    def test_thread_pool_drains_queue(self):
+        FLAKY_FAILURES.clear()
+        for _ in range(3):
+            enqueue('test_flaky', fail_times=0)
+        call_command('run_jobs', once=True, workers=2, stdout=StringIO())
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_DONE).count(), 3)
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOW_SECONDS=600, NOTIFICATION_BATCH_SIZE=1)
+class StageNotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=10, num_requests=20, write_files=False)
+        cls.lead = seeded['leads'][0]
+        open_requests = Request.objects.exclude(stage=Request.STAGE_ARCHIVED).exclude(created_by=cls.lead)
+        cls.requester = open_requests.first().created_by
+        cls.requests = list(open_requests.filter(created_by=cls.requester)[:2])
+        cls.other = open_requests.exclude(created_by=cls.requester).first()
+
+    def setUp(self):
+        self.client.force_login(self.lead)
+
+    def move(self, request_objs, stage):
+        self.client.post(
+            reverse('bulk_transition'),
+            json.dumps({'request_ids': [r.id for r in request_objs], 'stage': stage, 'reason': 'Digest test'}),
+            content_type='application/json',
+        )
+
+    def age_notifications(self, seconds=601):
+        StageNotification.objects.update(created_at=F('created_at') - timedelta(seconds=seconds))
+
+    def test_changes_coalesce_into_one_digest_per_recipient(self):
+        self.move(self.requests, Request.STAGE_UNDER_REVIEW_GOVERNANCE)
+        self.move(self.requests[:1], Request.STAGE_ARCHIVED)
+        self.move([self.other], Request.STAGE_ARCHIVED)
+        self.assertEqual(StageNotification.objects.filter(recipient=self.requester).count(), 3)
+        self.assertEqual(Job.objects.filter(name='send_stage_digests', status=Job.STATUS_QUEUED).count(), 1)
+
+        self.age_notifications()
+        with mock.patch('app.notifications.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_stage_digests(), 2)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 2)
+        digest = next(message for message in mail.outbox if message.to == [self.requester.email])
+        self.assertEqual(digest.subject, '2 of your requests changed stage')
+        self.assertIn(f'{self.requests[0].request_id} - ', digest.body)
+        self.assertIn('-> Archived', digest.body)
+        self.assertIn('-> Under Review - Governance', digest.body)
+        self.assertFalse(StageNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_concurrent_runs_do_not_send_duplicates(self):
+        self.move(self.requests, Request.STAGE_UNDER_REVIEW_GOVERNANCE)
+        self.age_notifications()
+        send_messages = mail.get_connection().__class__.send_messages
+        concurrent_sent = []
+
+        def send_during_other_run(connection, messages):
+            # A second job starts while the first is still handing its batch to SMTP
+            if not concurrent_sent:
+                concurrent_sent.append(send_stage_digests())
+            return send_messages(connection, messages)
+
+        with mock.patch.object(mail.get_connection().__class__, 'send_messages', send_during_other_run):
+            send_stage_digests()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(StageNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_failed_batch_stays_unsent(self):
+        self.move(self.requests, Request.STAGE_UNDER_REVIEW_GOVERNANCE)
+        self.age_notifications()
+        with mock.patch.object(mail.get_connection().__class__, 'send_messages', side_effect=OSError('SMTP down')):
+            with self.assertRaises(OSError):
+                send_stage_digests()
+        self.assertEqual(StageNotification.objects.filter(sent_at__isnull=True).count(), 2)
+
+    def test_digest_waits_for_window_and_reschedules(self):
+        self.move(self.requests[:1], Request.STAGE_APPROVED)
+        Job.objects.all().delete()
+        self.assertEqual(send_stage_digests(), 0)
+        self.assertEqual(mail.outbox, [])
+        rescheduled = Job.objects.get(name='send_stage_digests', status=Job.STATUS_QUEUED)
+        self.assertGreater(rescheduled.run_at, timezone.now() + timedelta(seconds=500))
+
+    def test_edit_request_stage_change_is_notified_via_job(self):
+        request_obj = self.requests[0]
+        Request.objects.filter(id=request_obj.id).update(stage=Request.STAGE_UNDER_REVIEW_TRIAGE)
+        request_obj.refresh_from_db()
+        response = self.client.post(reverse('edit_request', args=[request_obj.id]), {
+            'title': request_obj.title,
+            'description': request_obj.description,
+            'department': request_obj.department.name,
+            'stage': Request.STAGE_UNDER_REVIEW_GOVERNANCE,
+            'request_type': request_obj.request_type,
+            'priority': request_obj.priority,
+            'triage_notes': request_obj.triage_notes,
+            'version': request_obj.version,
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(mail.outbox, [])
+
+        self.age_notifications()
+        Job.objects.update(run_at=timezone.now())
+        run_pending_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, f'{request_obj.request_id} is now Under Review - Governance')
+
+    def test_own_changes_are_not_notified(self):
+        own = Request.objects.exclude(stage=Request.STAGE_ARCHIVED).first()
+        self.client.force_login(own.created_by)
+        own.created_by.groups.add(Group.objects.get(name='Triage Group Lead'))
+        self.move([own], Request.STAGE_ARCHIVED)
+        self.assertFalse(StageNotification.objects.exists())
+
+
+def make_docx(paragraphs):
+    """A minimal .docx file's bytes with one w:p per paragraph."""
+    namespace = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', f'<w:document xmlns:w="{namespace}"><w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AttachmentTextTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=10, num_requests=20, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.end_user = seeded['end_users'][0]
+        cls.request_obj, cls.other_request = Request.objects.filter(stage__in=Request.TRIAGE_STAGES)[:2]
+
+    def setUp(self):
+        self.client.force_login(self.lead)
+
+    def upload(self, request_obj, name, content):
+        response = self.client.post(
+            reverse('upload_attachment', args=[request_obj.id]), {'file': SimpleUploadedFile(name, content)},
+        )
+        return RequestAttachment.objects.get(id=response.json()['attachment']['id'])
+
+    def search(self, query):
+        return self.client.get(reverse('attachment_search'), {'q': query})
+
+    def test_extract_formats(self):
+        path = f'{tempfile.mkdtemp()}/proposal.docx'
+        with open(path, 'wb') as fh:
+            fh.write(make_docx(['Vendor proposal', 'Annual licence renewal']))
+        self.assertEqual(extract_file(path), ('Vendor proposal\nAnnual licence renewal', 'docx', ''))
+
+        with open(path.replace('.docx', '.png'), 'wb') as fh:
+            fh.write(b'not text')
+        self.assertEqual(extract_file(path.replace('.docx', '.png')), ('', '', ''))
+
+        with open(path, 'wb') as fh:
+            fh.write(b'not a zip')
+        text, extractor, error = extract_file(path)
+        self.assertEqual((text, extractor), ('', ''))
+        self.assertIn('BadZipFile', error)
+
+    def test_upload_is_indexed_by_worker_and_searchable(self):
+        attachment = self.upload(self.request_obj, 'quote.docx', make_docx(['Quote for Canvas integration']))
+        self.assertIsNone(attachment.text_id)
+        self.assertTrue(Job.objects.filter(name='extract_attachment_text', payload__attachment_id=attachment.id).exists())
+
+        run_pending_jobs()
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.text.extractor, 'docx')
+        self.assertEqual([r.id for r in search_requests('canvas integrations')], [self.request_obj.id])
+
+        response = self.assertWithinQueryBudget('attachment_search', lambda: self.search('Canvas'))
+        self.assertEqual([r['request_id'] for r in response.json()['results']], [self.request_obj.request_id])
+        self.assertEqual(self.search('blackboard').json()['results'], [])
+
+    def test_identical_content_is_parsed_once(self):
+        self.upload(self.request_obj, 'a.txt', b'Identical vendor quote')
+        self.upload(self.other_request, 'b.txt', b'Identical vendor quote')
+        with mock.patch('app.extraction.extract_file', wraps=extract_file) as extract:
+            run_pending_jobs()
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(AttachmentText.objects.count(), 1)
+        self.assertEqual(
+            {r.id for r in search_requests('vendor quote')}, {self.request_obj.id, self.other_request.id},
+        )
+
+    def test_search_requires_reviewer(self):
+        self.client.force_login(self.end_user)
+        self.assertEqual(self.search('quote').status_code, 403)
+
+    def test_backfill_existing_files(self):
+        seed_dataset(num_users=3, num_requests=5, attachments_per_request=1, prefix='files')
+        progress = []
+        parsed, reused = backfill_attachment_text(batch_size=2, progress=lambda *args: progress.append(args))
+        self.assertEqual((parsed, reused), (5, 0))
+        self.assertEqual(progress[-1][:2], (5, 5))
+        self.assertFalse(RequestAttachment.objects.filter(file__startswith='request_attachments/seed/files', text__isnull=True).exists())
+        self.assertEqual(search_requests('quote for request').count(), 5)
+        # Already indexed files are skipped on a second run
+        self.assertEqual(backfill_attachment_text(), (0, 0))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), ATTACHMENT_PREVIEW_ROOT=tempfile.mkdtemp())
+class AttachmentPreviewTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.filter(stage__in=Request.TRIAGE_STAGES).first()
+
+    def setUp(self):
+        self.client.force_login(self.lead)
+        for entry in os.scandir(settings.ATTACHMENT_PREVIEW_ROOT):
+            os.unlink(entry.path)
+
+    def upload(self, name, content):
+        response = self.client.post(
+            reverse('upload_attachment', args=[self.request_obj.id]), {'file': SimpleUploadedFile(name, content)},
+        )
+        return RequestAttachment.objects.get(id=response.json()['attachment']['id'])
+
+    def write_preview(self, key, size=100, age=0):
+        path = preview_path(key)
+        with open(path, 'wb') as fh:
+            fh.write(b'\xff' * size)
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_preview_served_from_cache_with_long_lived_headers(self):
+        attachment = self.upload('quote.txt', b'quote')
+        self.assertIsNone(attachment.preview_url)
+        self.write_preview(preview_key(attachment))
+
+        response = self.assertWithinQueryBudget('attachment_preview', lambda: self.client.get(attachment.preview_url))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.ATTACHMENT_PREVIEW_MAX_AGE}', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), b'\xff' * 100)
+
+        modal = self.client.get(reverse('edit_request', args=[self.request_obj.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn(attachment.preview_url, modal.json()['form_html'])
+
+        os.unlink(preview_path(preview_key(attachment)))
+        self.assertEqual(self.client.get(attachment.preview_url).status_code, 404)
+
+    def test_lru_eviction(self):
+        oldest = self.write_preview('1-1', age=3 * 7200)
+        middle = self.write_preview('2-1', age=2 * 7200)
+        newest = self.write_preview('3-1', age=7200)
+        touch(oldest, time.time())  # served recently, so it is kept
+        self.assertEqual(evict(max_bytes=250), 1)
+        self.assertTrue(os.path.exists(oldest))
+        self.assertFalse(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+        self.assertEqual(evict(max_bytes=250), 0)
+
+    def test_only_previewable_uploads_queue_a_job(self):
+        self.upload('notes.txt', b'plain text')
+        self.assertFalse(Job.objects.filter(name='generate_attachment_preview').exists())
+
+    @mock.patch('app.previews.can_preview', return_value=True)
+    def test_evicted_preview_is_requeued_by_housekeeping(self, _can_preview):
+        attachment = self.upload('diagram.png', b'png')
+        jobs = Job.objects.filter(name='generate_attachment_preview', payload__attachment_id=attachment.id)
+        self.assertEqual(jobs.count(), 1)
+        # The upload's job is still pending: housekeeping does not queue another
+        cache.delete(REFILL_CURSOR_KEY)
+        requeue_missing_previews()
+        self.assertEqual(jobs.count(), 1)
+
+        # Generated, then evicted: rendering queues nothing, the next sweep queues it once
+        jobs.delete()
+        cache.clear()
+        self.write_preview(preview_key(attachment))
+        self.assertIsNotNone(attachment.preview_url)
+        self.assertEqual(evict(max_bytes=0), 1)
+        with self.assertNumQueries(0):
+            self.assertIsNone(attachment.preview_url)
+        self.assertFalse(jobs.exists())
+        requeue_missing_previews()
+        self.assertEqual(jobs.count(), 1)
+        cache.delete(REFILL_CURSOR_KEY)
+        requeue_missing_previews()
+        self.assertEqual(jobs.count(), 1)
+
+    @mock.patch('app.previews.can_preview', return_value=True)
+    def test_no_requeue_while_the_cache_is_nearly_full(self, _can_preview):
+        self.upload('diagram.png', b'png')
+        Job.objects.all().delete()
+        cache.clear()
+        self.write_preview('999-1', size=100)
+        with self.settings(ATTACHMENT_PREVIEW_MAX_BYTES=120):
+            self.assertEqual(requeue_missing_previews(), 0)
+        self.assertEqual(requeue_missing_previews(), RequestAttachment.objects.count())
+
+    def test_unsaved_attachments_have_no_preview(self):
+        attachment = RequestAttachment(request=self.request_obj, file='request_attachments/x.png', original_filename='x.png')
+        with self.assertNumQueries(0):
+            self.assertIsNone(attachment.preview_url)
+
+    def test_deleting_attachment_removes_its_preview(self):
+        attachment = self.upload('quote.txt', b'quote')
+        path = self.write_preview(preview_key(attachment))
+        response = self.client.post(reverse('delete_attachment', args=[attachment.id]))
+        self.assertTrue(response.json()['success'])
+        self.assertFalse(os.path.exists(path))
+
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_image_thumbnail_generated_by_worker(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'navy').save(buffer, 'PNG')
+        attachment = self.upload('diagram.png', buffer.getvalue())
+        run_pending_jobs()
+        with Image.open(preview_path(preview_key(attachment))) as preview:
+            self.assertEqual(preview.size, (settings.ATTACHMENT_PREVIEW_SIZE, settings.ATTACHMENT_PREVIEW_SIZE // 2))
+        self.assertIsNone(generate_preview(self.upload('notes.txt', b'plain text')))
+
+
+@override_settings(PROFILING_DIR=tempfile.mkdtemp(), PROFILING_TOKEN='let-me-profile', PROFILING_MAX_PROFILES=2)
+class ProfilingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.governance_request = Request.objects.filter(stage=Request.STAGE_UNDER_REVIEW_GOVERNANCE).first()
+
+    def setUp(self):
+        self.client.force_login(self.lead)
+        for entry in os.scandir(settings.PROFILING_DIR):
+            os.unlink(entry.path)
+
+    def test_unprofiled_by_default_and_with_wrong_token(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('index')))
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('index'), HTTP_X_PROFILE='guess'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_token_header_profiles_request_with_breakdown(self):
+        response = self.client.get(reverse('index'), HTTP_X_PROFILE='let-me-profile')
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.view_name, profile.method, profile.status_code), ('index', 'GET', 200))
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(set(profile.breakdown), {'orm', 'template', 'view', 'other'})
+        self.assertGreater(profile.breakdown['orm'], 0)
+        self.assertGreater(profile.breakdown['template'], 0)
+        self.assertTrue(os.path.exists(os.path.join(settings.PROFILING_DIR, profile.file_name)))
+
+        admin_user = User.objects.create_superuser('profiler', password='pw')
+        self.client.force_login(admin_user)
+        page = self.client.get(reverse('admin:app_requestprofile_change', args=[profile.id]))
+        self.assertContains(page, 'cumulative')
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_VIEWS=['view_request'])
+    def test_sampling_limited_to_views(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('view_request', args=[self.governance_request.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(list(RequestProfile.objects.values_list('view_name', flat=True)), ['view_request'])
+
+    def test_storing_the_profile_is_not_counted_in_metrics(self):
+        self.client.get(reverse('index'))
+        before = metric_value('app_db_queries_total', view='index')
+        self.client.get(reverse('index'))
+        plain = metric_value('app_db_queries_total', view='index') - before
+        response = self.client.get(reverse('index'), HTTP_X_PROFILE='let-me-profile')
+        profiled = metric_value('app_db_queries_total', view='index') - before - plain
+        self.assertIn('X-Profile-Id', response)
+        self.assertEqual(profiled, plain)
+
+    def test_rotation_keeps_newest(self):
+        for _ in range(3):
+            self.client.get(reverse('index'), HTTP_X_PROFILE='let-me-profile')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(
+            sorted(os.listdir(settings.PROFILING_DIR)),
+            sorted(RequestProfile.objects.values_list('file_name', flat=True)),
+        )
+
+
+def metric_value(name, suffix='', **labels):
+    """Current value of one sample, summed over any labels not given."""
+    return sum(
+        value for (sample_name, sample_suffix, label_values), value in metrics.collect().items()
+        if sample_name == name and sample_suffix == suffix
+        and all(label_values[metric.labels.index(key)] == str(wanted)
+                for metric in metrics.REGISTRY if metric.name == name for key, wanted in labels.items())
+    )
+
+
+@override_settings(METRICS_TOKEN='scrape')
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).first()
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), **headers)
+
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+        self.client.force_login(self.lead)
+        self.assertEqual(self.scrape().status_code, 403)
+        self.client.force_login(User.objects.create_superuser('ops', password='pw'))
+        self.assertEqual(self.scrape().status_code, 200)
+
+    def test_request_metrics_and_exposition_format(self):
+        requests_before = metric_value('app_http_requests_total', view='index', status=200)
+        queries_before = metric_value('app_db_queries_total', view='index')
+        renders_before = metric_value('app_template_render_duration_seconds', '_count', template='app/index.html')
+        hits_before = metric_value('app_cache_requests_total', cache='user', result='hit')
+        self.client.force_login(self.lead)
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+
+        self.assertEqual(metric_value('app_http_requests_total', view='index', status=200), requests_before + 2)
+        self.assertGreater(metric_value('app_db_queries_total', view='index'), queries_before)
+        self.assertEqual(
+            metric_value('app_template_render_duration_seconds', '_count', template='app/index.html'), renders_before + 2,
+        )
+        self.assertGreater(metric_value('app_cache_requests_total', cache='user', result='hit'), hits_before)
+
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE app_http_request_duration_seconds histogram', body)
+        self.assertIn('app_http_request_duration_seconds_bucket{view="index",le="+Inf"}', body)
+        pending = Request.objects.filter(stage=Request.STAGE_PENDING_REVIEW).count()
+        self.assertIn(f'app_requests{{stage="Pending Review"}} {pending}\n', body)
+
+    def test_upload_metrics(self):
+        uploads_before = metric_value('app_upload_size_bytes', '_count')
+        bytes_before = metric_value('app_upload_size_bytes', '_sum')
+        self.client.force_login(self.lead)
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            self.client.post(
+                reverse('upload_attachment', args=[self.request_obj.id]),
+                {'file': SimpleUploadedFile('quote.txt', b'quote')},
+            )
+            shutil.rmtree(settings.MEDIA_ROOT)
+        self.assertEqual(metric_value('app_upload_size_bytes', '_count'), uploads_before + 1)
+        self.assertEqual(metric_value('app_upload_size_bytes', '_sum'), bytes_before + 5)
+        self.assertEqual(metric_value('app_upload_duration_seconds', '_count', status=200), uploads_before + 1)
+
+    def test_rejected_uploads_are_timed(self):
+        rejected_before = metric_value('app_upload_duration_seconds', '_count', status=400)
+        self.client.force_login(self.lead)
+        response = self.client.post(reverse('upload_attachment', args=[self.request_obj.id]), {})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(metric_value('app_upload_duration_seconds', '_count', status=400), rejected_before + 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_cumulative_seconds', 'Test histogram.', buckets=(1, 5))
+        try:
+            for value in (0.5, 1, 3, 7):
+                histogram.observe(value)
+            body = metrics.render()
+        finally:
+            metrics.REGISTRY.remove(histogram)
+        self.assertIn('test_cumulative_seconds_bucket{le="1"} 2\n', body)
+        self.assertIn('test_cumulative_seconds_bucket{le="5"} 3\n', body)
+        self.assertIn('test_cumulative_seconds_bucket{le="+Inf"} 4\n', body)
+        self.assertIn('test_cumulative_seconds_sum 11.5\n', body)
+
+    def test_worker_files_are_summed(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        with override_settings(METRICS_DIR=metrics_dir):
+            own = metric_value('app_cache_requests_total', cache='user', result='miss')
+            with open(os.path.join(metrics_dir, '1.json'), 'w') as fh:
+                json.dump([['app_cache_requests_total', '', ['user', 'miss'], 40]], fh)
+            self.assertEqual(metric_value('app_cache_requests_total', cache='user', result='miss'), own + 40)
+            self.assertIn(f'{os.getpid()}.json', os.listdir(metrics_dir))
+
+    def test_pool_stats_are_exported(self):
+        stats = {'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1, 'requests_waiting': 2,
+                 'requests_num': 30, 'requests_wait_ms': 1500}
+        checkouts_before = metric_value('app_db_pool_checkouts_total')
+        with mock.patch('app.metrics.pool_stats', return_value=stats):
+            metrics.collect()
+            stats.update(requests_num=45, pool_available=4)
+            self.assertEqual(metric_value('app_db_pool_checkouts_total'), checkouts_before + 45)
+            self.assertEqual(metric_value('app_db_pool_connections', state='in_use'), 0)
+            self.assertEqual(metric_value('app_db_pool_connections', state='idle'), 4)
+            self.assertEqual(metric_value('app_db_pool_max_connections'), 10)
+            body = metrics.render()
+        self.assertIn('# TYPE app_db_pool_connections gauge', body)
+        self.assertIn('app_db_pool_requests_waiting 2\n', body)
+
+    def test_exited_worker_files_are_folded_into_the_aggregate(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with override_settings(METRICS_DIR=metrics_dir):
+            own = metric_value('app_cache_requests_total', cache='user', result='miss')
+            for pid in (exited.pid, 99999999):
+                with open(os.path.join(metrics_dir, f'{pid}.json'), 'w') as fh:
+                    json.dump([['app_cache_requests_total', '', ['user', 'miss'], 5]], fh)
+            self.assertEqual(metric_value('app_cache_requests_total', cache='user', result='miss'), own + 10)
+            self.assertEqual(
+                sorted(name for name in os.listdir(metrics_dir) if name.endswith('.json')),
+                sorted([f'{os.getpid()}.json', metrics.AGGREGATE_FILE]),
+            )
+            # Counters keep their totals once the files are gone
+            self.assertEqual(metric_value('app_cache_requests_total', cache='user', result='miss'), own + 10)
+
+    def test_exited_worker_gauges_are_dropped(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        with override_settings(METRICS_DIR=metrics_dir):
+            gauge_before = metric_value('app_db_pool_max_connections')
+            checkouts_before = metric_value('app_db_pool_checkouts_total')
+            with open(os.path.join(metrics_dir, '99999999.json'), 'w') as fh:
+                json.dump([['app_db_pool_max_connections', '', [], 10], ['app_db_pool_checkouts_total', '', [], 7]], fh)
+            self.assertEqual(metric_value('app_db_pool_max_connections'), gauge_before)
+            self.assertEqual(metric_value('app_db_pool_checkouts_total'), checkouts_before + 7)
+
+
+class DuplicateDetectionTests(QueryBudgetTestMixin, TestCase):
+
+    TITLE = 'Replace the projector in lecture hall B'
+    DESCRIPTION = (
+        'The ceiling projector in lecture hall B flickers and shuts off after ten minutes. '
+        'Faculty need a replacement with HDMI input before the spring term starts.'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=10, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.end_user = seeded['end_users'][0]
+        backfill_duplicate_index()
+        cls.original = Request.objects.create(title=cls.TITLE, description=cls.DESCRIPTION, created_by=cls.lead)
+
+    def test_backfill_indexes_bulk_created_requests(self):
+        self.assertEqual(
+            RequestSimilarityBand.objects.values('request_id').distinct().count(), Request.objects.count(),
+        )
+        self.assertEqual(backfill_duplicate_index(), 0)
+
+    def test_near_duplicate_found_and_unrelated_text_is_not(self):
+        self.assertEqual(self.original.similarity_bands.count(), BANDS)
+        matches = find_duplicates(
+            'Replace projector in lecture hall B',
+            'The ceiling projector in lecture hall B flickers and turns off after ten minutes. '
+            'Faculty need a replacement with HDMI before the spring term.',
+        )
+        self.assertEqual(matches[0][0], self.original)
+        self.assertGreater(matches[0][1], 0.6)
+        self.assertEqual(find_duplicates(self.TITLE, self.DESCRIPTION, exclude_id=self.original.id), [])
+        self.assertEqual(find_duplicates('Payroll export fails', 'The nightly payroll export to the bank times out.'), [])
+
+    def test_over_full_buckets_are_skipped(self):
+        for _ in range(3):
+            Request.objects.create(title=self.TITLE, description=self.DESCRIPTION, created_by=self.lead)
+        self.assertEqual(len(find_duplicates(self.TITLE, self.DESCRIPTION)), 4)
+        with mock.patch('app.duplicates.MAX_BUCKET_ROWS', 3):
+            # Every bucket now holds 4 requests: all are skipped, and nothing is left to score
+            with self.assertNumQueries(1):
+                self.assertEqual(find_duplicates(self.TITLE, self.DESCRIPTION), [])
+            self.assertEqual(len(find_duplicates(self.TITLE, self.DESCRIPTION, exclude_id=self.original.id)), 3)
+
+    def test_edit_reindexes_and_stage_only_save_does_not(self):
+        bands = set(self.original.similarity_bands.values_list('id', flat=True))
+        self.original.stage = Request.STAGE_UNDER_REVIEW_TRIAGE
+        self.original.save(update_fields=['stage'])
+        self.assertEqual(set(self.original.similarity_bands.values_list('id', flat=True)), bands)
+
+        self.client.force_login(self.lead)
+        new_description = 'Student parking permits should be sold online instead of at the cashier window in person.'
+        self.client.post(reverse('edit_request', args=[self.original.id]), data={
+            'title': 'Sell parking permits online',
+            'description': new_description,
+            'department': '',
+            'stage': self.original.stage,
+            'request_type': self.original.request_type,
+            'priority': self.original.priority,
+            'triage_notes': '',
+            'version': self.original.version,
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(find_duplicates(self.TITLE, self.DESCRIPTION), [])
+        self.assertEqual(find_duplicates('Sell parking permits online', new_description)[0][0], self.original)
+
+    def test_lookup_endpoint(self):
+        self.client.force_login(self.lead)
+        response = self.assertWithinQueryBudget('duplicate_candidates', lambda: self.client.get(
+            reverse('duplicate_candidates'), {'title': self.TITLE, 'description': self.DESCRIPTION},
+        ))
+        result = response.json()['results'][0]
+        self.assertEqual((result['id'], result['similarity']), (self.original.id, 1.0))
+        response = self.client.get(
+            reverse('duplicate_candidates'),
+            {'title': self.TITLE, 'description': self.DESCRIPTION, 'exclude': self.original.id},
+        )
+        self.assertEqual(response.json()['results'], [])
+
+        self.client.force_login(self.end_user)
+        response = self.client.get(reverse('duplicate_candidates'), {'title': self.TITLE, 'description': self.DESCRIPTION})
+        self.assertEqual(response.status_code, 403)
+
+
+class PointInTimeHistoryTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_dataset(num_users=5, num_requests=5, write_files=False)
+        cls.lead = seeded['leads'][0]
+        cls.request_obj = Request.objects.create(
+            title='New scoring rubric', description='Draft rubric.', created_by=cls.lead,
+        )
+
+    def describe(self, description, at):
+        Request.objects.filter(id=self.request_obj.id).update(description=description)
+        record_events([self.request_obj.id], ['description'], self.lead, at=at)
+
+    def test_creation_snapshot(self):
+        snapshot = RequestSnapshot.objects.get(request=self.request_obj)
+        self.assertEqual((snapshot.sequence, snapshot.state['title']), (0, 'New scoring rubric'))
+        self.assertIsNone(self.request_obj.as_of(self.request_obj.created_at - timedelta(seconds=1)))
+        self.assertEqual(self.request_obj.as_of(timezone.now()).description, 'Draft rubric.')
+
+    @override_settings(HISTORY_SNAPSHOT_EVERY=3)
+    def test_as_of_replays_from_nearest_snapshot(self):
+        start = timezone.now()
+        descriptions = [f'Revision {i}: ' + 'weighting detail ' * 30 for i in range(1, 9)]
+        for i, description in enumerate(descriptions):
+            self.describe(description, start + timedelta(hours=i + 1))
+        self.assertEqual(
+            list(self.request_obj.snapshots.values_list('sequence', flat=True)), [0, 3, 6],
+        )
+        for i, description in enumerate(descriptions):
+            with self.assertNumQueries(2):
+                state = state_as_of(self.request_obj.id, start + timedelta(hours=i + 1, minutes=30))
+            self.assertEqual(state['description'], description)
+        self.assertEqual(state_as_of(self.request_obj.id, start)['description'], 'Draft rubric.')
+
+    def test_edit_request_keeps_complete_values(self):
+        self.client.force_login(self.lead)
+        description = 'Full rationale. ' * 40
+        self.client.post(reverse('edit_request', args=[self.request_obj.id]), data={
+            'title': self.request_obj.title,
+            'description': description,
+            'department': '',
+            'stage': self.request_obj.stage,
+            'request_type': self.request_obj.request_type,
+            'priority': Request.PRIORITY_TOP,
+            'triage_notes': '',
+            'version': self.request_obj.version,
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        event = RequestEvent.objects.get(request=self.request_obj)
+        self.assertEqual(event.changes, {'description': description.strip(), 'priority': Request.PRIORITY_TOP})
+        change = RequestChangeHistory.objects.get(request=self.request_obj, field_code=RequestChangeHistory.code_for('description'))
+        self.assertEqual(change.new_value, description.strip())
+
+    def test_bulk_transition_records_notes_appended_in_sql(self):
+        bulk_transition([self.request_obj.id], Request.STAGE_ARCHIVED, self.lead, reason='Superseded')
+        self.request_obj.refresh_from_db()
+        event = RequestEvent.objects.get(request=self.request_obj)
+        self.assertEqual(event.changes, {'stage': Request.STAGE_ARCHIVED, 'triage_notes': self.request_obj.triage_notes})
+
+    def test_cold_storage_round_trip_keeps_history(self):
+        bulk_transition([self.request_obj.id], Request.STAGE_ARCHIVED, self.lead, reason='Superseded')
+        Request.objects.filter(id=self.request_obj.id).update(updated_at=timezone.now() - timedelta(days=365))
+        move_archived_requests(older_than_days=180)
+        restore_archived_request(ArchivedRequest.objects.get(original_id=self.request_obj.id))
+        self.assertEqual(RequestEvent.objects.filter(request_id=self.request_obj.id).count(), 1)
+        self.assertEqual(RequestSnapshot.objects.filter(request_id=self.request_obj.id).count(), 1)
+        self.assertEqual(state_as_of(self.request_obj.id, timezone.now())['stage'], Request.STAGE_ARCHIVED)
+
+    def test_seeded_requests_have_a_baseline(self):
+        seeded = Request.objects.exclude(id=self.request_obj.id).select_related('department').first()
+        state = seeded.as_of(timezone.now())
+        self.assertEqual((state.title, state.stage, state.department_id), (seeded.title, seeded.stage, seeded.department_id))
+        self.assertIsNone(seeded.as_of(seeded.created_at - timedelta(seconds=1)))
+
+    def test_baseline_migration_covers_cold_payloads(self):
+        Request.objects.filter(id=self.request_obj.id).update(
+            stage=Request.STAGE_ARCHIVED, updated_at=timezone.now() - timedelta(days=365),
+        )
+        move_archived_requests(older_than_days=180)
+        # As moved before requests had snapshots
+        archived = ArchivedRequest.objects.get(original_id=self.request_obj.id)
+        archived.payload = [entry for entry in archived.payload if entry['model'] != 'app.requestsnapshot']
+        archived.save(update_fields=['payload'])
+
+        import_module('app.migrations.0026_baseline_snapshots').add_baseline_snapshots(django_apps, None)
+        restore_archived_request(ArchivedRequest.objects.get(original_id=self.request_obj.id))
+        restored = Request.objects.get(id=self.request_obj.id)
+        self.assertEqual(restored.as_of(timezone.now()).stage, Request.STAGE_ARCHIVED)
+        self.assertEqual(restored.as_of(timezone.now()).description, 'Draft rubric.')
+
+    def test_diff_view(self):
+        start = timezone.now()
+        self.describe('Final rubric.', start + timedelta(hours=1))
+        self.client.force_login(self.lead)
+        url = reverse('request_history_diff', args=[self.request_obj.id])
+        params = {'from': start.isoformat(), 'to': (start + timedelta(hours=2)).isoformat()}
+
+        response = self.assertWithinQueryBudget('request_history_diff', lambda: self.client.get(
+            url, params, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ))
+        self.assertEqual(response.json()['changes'], [
+            {'field_name': 'Description', 'old_value': 'Draft rubric.', 'new_value': 'Final rubric.'},
+        ])
+        self.assertContains(self.client.get(url, params), 'Final rubric.')
+        self.assertEqual(self.client.get(url, {'from': 'yesterday'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 400)
+        too_early = {'from': (self.request_obj.created_at - timedelta(days=1)).isoformat()}
+        self.assertEqual(self.client.get(url, too_early, HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
@@ -0,0 +1,72 @@
+"""
+Cache-backed login throttle.
+
+Failed logins are counted per username and per client IP over
+LOGIN_THROTTLE_WINDOW seconds. Once either count reaches its limit, further
+attempts are rejected before the password is hashed, so a password-guessing
+storm costs one cache read per attempt instead of a full hash.
+
+Counts live in the LOGIN_THROTTLE_CACHE alias. It must be shared by every
+worker: with a per-process cache each worker allows its own LIMIT failures, so
+production refuses to start on one (see check_throttle_cache).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+THROTTLE_PREFIX = 'login_failures'
+
+
+def _cache():
+    return caches[settings.LOGIN_THROTTLE_CACHE]
+
+
+def check_throttle_cache():
+    """Raise ImproperlyConfigured if a shared throttle cache is required but the alias is per-process."""
+    if settings.LOGIN_THROTTLE_REQUIRE_SHARED_CACHE and isinstance(_cache(), LocMemCache):
+        raise ImproperlyConfigured(
+            f"The {settings.LOGIN_THROTTLE_CACHE!r} cache is per-process (LocMemCache); "
+            "the login throttle needs a cache shared by all workers"
+        )
+
+
+def _keys(username, ip):
+    # Hashed so any username is a safe cache key; case-folded so 'Admin' and 'admin' share a count
+    user_digest = hashlib.sha256(username.strip().casefold().encode()).hexdigest()
+    return f'{THROTTLE_PREFIX}:user:{user_digest}', f'{THROTTLE_PREFIX}:ip:{ip}'
+
+
+def client_ip(request):
+    """The address failures are counted against. Behind a proxy, set REMOTE_ADDR from the proxy header upstream."""
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def login_throttled(username, ip):
+    """Whether this username or IP has too many recent failed logins. One cache round-trip."""
+    user_key, ip_key = _keys(username, ip)
+    counts = _cache().get_many([user_key, ip_key])
+    return (
+        counts.get(user_key, 0) >= settings.LOGIN_THROTTLE_USERNAME_LIMIT
+        or counts.get(ip_key, 0) >= settings.LOGIN_THROTTLE_IP_LIMIT
+    )
+
+
+def record_login_failure(username, ip):
+    """Count a failed login against the username and the IP."""
+    cache = _cache()
+    for key in _keys(username, ip):
+        # add() starts the window; incr() never extends it
+        cache.add(key, 0, settings.LOGIN_THROTTLE_WINDOW)
+        try:
+            cache.incr(key)
+        except ValueError:  # expired between add() and incr()
+            cache.set(key, 1, settings.LOGIN_THROTTLE_WINDOW)
+
+
+def clear_login_failures(username):
+    """Forget a username's failures after it logs in; the IP count is kept."""
+    user_key, _ip_key = _keys(username, '')
+    _cache().delete(user_key)
@@ -0,0 +1,91 @@
+"""Set-based stage transitions for one or many requests."""
+from django.db import transaction
+from django.db.models import Case, F, Q, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .events import record_events
+from .models import HistoryValue, Request, RequestChangeHistory
+from .notifications import record_stage_changes
+
+STAGE_VALUES = {value for value, _label in Request.STAGE_CHOICES}
+
+# Stage names accepted in place of codes: the display labels, and the strings stages
+# were stored as before they became codes ('Approved', 'Rejected')
+STAGE_NAMES = {
+    **{label: value for value, label in Request.STAGE_CHOICES},
+    'Approved': Request.STAGE_APPROVED,
+    'Rejected': Request.STAGE_REJECTED,
+}
+
+
+def parse_stage(value):
+    """A stage code from a code or a stage name, or None if it is neither."""
+    if isinstance(value, str):
+        return STAGE_NAMES.get(value)
+    return value if value in STAGE_VALUES and not isinstance(value, bool) else None
+
+
+def transition_note(stage, user, reason):
+    """The line appended to triage_notes when requests change stage with a reason."""
+    name = user.get_full_name() or user.username
+    if stage == Request.STAGE_ARCHIVED:
+        return f"[Archived by {name}]: {reason}"
+    return f"[Moved to {Request.choice_label('stage', stage)} by {name}]: {reason}"
+
+
+@transaction.atomic
+def bulk_transition(request_ids, stage, user, reason=None):
+    """
+    Move the given requests to `stage` with one UPDATE and one history INSERT,
+    regardless of how many requests are selected.
+
+    When `reason` is given it is appended to each request's triage_notes in SQL.
+    Requesters are sent a notification digest later (app.notifications).
+    Requests already in `stage` are left alone. Returns the number of requests moved.
+    """
+    if stage not in STAGE_VALUES:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    # Lock the rows so the history pre-image matches what the UPDATE overwrites
+    rows = list(
+        Request.objects.select_for_update()
+        .filter(id__in=request_ids)
+        .exclude(stage=stage)
+        .values_list('id', 'stage', 'created_by_id')
+    )
+    if not rows:
+        return 0
+    old_stages = {request_id: old_stage for request_id, old_stage, _requester_id in rows}
+
+    updates = {
+        'stage': stage,
+        'updated_at': timezone.now(),
+        'version': F('version') + 1,
+        'change_count': F('change_count') + 1,  # the history row inserted below
+    }
+    if reason:
+        note = transition_note(stage, user, reason)
+        updates['triage_notes'] = Case(
+            When(Q(triage_notes__isnull=True) | Q(triage_notes=''), then=Value(note)),
+            default=Concat(F('triage_notes'), Value(f"\n\n{note}")),
+            output_field=TextField(),
+        )
+    Request.objects.filter(id__in=old_stages).update(**updates)
+    # Read back after the UPDATE, so the event holds the notes as appended in SQL
+    record_events(list(old_stages), ['stage', 'triage_notes'] if reason else ['stage'], user)
+
+    # History keeps the display labels, as edit_request does
+    labels = dict(Request.STAGE_CHOICES)
+    values = HistoryValue.intern_many([labels[code] for code in {*old_stages.values(), stage}])
+    RequestChangeHistory.objects.bulk_create([
+        RequestChangeHistory.build(
+            Request(id=request_id), 'stage', labels[old_stage], labels[stage], user, values=values,
+        )
+        for request_id, old_stage in old_stages.items()
+    ], batch_size=500)
+
+    record_stage_changes(
+        [(request_id, requester_id, old_stage, stage) for request_id, old_stage, requester_id in rows], user,
+    )
+    return len(old_stages)
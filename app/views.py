@@ -1,14 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import F
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import Truncator
+import hmac
 import json
-from .models import Request, RequestAttachment, TriageNotesHistory, RequestChangeHistory
+import time
+from datetime import datetime
+from . import metrics
+from .archival import load_archived_request
+from .backends import get_group_names
+from .counters import adjust_counters, reserve_attachment_slot
+from .departments import save_new_department, search_departments
+from .duplicates import MAX_CHARS, find_duplicates, index_request
+from .events import diff_states, record_events, state_as_of
+from .extraction import search_requests
+from .jobs import enqueue
+from .notifications import record_stage_changes
+from .previews import delete_preview, preview_key, preview_path, queue_preview, touch
+from .models import Request, RequestAttachment, TriageNotesHistory, RequestChangeHistory, HistoryValue
 from .forms import RequestEditForm, TriageRequestEditForm
+from .throttling import clear_login_failures, client_ip, login_throttled, record_login_failure
+from .transitions import bulk_transition, parse_stage
 
 def index(request):
     """Home page view."""
@@ -24,7 +46,7 @@ def index(request):
             can_view_triage = True
             can_view_governance = True
         else:
-            user_groups = request.user.groups.values_list('name', flat=True)
+            user_groups = get_group_names(request.user)
             can_view_triage = 'Triage Group' in user_groups or 'Triage Group Lead' in user_groups
             
             # End users are authenticated users who are NOT superusers and NOT in triage groups
@@ -37,27 +59,27 @@ def index(request):
         if can_view_triage:
             # Get requests for Triage Requests section
             triage_requests = Request.objects.filter(
-                stage__in=['Pending Review', 'Under Review - Triage']
-            )
+                stage__in=Request.TRIAGE_STAGES
+            ).select_related('created_by')
     
     # Get requests for Under Review - Governance section
     governance_requests = []
     if can_view_governance:
         governance_requests = Request.objects.filter(
-            stage='Under Review - Governance'
-        )
+            stage=Request.STAGE_UNDER_REVIEW_GOVERNANCE
+        ).select_related('created_by')
     
     # Get requests for Under Review - Final Governance section (all authenticated users can see this)
     final_governance_requests = []
     if request.user.is_authenticated:
         final_governance_requests = Request.objects.filter(
-            stage='Under Review - Final Governance'
-        )
+            stage=Request.STAGE_UNDER_REVIEW_FINAL_GOVERNANCE
+        ).select_related('created_by')
     
     # Get user's own requests for MyRequests section
     my_requests = []
     if request.user.is_authenticated:
-        my_requests = Request.objects.filter(created_by=request.user)
+        my_requests = Request.objects.filter(created_by=request.user).select_related('created_by')
     
     context = {
         'can_view_triage': can_view_triage,
@@ -76,19 +98,24 @@ def login_view(request):
         return redirect('index')
     
     if request.method == 'POST':
+        username = request.POST.get('username', '')
+        ip = client_ip(request)
+        # Rejected before the form runs, so throttled attempts never hash a password
+        if login_throttled(username, ip):
+            messages.error(request, 'Too many failed login attempts. Please try again later.')
+            return render(request, 'app/login.html', {'form': AuthenticationForm(request)}, status=429)
+        
+        # is_valid() authenticates (the only password hash); get_user() returns that user
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, f'Welcome back, {username}!')
-                next_url = request.GET.get('next', 'index')
-                return redirect(next_url)
-            else:
-                messages.error(request, 'Invalid username or password.')
+            user = form.get_user()
+            clear_login_failures(username)
+            login(request, user)
+            messages.success(request, f'Welcome back, {user.get_username()}!')
+            next_url = request.GET.get('next', 'index')
+            return redirect(next_url)
         else:
+            record_login_failure(username, ip)
             messages.error(request, 'Invalid username or password.')
     else:
         form = AuthenticationForm()
@@ -111,10 +138,25 @@ def requests(request):
 
 def view_request(request, request_id):
     """View request details (read-only) for non-triage requests."""
-    request_obj = get_object_or_404(Request, id=request_id)
+    try:
+        request_obj = Request.objects.select_related('department').get(id=request_id)
+    except Request.DoesNotExist:
+        # Read through to cold storage for archived requests that have been moved out
+        cold = load_archived_request(request_id)
+        if cold is None:
+            raise Http404('No Request matches the given query.')
+        context = {
+            'request_obj': cold['request'],
+            'attachments': cold['attachments'],
+            'triage_notes_history': cold['triage_notes_history'],
+            'change_history': cold['change_history'],
+        }
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return render(request, 'app/partials/request_view.html', context)
+        return render(request, 'app/request_view.html', context)
     
     # Check if this is a governance request
-    is_governance = request_obj.stage == 'Under Review - Governance'
+    is_governance = request_obj.stage == Request.STAGE_UNDER_REVIEW_GOVERNANCE
     
     # Get attachments, triage notes history, and change history for governance requests
     attachments = []
@@ -123,8 +165,8 @@ def view_request(request, request_id):
     
     if is_governance:
         attachments = request_obj.attachments.all()
-        triage_notes_history = request_obj.triage_notes_history.all()
-        change_history = request_obj.change_history.all()
+        triage_notes_history = request_obj.triage_notes_history.select_related('submitted_by')
+        change_history = request_obj.change_history.select_related('changed_by', 'old_ref', 'new_ref')
     
     context = {
         'request_obj': request_obj,
@@ -144,103 +186,206 @@ def view_request(request, request_id):
         # Return full page (fallback)
         return render(request, 'app/request_view.html', context)
 
+def _display_name(user):
+    return user.get_full_name() or user.username
+
+def _serialize_change(change):
+    """Compact JSON form of a RequestChangeHistory row for delta responses."""
+    return {
+        'id': change.id,
+        'field_name': change.field_name,
+        # History keeps complete values; the modal shows the first 200 characters, as the templates do
+        'old_value': Truncator(change.old_value or '').chars(200),
+        'new_value': Truncator(change.new_value or '').chars(200),
+        'changed_by': _display_name(change.changed_by),
+        'changed_at': change.changed_at.isoformat(),
+    }
+
+def _serialize_triage_note(note):
+    """Compact JSON form of a TriageNotesHistory row for delta responses."""
+    return {
+        'id': note.id,
+        'notes': note.notes,
+        'submitted_by': _display_name(note.submitted_by),
+        'submitted_at': note.submitted_at.isoformat(),
+    }
+
+def _form_value(form, field, value):
+    """JSON-safe value of a model attribute as the form field would display it."""
+    return '' if value is None else form.fields[field].prepare_value(value)
+
+def _display_value(form, field, value):
+    """A model attribute as users read it: choice labels instead of codes."""
+    if value is None:
+        return ''
+    if Request._meta.get_field(field).choices:
+        return str(Request.choice_label(field, value))
+    return form.fields[field].prepare_value(value)
+
+def _edit_conflict_response(request_pk, form):
+    """409 describing what other users changed under an edit form that was opened at an older version."""
+    current = Request.objects.get(pk=request_pk)
+    theirs_changed = form.changed_since_opened(current)
+    changes = {}
+    for field, yours in form.cleaned_data.items():
+        if field == 'version':
+            continue
+        theirs = getattr(current, field)
+        if theirs_changed is None:
+            # Forms rendered without their opened values can only be compared with what was submitted
+            conflicting = theirs != yours
+        else:
+            conflicting = field in theirs_changed
+        if conflicting:
+            changes[field] = {
+                'label': str(form.fields[field].label or field),
+                'current': _display_value(form, field, theirs),
+                'yours': _display_value(form, field, yours),
+            }
+    return JsonResponse({
+        'success': False,
+        'conflict': True,
+        'error': 'Someone else saved this request while you were editing it. Review their changes and save again.',
+        'version': current.version,
+        'updated_at': current.updated_at.isoformat(),
+        'changes': changes,
+        # The values the next save is checked against, for the form's hidden initial inputs
+        'initial': {
+            field: _form_value(form, field, getattr(current, field)) for field in form.fields if field != 'version'
+        },
+    }, status=409)
+
 def edit_request(request, request_id):
     """Edit request view for modal."""
-    request_obj = get_object_or_404(Request, id=request_id)
+    request_obj = get_object_or_404(Request.objects.select_related('department'), id=request_id)
     
     # Check if this is a triage request (Pending Review or Under Review - Triage)
-    is_triage = request_obj.stage in ['Pending Review', 'Under Review - Triage']
+    is_triage = request_obj.stage in Request.TRIAGE_STAGES
     FormClass = TriageRequestEditForm if is_triage else RequestEditForm
     
     if request.method == 'POST':
-        # IMPORTANT: Refresh from database to get current state, then store old values
-        # This ensures we capture the actual database state before any form processing
-        request_obj.refresh_from_db()
-        
         tracked_fields = []
         old_values = {}
         if is_triage:
             tracked_fields = ['title', 'description', 'department', 'stage', 'request_type', 'priority']
-            # Store old values from database BEFORE form processing
+            # Store old values BEFORE form processing; the form writes the submitted values onto request_obj
             for field in tracked_fields:
                 if hasattr(request_obj, field):
-                    old_value = getattr(request_obj, field)
+                    old_value = Request.choice_label(field, getattr(request_obj, field))
                     old_values[field] = str(old_value).strip() if old_value is not None else ''
+        old_notes = str(request_obj.triage_notes or '').strip()
+        old_stage = request_obj.stage
         
         form = FormClass(request.POST, instance=request_obj)
         if form.is_valid():
+            # Rows created by this save, returned to the client in delta mode
+            new_triage_notes = []
+            new_changes = []
             
-            # Save triage notes history if triage_notes is provided
-            if is_triage:
-                # Get new notes from form
-                new_notes = form.cleaned_data.get('triage_notes', '')
-                if new_notes is None:
-                    new_notes = ''
-                new_notes = str(new_notes).strip()
+            with transaction.atomic():
+                expected_version = form.cleaned_data['version']
+                if expected_version != request_obj.version:
+                    return _edit_conflict_response(request_obj.id, form)
                 
-                # Get old notes from database (before saving)
-                old_notes = request_obj.triage_notes or ''
-                if old_notes:
-                    old_notes = str(old_notes).strip()
+                # Save triage notes history if triage_notes is provided
+                add_triage_note = False
+                if is_triage:
+                    new_notes = str(form.cleaned_data.get('triage_notes') or '').strip()
+                    
+                    # Create history entry if new notes are not empty
+                    # Only create if different from old to avoid duplicates on unchanged saves
+                    if new_notes and new_notes != old_notes:
+                        add_triage_note = True
+                    elif new_notes and new_notes == old_notes:
+                        # Notes are the same - check if there's already a history entry with this exact content
+                        # If not, create one (in case the notes were set directly without history)
+                        add_triage_note = not TriageNotesHistory.objects.filter(
+                            request=request_obj,
+                            notes=new_notes
+                        ).exists()
+                
+                # Track field changes; old_values is exactly the version the save is checked against
+                pending_changes = []
+                if is_triage and tracked_fields:
+                    for field in tracked_fields:
+                        if field in form.cleaned_data:
+                            new_value = Request.choice_label(field, form.cleaned_data.get(field, ''))
+                            new_value = str(new_value).strip() if new_value is not None else ''
+                            old_value = old_values.get(field, '').strip()
+                            
+                            # Only create history if value changed
+                            if new_value != old_value:
+                                old_display = old_value or '(empty)'
+                                new_display = new_value or '(empty)'
+                                pending_changes.append((field, old_display, new_display))
+                
+                # A department typed for the first time is only created once the save is certain
+                new_department = request_obj.department if (
+                    'department' in form.edited_fields() and request_obj.department is not None
+                    and request_obj.department.pk is None
+                ) else None
+                
+                # Compare-and-swap: only the edited columns (plus the counters) are written,
+                # and only if nobody saved in between
+                counters = {'change_count': len(pending_changes), 'triage_note_count': int(add_triage_note)}
+                if form.edited_fields():
+                    cas_fields = [field for field in form.edited_fields() if not (new_department and field == 'department')]
+                    if not request_obj.save_if_unchanged(expected_version, cas_fields, **{
+                        field: F(field) + delta for field, delta in counters.items() if delta
+                    }):
+                        return _edit_conflict_response(request_obj.id, form)
+                    if new_department:
+                        # The UPDATE above holds the row lock, so this cannot race another save
+                        request_obj.department = save_new_department(new_department)
+                        Request.objects.filter(pk=request_obj.pk).update(department=request_obj.department)
                 else:
-                    old_notes = ''
+                    adjust_counters(request_obj.id, **counters)
                 
-                # Create history entry if new notes are not empty
-                # Only create if different from old to avoid duplicates on unchanged saves
-                if new_notes and new_notes != old_notes:
-                    TriageNotesHistory.objects.create(
+                # save_if_unchanged() is an UPDATE, so post_save does not refresh the duplicate index
+                if {'title', 'description'} & set(form.edited_fields()):
+                    index_request(request_obj)
+                record_events([request_obj.id], form.edited_fields(), request.user)
+                
+                if add_triage_note:
+                    new_triage_notes.append(TriageNotesHistory.objects.create(
                         request=request_obj,
                         notes=new_notes,
                         submitted_by=request.user
+                    ))
+                
+                if pending_changes:
+                    # Intern all values and insert every history row in one round-trip each
+                    values = HistoryValue.intern_many([v for _, old, new in pending_changes for v in (old, new)])
+                    new_changes = RequestChangeHistory.objects.bulk_create([
+                        RequestChangeHistory.build(request_obj, field, old, new, request.user, values=values)
+                        for field, old, new in pending_changes
+                    ])
+                
+                if request_obj.stage != old_stage:
+                    record_stage_changes(
+                        [(request_obj.id, request_obj.created_by_id, old_stage, request_obj.stage)], request.user,
                     )
-                elif new_notes and new_notes == old_notes:
-                    # Notes are the same - check if there's already a history entry with this exact content
-                    # If not, create one (in case the notes were set directly without history)
-                    existing_history = TriageNotesHistory.objects.filter(
-                        request=request_obj,
-                        notes=new_notes
-                    ).first()
-                    if not existing_history:
-                        TriageNotesHistory.objects.create(
-                            request=request_obj,
-                            notes=new_notes,
-                            submitted_by=request.user
-                        )
             
-            # Save the form
-            form.save()
-            
-            # Track field changes after saving
-            if is_triage and tracked_fields:
-                # Get new values from form.cleaned_data (before refresh_from_db overwrites them)
-                # This ensures we're comparing POST data with old database values
-                for field in tracked_fields:
-                    if field in form.cleaned_data:
-                        new_value = form.cleaned_data.get(field, '')
-                        new_value = str(new_value).strip() if new_value is not None else ''
-                        old_value = old_values.get(field, '').strip()
-                        
-                        # Only create history if value changed
-                        if new_value != old_value:
-                            # Get human-readable field name
-                            field_display = field.replace('_', ' ').title()
-                            if hasattr(form.fields[field], 'label') and form.fields[field].label:
-                                field_display = form.fields[field].label
-                            
-                            # Truncate long values for display (keep full value in DB)
-                            old_display = old_value[:200] if old_value else '(empty)'
-                            new_display = new_value[:200] if new_value else '(empty)'
-                            
-                            RequestChangeHistory.objects.create(
-                                request=request_obj,
-                                field_name=field_display,
-                                old_value=old_display,
-                                new_value=new_display,
-                                changed_by=request.user
-                            )
-                
-                # Refresh to get updated data (after creating history)
-                request_obj.refresh_from_db()
+            # Delta mode: return only what changed so the client can patch the modal in place.
+            # Falls through to a full render when the stage change swaps the form type.
+            still_triage = request_obj.stage in Request.TRIAGE_STAGES
+            if request.headers.get('X-Response-Mode') == 'delta' and still_triage == is_triage:
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Request updated successfully.',
+                    'notices': form.notices,
+                    'delta': {
+                        'fields': {
+                            **{
+                                field: _form_value(form, field, getattr(request_obj, field))
+                                for field in form.edited_fields()
+                            },
+                            'version': request_obj.version,
+                        },
+                        'change_history': [_serialize_change(change) for change in new_changes],
+                        'triage_notes_history': [_serialize_triage_note(note) for note in new_triage_notes],
+                    },
+                })
             
             # Refresh the request object to get updated data
             request_obj.refresh_from_db()
@@ -254,8 +399,8 @@ def edit_request(request, request_id):
                 # Get fresh history after save - force a new query
                 if is_triage:
                     # Force a fresh query by getting the request ID and querying directly
-                    triage_notes_history = TriageNotesHistory.objects.filter(request=request_obj).order_by('-submitted_at')
-                    change_history = RequestChangeHistory.objects.filter(request=request_obj).order_by('-changed_at')
+                    triage_notes_history = TriageNotesHistory.objects.filter(request=request_obj).select_related('submitted_by').order_by('-submitted_at')
+                    change_history = RequestChangeHistory.objects.filter(request=request_obj).select_related('changed_by', 'old_ref', 'new_ref').order_by('-changed_at')
                 else:
                     triage_notes_history = []
                     change_history = []
@@ -267,7 +412,12 @@ def edit_request(request, request_id):
                     'triage_notes_history': triage_notes_history,
                     'change_history': change_history
                 }, request=request)
-                return JsonResponse({'success': True, 'message': 'Request updated successfully.', 'form_html': form_html})
+                return JsonResponse({
+                    'success': True, 'message': 'Request updated successfully.', 'notices': form.notices,
+                    'form_html': form_html,
+                })
+            for notice in form.notices:
+                messages.info(request, notice)
             messages.success(request, 'Request updated successfully.')
             return redirect('index')
         else:
@@ -281,8 +431,8 @@ def edit_request(request, request_id):
         from django.template.loader import render_to_string
         template_name = 'app/partials/triage_request_form.html' if is_triage else 'app/partials/request_form.html'
         attachments = request_obj.attachments.all()
-        triage_notes_history = request_obj.triage_notes_history.all() if is_triage else []
-        change_history = request_obj.change_history.all() if is_triage else []
+        triage_notes_history = request_obj.triage_notes_history.select_related('submitted_by') if is_triage else []
+        change_history = request_obj.change_history.select_related('changed_by', 'old_ref', 'new_ref') if is_triage else []
         form_html = render_to_string(template_name, {
             'form': form, 
             'request_obj': request_obj, 
@@ -293,8 +443,8 @@ def edit_request(request, request_id):
         return JsonResponse({'form_html': form_html})
     
     attachments = request_obj.attachments.all()
-    triage_notes_history = request_obj.triage_notes_history.all() if is_triage else []
-    change_history = request_obj.change_history.all() if is_triage else []
+    triage_notes_history = request_obj.triage_notes_history.select_related('submitted_by') if is_triage else []
+    change_history = request_obj.change_history.select_related('changed_by', 'old_ref', 'new_ref') if is_triage else []
     return render(request, 'app/edit_request.html', {
         'form': form, 
         'request_obj': request_obj, 
@@ -303,6 +453,129 @@ def edit_request(request, request_id):
         'change_history': change_history
     })
 
+@login_required
+@require_http_methods(["GET"])
+def department_autocomplete(request):
+    """Department suggestions for the edit forms, served from the in-memory department list."""
+    results = search_departments(request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': department_id, 'name': name} for department_id, name in results]})
+
+def _parse_moment(value):
+    """A ?from= / ?to= value as an aware datetime; a bare date means the end of that day."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        moment = datetime.combine(day, datetime.max.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+@login_required
+@require_http_methods(["GET"])
+def request_history_diff(request, request_id):
+    """What changed on a request between ?from= and ?to= (default now), rebuilt from its event history."""
+    request_obj = get_object_or_404(Request.objects.only('id', 'request_id', 'title'), id=request_id)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    context = {'request_obj': request_obj, 'changes': [], 'error': None, 'moment_from': None, 'moment_to': None}
+    try:
+        if request.GET.get('from'):
+            context['moment_from'] = _parse_moment(request.GET['from'])
+        context['moment_to'] = _parse_moment(request.GET['to']) if request.GET.get('to') else timezone.now()
+    except (ValueError, OverflowError) as e:
+        if is_ajax:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        context['error'] = str(e)
+    
+    if context['moment_from'] is not None and context['error'] is None:
+        before = state_as_of(request_obj.id, context['moment_from'])
+        after = state_as_of(request_obj.id, context['moment_to'])
+        if before is None or after is None:
+            context['error'] = 'No history is recorded for this request that far back.'
+        else:
+            context['changes'] = diff_states(before, after)
+    
+    if is_ajax:
+        if context['error']:
+            return JsonResponse({'success': False, 'error': context['error']}, status=404)
+        return JsonResponse({'success': True, 'changes': [
+            {'field_name': field_name, 'old_value': old_value, 'new_value': new_value}
+            for field_name, old_value, new_value in context['changes']
+        ]})
+    return render(request, 'app/request_diff.html', context)
+
+@login_required
+@require_http_methods(["GET"])
+def duplicate_candidates(request):
+    """Likely duplicates of ?title= and ?description=, looked up while a request is being written."""
+    if not request.user.is_superuser:
+        user_groups = get_group_names(request.user)
+        if 'Triage Group' not in user_groups and 'Triage Group Lead' not in user_groups:
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    exclude = request.GET.get('exclude', '')
+    matches = find_duplicates(
+        request.GET.get('title', '')[:MAX_CHARS],
+        request.GET.get('description', '')[:MAX_CHARS],
+        exclude_id=int(exclude) if exclude.isdigit() else None,
+    )
+    return JsonResponse({'results': [
+        {
+            'id': request_obj.id,
+            'request_id': request_obj.request_id,
+            'title': request_obj.title,
+            'stage': request_obj.get_stage_display(),
+            'is_triage': request_obj.stage in Request.TRIAGE_STAGES,
+            'similarity': round(similarity, 2),
+        }
+        for request_obj, similarity in matches
+    ]})
+
+@login_required
+@require_http_methods(["GET"])
+def attachment_search(request):
+    """Requests whose attachment text matches ?q=, for reviewers."""
+    if not request.user.is_superuser:
+        user_groups = get_group_names(request.user)
+        if 'Triage Group' not in user_groups and 'Triage Group Lead' not in user_groups:
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    matches = search_requests(request.GET.get('q', ''))[:20]
+    return JsonResponse({'results': [
+        {
+            'id': request_obj.id,
+            'request_id': request_obj.request_id,
+            'title': request_obj.title,
+            'stage': request_obj.get_stage_display(),
+            'is_triage': request_obj.stage in Request.TRIAGE_STAGES,
+        }
+        for request_obj in matches.only('id', 'request_id', 'title', 'stage')
+    ]})
+
+@login_required
+@require_http_methods(["GET"])
+def attachment_preview(request, attachment_id, stamp):
+    """Serve a cached attachment thumbnail straight from disk, without touching the database."""
+    path = preview_path(f'{attachment_id}-{stamp}')
+    try:
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    except FileNotFoundError:
+        raise Http404('No preview')
+    touch(path, time.time())
+    response['Cache-Control'] = f'private, max-age={settings.ATTACHMENT_PREVIEW_MAX_AGE}, immutable'
+    return response
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Prometheus metrics for scrapers holding METRICS_TOKEN, or for staff users."""
+    token = settings.METRICS_TOKEN
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    authorized = bool(token and supplied and hmac.compare_digest(supplied.encode(), token.encode()))
+    if not authorized and not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @login_required
 @require_http_methods(["POST"])
 def upload_attachment(request, request_id):
@@ -313,6 +586,8 @@ def upload_attachment(request, request_id):
         return JsonResponse({'success': False, 'error': 'No file provided'}, status=400)
     
     uploaded_file = request.FILES['file']
+    # Every received file counts, including rejected ones; MetricsMiddleware times the whole upload
+    metrics.UPLOAD_BYTES.observe(uploaded_file.size)
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
     MAX_FILES = 5
     
@@ -320,17 +595,20 @@ def upload_attachment(request, request_id):
     if uploaded_file.size > MAX_FILE_SIZE:
         return JsonResponse({'success': False, 'error': f'File size exceeds 10MB limit. File size: {uploaded_file.size / (1024*1024):.2f}MB'}, status=400)
     
-    # Check total attachment count
-    current_count = request_obj.attachments.count()
-    if current_count >= MAX_FILES:
-        return JsonResponse({'success': False, 'error': f'Maximum of {MAX_FILES} files allowed per request'}, status=400)
-    
-    attachment = RequestAttachment.objects.create(
-        request=request_obj,
-        file=uploaded_file,
-        original_filename=uploaded_file.name,
-        uploaded_by=request.user
-    )
+    with transaction.atomic():
+        # Check and bump attachment_count in one UPDATE so concurrent uploads cannot exceed the limit
+        if not reserve_attachment_slot(request_obj.id, MAX_FILES):
+            return JsonResponse({'success': False, 'error': f'Maximum of {MAX_FILES} files allowed per request'}, status=400)
+        
+        attachment = RequestAttachment.objects.create(
+            request=request_obj,
+            file=uploaded_file,
+            original_filename=uploaded_file.name,
+            uploaded_by=request.user
+        )
+        # Text is extracted for search by a worker, not while the user waits
+        enqueue('extract_attachment_text', attachment_id=attachment.id)
+        queue_preview(attachment)
     
     return JsonResponse({
         'success': True,
@@ -345,12 +623,12 @@ def upload_attachment(request, request_id):
 @login_required
 @require_http_methods(["POST"])
 def archive_request(request, request_id):
-    """Archive a request by changing its stage to 'Archived'."""
+    """Archive a request by changing its stage to Archived."""
     request_obj = get_object_or_404(Request, id=request_id)
     
     # Check if user has permission (Triage Group, Triage Group Lead, or SuperUser)
     if not request.user.is_superuser:
-        user_groups = request.user.groups.values_list('name', flat=True)
+        user_groups = get_group_names(request.user)
         if 'Triage Group' not in user_groups and 'Triage Group Lead' not in user_groups:
             return JsonResponse({'success': False, 'error': 'You do not have permission to archive requests.'}, status=403)
     
@@ -361,33 +639,41 @@ def archive_request(request, request_id):
         if not reason:
             return JsonResponse({'success': False, 'error': 'Reason is required.'}, status=400)
         
-        # Store old stage for change history
-        old_stage = request_obj.stage
-        
-        # Update stage to Archived
-        request_obj.stage = 'Archived'
-        request_obj.save()
-        
-        # Create change history entry
-        RequestChangeHistory.objects.create(
-            request=request_obj,
-            field_name='stage',
-            old_value=old_stage,
-            new_value='Archived',
-            changed_by=request.user
-        )
-        
-        # Add reason to triage notes if it exists, or create a note
-        if request_obj.triage_notes:
-            request_obj.triage_notes += f"\n\n[Archived by {request.user.get_full_name() or request.user.username}]: {reason}"
-        else:
-            request_obj.triage_notes = f"[Archived by {request.user.get_full_name() or request.user.username}]: {reason}"
-        request_obj.save()
+        # One UPDATE sets the stage and appends the reason to triage notes; one INSERT records history
+        bulk_transition([request_obj.id], Request.STAGE_ARCHIVED, request.user, reason=reason)
         
         return JsonResponse({'success': True, 'message': 'Request archived successfully.'})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+@login_required
+@require_http_methods(["POST"])
+def bulk_transition_requests(request):
+    """Move or archive many requests at once (Triage Group Lead or SuperUser)."""
+    if not request.user.is_superuser and 'Triage Group Lead' not in get_group_names(request.user):
+        return JsonResponse({'success': False, 'error': 'You do not have permission to move requests in bulk.'}, status=403)
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON body.'}, status=400)
+    
+    request_ids = data.get('request_ids') or []
+    # A stage code (7) or name ('Archived'), as clients sent before stages were coded
+    stage = parse_stage(data.get('stage', ''))
+    reason = (data.get('reason') or '').strip()
+    
+    if not isinstance(request_ids, list) or not all(isinstance(i, int) for i in request_ids) or not request_ids:
+        return JsonResponse({'success': False, 'error': 'request_ids must be a non-empty list of ids.'}, status=400)
+    if stage is None:
+        return JsonResponse({'success': False, 'error': f"Unknown stage: {data.get('stage', '')}"}, status=400)
+    if stage == Request.STAGE_ARCHIVED and not reason:
+        return JsonResponse({'success': False, 'error': 'Reason is required.'}, status=400)
+    
+    moved = bulk_transition(request_ids, stage, request.user, reason=reason or None)
+    label = Request.choice_label('stage', stage)
+    return JsonResponse({'success': True, 'moved': moved, 'message': f'{moved} request(s) moved to {label}.'})
+
 @require_http_methods(["POST"])
 def delete_attachment(request, attachment_id):
     """Delete an attachment."""
@@ -397,7 +683,13 @@ def delete_attachment(request, attachment_id):
     if attachment.uploaded_by != request.user and not request.user.is_superuser:
         return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
     
-    attachment.file.delete()  # Delete the actual file
-    attachment.delete()  # Delete the database record
+    key = preview_key(attachment)  # delete() clears the id
+    with transaction.atomic():
+        attachment.delete()  # Delete the database record
+        adjust_counters(attachment.request_id, attachment_count=-1)
+        # The file itself is removed by a worker, only once the row is gone
+        enqueue('delete_stored_file', name=attachment.file.name)
+    # Its preview would otherwise stay in the cache until evicted
+    delete_preview(key)
     
     return JsonResponse({'success': True})
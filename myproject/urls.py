@@ -16,8 +16,15 @@ urlpatterns = [
     path('edit-request/<int:request_id>/', views.edit_request, name='edit_request'),
     path('view-request/<int:request_id>/', views.view_request, name='view_request'),
     path('archive-request/<int:request_id>/', views.archive_request, name='archive_request'),
+    path('bulk-transition/', views.bulk_transition_requests, name='bulk_transition'),
+    path('requests/<int:request_id>/diff/', views.request_history_diff, name='request_history_diff'),
+    path('requests/duplicates/', views.duplicate_candidates, name='duplicate_candidates'),
+    path('departments/autocomplete/', views.department_autocomplete, name='department_autocomplete'),
+    path('attachments/search/', views.attachment_search, name='attachment_search'),
+    path('attachments/previews/<int:attachment_id>-<int:stamp>.jpg', views.attachment_preview, name='attachment_preview'),
     path('upload-attachment/<int:request_id>/', views.upload_attachment, name='upload_attachment'),
     path('delete-attachment/<int:attachment_id>/', views.delete_attachment, name='delete_attachment'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('', views.index, name='index'),
 ]
 
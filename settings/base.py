@@ -19,6 +19,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.ProfilingMiddleware',
+    'app.middleware.MetricsMiddleware',
+    'app.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -32,7 +35,7 @@ ROOT_URLCONF = 'myproject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'app.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -41,6 +44,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.user_groups',
             ],
         },
     },
@@ -83,10 +87,124 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Authentication settings
+# CachedModelBackend serves the per-request user lookup (and group names) from the cache.
+# ModelBackend stays listed so sessions it created remain valid; it never checks a password.
+AUTHENTICATION_BACKENDS = ['app.backends.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend']
+USER_CACHE_TIMEOUT = 300  # seconds
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'index'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Login throttle (app.throttling): after this many failed logins within
+# LOGIN_THROTTLE_WINDOW seconds, a username or client IP is refused without
+# hashing the password until the window ends
+LOGIN_THROTTLE_USERNAME_LIMIT = 5
+LOGIN_THROTTLE_IP_LIMIT = 50
+LOGIN_THROTTLE_WINDOW = 900
+# Failure counts are kept in this cache alias. Production requires it to be
+# shared by all workers and refuses to start on a per-process LocMemCache
+LOGIN_THROTTLE_CACHE = 'throttle'
+LOGIN_THROTTLE_REQUIRE_SHARED_CACHE = False
+
+# Caching
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mygov-default',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mygov-throttle',
+    },
+}
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Archived requests untouched for this many days are moved to cold storage
+# by the move_cold_requests command
+ARCHIVE_COLD_AFTER_DAYS = 180
+
+# Change history storage: values this size or larger are zlib-compressed, and rows
+# older than HISTORY_RETENTION_DAYS are rolled up into summaries by rollup_history
+HISTORY_COMPRESS_MIN_BYTES = 256
+HISTORY_RETENTION_DAYS = 730
+
+# Point-in-time history (app.events): a full snapshot of a request is stored after
+# this many events, which bounds the events replayed to rebuild any past state
+HISTORY_SNAPSHOT_EVERY = 20
+
+# Background jobs (app.jobs, run by the run_jobs command): a failed job is retried
+# after JOBS_BACKOFF_SECONDS, doubling each attempt up to JOBS_BACKOFF_MAX_SECONDS,
+# until it has been tried JOBS_MAX_ATTEMPTS times
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_SECONDS = 10
+JOBS_BACKOFF_MAX_SECONDS = 3600
+# A running job's worker refreshes its heartbeat this often; a job with no heartbeat for
+# JOBS_STALE_AFTER_SECONDS lost its worker and is requeued (or failed, if out of attempts)
+JOBS_HEARTBEAT_SECONDS = 30
+JOBS_STALE_AFTER_SECONDS = 600
+JOBS_KEEP_DONE_DAYS = 7
+
+# Stage-change emails: each requester gets one digest of the changes made within
+# this window of the first one, sent NOTIFICATION_BATCH_SIZE messages per batch
+# over a single SMTP connection by the send_stage_digests job
+NOTIFICATION_DIGEST_WINDOW_SECONDS = 900
+NOTIFICATION_BATCH_SIZE = 50
+DEFAULT_FROM_EMAIL = 'governance@localhost'
+
 # Media files
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Extracted attachment text is cut off at this many characters
+ATTACHMENT_TEXT_MAX_CHARS = 1_000_000
+
+# Attachment previews (thumbnails of images and PDF first pages) are kept in an
+# on-disk cache trimmed to ATTACHMENT_PREVIEW_MAX_BYTES, least recently served first
+ATTACHMENT_PREVIEW_ROOT = os.path.join(BASE_DIR, 'preview_cache')
+ATTACHMENT_PREVIEW_MAX_BYTES = 512 * 1024 * 1024
+ATTACHMENT_PREVIEW_SIZE = 480  # longest side, in pixels
+ATTACHMENT_PREVIEW_MAX_AGE = 365 * 24 * 3600  # preview URLs never change content
+
+# Per-view query budgets, keyed by URL view name ('default' applies to every view).
+# Requests over budget are logged by app.middleware.QueryBudgetMiddleware and
+# the same budgets are asserted against a seeded dataset in app/tests.py.
+QUERY_BUDGETS = {
+    'default': {'queries': 20, 'db_time_ms': 250},
+    'index': {'queries': 12},
+    'view_request': {'queries': 8},
+    'edit_request': {'queries': 30},
+    'archive_request': {'queries': 14},
+    'bulk_transition': {'queries': 22},
+    'department_autocomplete': {'queries': 3},
+    'attachment_search': {'queries': 3},
+    'duplicate_candidates': {'queries': 4},
+    'request_history_diff': {'queries': 8},
+    'attachment_preview': {'queries': 2},
+    'upload_attachment': {'queries': 9},
+    'metrics': {'queries': 4},
+    'admin:app_request_changelist': {'queries': 12},
+}
+
+# Request profiling (app.middleware.ProfilingMiddleware). Requests sending
+# "X-Profile: <PROFILING_TOKEN>" are always profiled; with PROFILING_ENABLED a
+# PROFILING_SAMPLE_RATE fraction of requests (to PROFILING_VIEWS, if set) is too.
+# The newest PROFILING_MAX_PROFILES are kept in PROFILING_DIR and listed in the admin.
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_VIEWS = []
+PROFILING_TOKEN = None
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_PROFILES = 200
+
+# Prometheus metrics at /metrics (app.metrics). Scrapers authenticate with
+# "Authorization: Bearer <METRICS_TOKEN>"; without a token only staff can read it.
+# Set METRICS_DIR to a directory shared by all worker processes to aggregate them.
+METRICS_TOKEN = None
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 5
+
+# Expose X-DB-Query-Count / X-DB-Time-Ms response headers
+QUERY_BUDGET_HEADERS = False
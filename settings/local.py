@@ -13,4 +13,11 @@ DATABASES = {
     }
 }
 
-STATIC_URL = '/static/'
\ No newline at end of file
+STATIC_URL = '/static/'
+
+QUERY_BUDGET_HEADERS = True
+
+# Digests go to a local debugging SMTP server that prints each message:
+#   python -m aiosmtpd -n -l localhost:1025
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
@@ -32,8 +32,91 @@ DATABASES = {
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'OPTIONS': {},
     }
 }
 
+# Connection pooling
+# DB_POOL=1 (the default) uses psycopg's managed pool; it requires psycopg[pool] >= 3.2.
+# DB_POOL=0 falls back to Django's persistent connections (CONN_MAX_AGE).
+DB_POOL = os.environ.get('DB_POOL', '1').lower() in ('1', 'true', 'yes', 'on')
+
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        # Seconds a request may wait for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        # Connections are recycled after this many seconds...
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+        # ...or closed after sitting idle this long (down to min_size)
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+    }
+    # The pool owns connection lifetimes; Django must not keep its own
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    # Django passes ConnectionPool.check_connection to the pool, so each
+    # connection is health checked before it is handed out
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Cached users and sessions are invalidated in the cache, so every worker must
+# share it: with a per-process cache, a deactivated user or a changed password
+# would stay valid in the other workers until their entries expired
+REDIS_URL = os.environ.get('REDIS_URL')
+if not REDIS_URL:
+    raise ValueError("REDIS_URL environment variable must be set in production")
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    },
+    # Login failure counts, kept apart from the default cache's keys
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'throttle',
+    },
+}
+LOGIN_THROTTLE_REQUIRE_SHARED_CACHE = True
+
+# Profiling on demand: send "X-Profile: $PROFILING_TOKEN" with a request, or
+# sample a fraction of requests without redeploying the code
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes', 'on')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_VIEWS = [name for name in os.environ.get('PROFILING_VIEWS', '').split(',') if name]
+
+# Prometheus metrics. METRICS_DIR must be shared by all gunicorn workers and
+# emptied before the service starts (e.g. in the unit's ExecStartPre)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+
+# Outgoing mail (stage-change digests)
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '').lower() in ('1', 'true', 'yes', 'on')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', DEFAULT_FROM_EMAIL)
+
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
-STATIC_URL = '/static/'
\ No newline at end of file
+STATIC_URL = '/static/'
+
+# Static files are fingerprinted, minified and precompressed (gzip, plus brotli
+# when installed) by collectstatic, then served with immutable cache headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'app.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+    'app.middleware.PrecompressedStaticMiddleware',
+)